@@ -0,0 +1,91 @@
+"""Compare listing queries on IndexedCollectionResource against the example
+app's DictResource, for collections of 10^3 to 10^6 children.
+
+Run with:
+
+    python -m benchmarks.bench_collection [max_size]
+"""
+import os
+import random
+import sys
+import timeit
+from papi.collection import IndexedCollectionResource
+from papi.filters import conjuncts, parse_filter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'example'))
+from app import DictResource
+
+sizes = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+colors = ('red', 'green', 'blue', 'yellow', 'black')
+
+queries = (
+    ('page', dict(offset=40, count=20)),
+    ('order', dict(order=((True, 'price'),), offset=40, count=20)),
+    ('where', dict(filters=conjuncts(parse_filter('color:red')), count=20)),
+    ('where+order', dict(
+        filters=conjuncts(parse_filter('color:red')),
+        order=((False, 'price'), (True, '_name')),
+        offset=40,
+        count=20)),
+)
+
+def make_documents(size, seed=0):
+    rng = random.Random(seed)
+    return dict(
+        ('doc{0:07d}'.format(i), {
+            'color': rng.choice(colors),
+            'price': rng.randint(0, size),
+        })
+        for i in range(size))
+
+def bench(f, number):
+    """Return the best per-call time in milliseconds.
+    """
+    timings = timeit.repeat(f, number=number, repeat=3)
+    return min(timings) / number * 1e3
+
+def run(sizes=sizes):
+    results = []
+    for size in sizes:
+        documents = make_documents(size)
+        dict_resource = DictResource(children=dict(
+            (name, DictResource(data)) for name, data in documents.items()))
+        indexed = IndexedCollectionResource(
+            documents, indexes=('color',), sorted_indexes=('price',))
+        number = max(1, 10000 // size)
+        for query_name, kwargs in queries:
+            results.append({
+                'size': size,
+                'query': query_name,
+                'dict_ms': bench(
+                    lambda: dict_resource.get_children(**kwargs), number),
+                'indexed_ms': bench(
+                    lambda: indexed.get_children(**kwargs), number * 10),
+            })
+        results.append({
+            'size': size,
+            'query': 'store',
+            'dict_ms': bench(
+                lambda: dict_resource.children.__setitem__(
+                    'doc0000001', DictResource({'color': 'red', 'price': 1})),
+                1000),
+            'indexed_ms': bench(
+                lambda: indexed.put_document(
+                    'doc0000001', {'color': 'red', 'price': 1}),
+                1000),
+        })
+    return results
+
+def main():
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else max(sizes)
+    columns = ('size', 'query', 'dict_ms', 'indexed_ms')
+    print(" ".join("{0:>12}".format(c) for c in columns))
+    for result in run([s for s in sizes if s <= max_size]):
+        print(" ".join(
+            "{0:>12}".format(result[c])
+            if c in ('size', 'query')
+            else "{0:>12.3f}".format(result[c])
+            for c in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compare the cost of "copying" updates on plain dicts versus persistent maps
+(fp.PMap), for maps of 10 to 10,000 keys.
+
+Run with:
+
+    python -m benchmarks.bench_pmap
+"""
+import timeit
+import papi.fp as fp
+
+sizes = (10, 100, 1000, 10000)
+
+def make_dict(size):
+    return dict(("key{0}".format(i), i) for i in range(size))
+
+def bench(stmt, number):
+    """Return the best per-call time of "stmt", in microseconds.
+    """
+    timings = timeit.repeat(stmt, number=number, repeat=5)
+    return min(timings) / number * 1e6
+
+def run(sizes=sizes, number=1000):
+    results = []
+    for size in sizes:
+        d = make_dict(size)
+        pm = fp.pmap(d)
+        results.append({
+            'size': size,
+            'dict_assoc': bench(lambda: fp.assoc('new', 1, d), number),
+            'pmap_assoc': bench(lambda: fp.assoc('new', 1, pm), number),
+            'dict_dissoc': bench(lambda: fp.dissoc('key0', d), number),
+            'pmap_dissoc': bench(lambda: fp.dissoc('key0', pm), number),
+            'dict_get': bench(lambda: d.get('key0'), number),
+            'pmap_get': bench(lambda: pm.get('key0'), number),
+        })
+    return results
+
+def main():
+    columns = ('size',
+               'dict_assoc', 'pmap_assoc',
+               'dict_dissoc', 'pmap_dissoc',
+               'dict_get', 'pmap_get')
+    print("Per-call times in microseconds")
+    print(" ".join("{0:>12}".format(c) for c in columns))
+    for result in run():
+        print(" ".join(
+            "{0:>12}".format(result['size'])
+            if c == 'size'
+            else "{0:>12.3f}".format(result[c])
+            for c in columns))
+
+if __name__ == '__main__':
+    main()
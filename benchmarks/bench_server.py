@@ -0,0 +1,111 @@
+"""Compare papi.server against wsgiref's simple_server, serving the example
+app, with a number of concurrent clients that each send a series of GET
+requests over one HTTP/1.1 connection (which wsgiref closes after every
+response, forcing a reconnect).
+
+Run with:
+
+    python -m benchmarks.bench_server [requests_per_client]
+"""
+import http.client
+import re
+import subprocess
+import sys
+import threading
+import time
+
+clients = 16
+paths = ('/things', '/things/apple', '/things?order=-_value&count=2')
+
+wsgiref_script = '''
+import io, sys, contextlib
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+sys.path.insert(0, 'example')
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import application
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+server = make_server('127.0.0.1', 0, application, handler_class=QuietHandler)
+sys.stderr.write('Listening on 127.0.0.1:{0}\\n'.format(server.server_port))
+sys.stderr.flush()
+server.serve_forever()
+'''
+
+servers = (
+    ('wsgiref', [sys.executable, '-c', wsgiref_script]),
+    ('papi.server (1 worker)', [
+        sys.executable, '-m', 'papi.server', 'example.app:application',
+        '--bind', '127.0.0.1:0', '--workers', '1', '--threads', '16',
+        '--log-level', 'INFO']),
+    ('papi.server (4 workers)', [
+        sys.executable, '-m', 'papi.server', 'example.app:application',
+        '--bind', '127.0.0.1:0', '--workers', '4', '--threads', '8',
+        '--log-level', 'INFO']),
+)
+
+def start(command):
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    line = process.stderr.readline().decode('utf8')
+    port = int(re.search(r'Listening on [^:]+:(\d+)', line).group(1))
+    # keep draining stderr, so that the server never blocks on it
+    threading.Thread(
+        target=lambda: process.stderr.read(), daemon=True).start()
+    return process, port
+
+def client(port, count, latencies):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    for i in range(count):
+        started = time.perf_counter()
+        connection.request('GET', paths[i % len(paths)],
+            headers={'Accept': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+def run(requests_per_client=200):
+    results = []
+    for name, command in servers:
+        process, port = start(command)
+        try:
+            client(port, 10, [])
+            latencies = []
+            threads = [
+                threading.Thread(
+                    target=client, args=(port, requests_per_client, latencies))
+                for i in range(clients)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait()
+        latencies.sort()
+        results.append({
+            'server': name,
+            'requests': len(latencies),
+            'req_per_s': len(latencies) / elapsed,
+            'p50_ms': latencies[len(latencies) // 2] * 1e3,
+            'p99_ms': latencies[int(len(latencies) * 0.99)] * 1e3,
+        })
+    return results
+
+def main():
+    requests_per_client = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    columns = ('server', 'requests', 'req_per_s', 'p50_ms', 'p99_ms')
+    print(" ".join("{0:>24}".format(c) for c in columns))
+    for result in run(requests_per_client):
+        print(" ".join(
+            "{0:>24}".format(result[c])
+            if c in ('server', 'requests')
+            else "{0:>24.2f}".format(result[c])
+            for c in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Measure the overhead of per-request phase timing (see papi.timing):
+requests served with timing disabled, with a Server-Timing header, and with
+a callback, plus the cost of a single timed() call with timing disabled.
+
+Run with:
+
+    python -m benchmarks.bench_timing
+"""
+import contextlib
+import io
+import os
+import sys
+import timeit
+from papi.serve import serve_resource
+from papi.timing import timed
+
+class ItemResource(object):
+    def __init__(self, i):
+        self.data = {'i': i, 'name': 'item{0}'.format(i)}
+
+    def get_structured_body(self, **kwargs):
+        return self.data
+
+class ListResource(object):
+    def __init__(self, size):
+        self.children = [
+            ('item{0}'.format(i), ItemResource(i)) for i in range(size)]
+        self.by_name = dict(self.children)
+
+    def get_child(self, name):
+        return self.by_name.get(name)
+
+    def get_children(self, offset=None, count=None, *args, **kwargs):
+        offset = offset or 0
+        return self.children[offset:offset + (count or 20)]
+
+def make_environ(path, query=''):
+    return {
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'REQUEST_METHOD': 'GET',
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': None,
+    }
+
+def start_response(status, headers):
+    pass
+
+configurations = (
+    ('disabled', {}),
+    ('server_timing', {'server_timing': True}),
+    ('callback', {'timing_callback': lambda request, timings: None}),
+)
+
+requests = (
+    ('child', '/item3', ''),
+    ('listing', '/', 'count=20'),
+)
+
+def bench(f, number):
+    """Return the best per-call time in microseconds.
+    """
+    return min(timeit.repeat(f, number=number, repeat=5)) / number * 1e6
+
+def run(number=2000):
+    root = ListResource(100)
+    results = []
+    # serve.py prints debugging output; keep it out of the measurements
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for config_name, kwargs in configurations:
+            application = serve_resource(root, **kwargs)
+            for request_name, path, query in requests:
+                environ = make_environ(path, query)
+                results.append({
+                    'config': config_name,
+                    'request': request_name,
+                    'us': bench(
+                        lambda: application(dict(environ), start_response),
+                        number),
+                })
+    request = {'timer': None}
+    f = lambda: None
+    results.append({
+        'config': 'disabled',
+        'request': 'timed() call',
+        'us': bench(lambda: timed(request, 'body', f), number * 100) -
+            bench(f, number * 100),
+    })
+    return results
+
+def main():
+    columns = ('config', 'request', 'us')
+    print(" ".join("{0:>16}".format(c) for c in columns))
+    for result in run():
+        print(" ".join(
+            "{0:>16.3f}".format(result[c]) if c == 'us'
+            else "{0:>16}".format(result[c])
+            for c in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Compare filter/order/drop/take listing pipelines written in the fp.chain()
+style (materializing every stage) against the same pipelines written with
+transducers, for time and peak memory. The "ordered" scenario has to look at
+every item either way; the "unordered" one (filter/drop/take) shows the
+effect of early termination.
+
+Run with:
+
+    python -m benchmarks.bench_transduce
+"""
+import random
+import timeit
+import tracemalloc
+from functools import partial
+import papi.fp as fp
+
+sizes = (1000, 10000, 100000)
+offset = 40
+count = 20
+
+def make_items(size, seed=0):
+    rng = random.Random(seed)
+    return [("item{0}".format(i), rng.randint(0, size)) for i in range(size)]
+
+def keep(item):
+    return item[1] % 3 != 0
+
+def sort_key(item):
+    return item[1]
+
+def chain_ordered(items):
+    return fp.chain(
+        partial(fp.take, count),
+        partial(fp.drop, offset),
+        lambda xs: sorted(xs, key=sort_key),
+        partial(filter, keep))(items)
+
+def transduce_ordered(items):
+    return fp.into(
+        fp.chain(
+            fp.filtering(keep),
+            fp.ordering(sort_key, limit=offset + count),
+            fp.dropping(offset),
+            fp.taking(count)),
+        items)
+
+def chain_unordered(items):
+    return fp.chain(
+        partial(fp.take, count),
+        partial(fp.drop, offset),
+        partial(filter, keep))(items)
+
+def transduce_unordered(items):
+    return fp.into(
+        fp.chain(
+            fp.filtering(keep),
+            fp.dropping(offset),
+            fp.taking(count)),
+        items)
+
+scenarios = (
+    ('ordered', chain_ordered, transduce_ordered),
+    ('unordered', chain_unordered, transduce_unordered),
+)
+
+def peak_memory(f, items):
+    """Return the peak traced memory (in KiB) while running f(items).
+    """
+    tracemalloc.start()
+    try:
+        f(items)
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+def bench(f, items, number=5):
+    """Return the best per-call time in milliseconds.
+    """
+    timings = timeit.repeat(lambda: f(items), number=number, repeat=3)
+    return min(timings) / number * 1e3
+
+def run(sizes=sizes):
+    results = []
+    for name, chain_style, transducer_style in scenarios:
+        for size in sizes:
+            items = make_items(size)
+            assert chain_style(items) == transducer_style(items)
+            results.append({
+                'scenario': name,
+                'size': size,
+                'chain_ms': bench(chain_style, items),
+                'transduce_ms': bench(transducer_style, items),
+                'chain_peak_kib': peak_memory(chain_style, items),
+                'transduce_peak_kib': peak_memory(transducer_style, items),
+            })
+    return results
+
+def main():
+    columns = ('scenario', 'size',
+               'chain_ms', 'transduce_ms',
+               'chain_peak_kib', 'transduce_peak_kib')
+    print(" ".join("{0:>18}".format(c) for c in columns))
+    for result in run():
+        print(" ".join(
+            "{0:>18}".format(result[c])
+            if c in ('scenario', 'size')
+            else "{0:>18.3f}".format(result[c])
+            for c in columns))
+
+if __name__ == '__main__':
+    main()
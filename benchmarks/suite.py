@@ -0,0 +1,316 @@
+"""Benchmark suite for the whole request path, from parsing the Accept header
+to encoding the response, driving serve_resource() in-process (no network).
+
+Covers the building blocks (parse_http_accept, match_mime, hateoas,
+join_url, JSON encoding) and whole requests: routing at increasing depths,
+listings of increasing size, filtered and ordered listings, and range
+requests. The resource trees are synthetic, and generated from a fixed
+seed, so that runs are comparable.
+
+Run the suite, writing the results as JSON:
+
+    python -m benchmarks.suite --output before.json
+
+Optionally, only run benchmarks whose name contains a string:
+
+    python -m benchmarks.suite --only routing --output after.json
+
+Compare two runs; benchmarks that got slower by more than the threshold
+(10% by default) are flagged, and make the command exit with status 1:
+
+    python -m benchmarks.suite --compare before.json after.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+from papi.collection import IndexedCollectionResource
+from papi.hateoas import hateoas
+from papi.mime import parse_http_accept, parse_mime_type, match_mime
+from papi.paths import join_url
+from papi.serve import serve_resource, json_writer
+
+colors = ('red', 'green', 'blue', 'yellow', 'black')
+
+accept_header = (
+    'text/html,application/xhtml+xml,application/xml;q=0.9,'
+    'application/json;q=0.8,text/*;q=0.5,*/*;q=0.1')
+
+# Synthetic resource trees
+
+def make_document(rng, i):
+    return {
+        'i': i,
+        'name': 'item{0}'.format(i),
+        'color': rng.choice(colors),
+        'price': rng.randint(0, 1000),
+        'tags': [rng.choice(colors) for j in range(3)],
+    }
+
+class NodeResource(object):
+    """A document with (optionally) children, looked up by name.
+    """
+    def __init__(self, data, children=None):
+        self.data = data
+        self.children = children
+        self.by_name = None if children is None else dict(children)
+
+    def get_structured_body(self, **kwargs):
+        return self.data
+
+    def get_child(self, name):
+        if self.by_name is None:
+            return None
+        return self.by_name.get(name)
+
+    def get_children(self, offset=None, count=None, *args, **kwargs):
+        if self.children is None:
+            return None
+        offset = offset or 0
+        return self.children[offset:offset + (count or 20)]
+
+def make_deep_tree(depth, width=10, seed=0):
+    """A tree "depth" levels deep, each node having "width" children, of
+    which only the first has children in turn (so that its size stays
+    linear in depth). The path to the deepest node is n0/n0/.../n0.
+    """
+    rng = random.Random(seed)
+    node = NodeResource(make_document(rng, depth))
+    for level in range(depth):
+        children = [('n0', node)] + [
+            ('n{0}'.format(i), NodeResource(make_document(rng, i)))
+            for i in range(1, width)
+        ]
+        node = NodeResource(make_document(rng, level), children)
+    return node
+
+def make_wide_tree(size, seed=0):
+    """A root with a single collection of "size" documents.
+    """
+    rng = random.Random(seed)
+    children = [
+        ('item{0:06d}'.format(i), NodeResource(make_document(rng, i)))
+        for i in range(size)
+    ]
+    return NodeResource({}, [('items', NodeResource({}, children))])
+
+def make_indexed_tree(size, seed=0):
+    rng = random.Random(seed)
+    documents = [
+        ('item{0:06d}'.format(i), make_document(rng, i)) for i in range(size)]
+    collection = IndexedCollectionResource(
+        documents, indexes=('color',), sorted_indexes=('price',))
+    return NodeResource({}, [('items', collection)])
+
+class TextResource(object):
+    """A plain-text document that supports range requests.
+    """
+    text_plain = parse_mime_type('text/plain')
+
+    def __init__(self, size, seed=0):
+        rng = random.Random(seed)
+        self.body = bytes(rng.randrange(32, 127) for i in range(size))
+
+    def get_typed_body(self, mime_pattern):
+        if match_mime(mime_pattern, self.text_plain):
+            return self.text_plain, self.body
+        return None
+
+    def get_typed_body_range(self, mime_pattern, byte_range):
+        start, end = byte_range
+        if not match_mime(mime_pattern, self.text_plain):
+            return None
+        end = min(end, len(self.body))
+        return (self.text_plain, self.body[start:end],
+            (start, end, len(self.body)))
+
+# Requests
+
+def make_environ(method, path, query='', headers=()):
+    """Build a WSGI environ, like tests.test_simulation.mock_request().
+    """
+    environ = {
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'REQUEST_METHOD': method,
+        'CONTENT_TYPE': 'text/plain',
+        'wsgi.input': None,
+    }
+    for name, value in headers:
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+def start_response(status, headers):
+    pass
+
+def request(application, path, query='', accept='application/json',
+        headers=()):
+    """A callable that serves one request, including reading the body. The
+    request is tried once first, to make sure that it succeeds.
+    """
+    environ = make_environ('GET', path, query,
+        [('Accept', accept)] + list(headers))
+    status = []
+    b''.join(application(dict(environ),
+        lambda status_str, headers: status.append(status_str)))
+    if not status[0].startswith('2'):
+        raise ValueError('{0}?{1}: {2}'.format(path, query, status[0]))
+    def serve():
+        b''.join(application(dict(environ), start_response))
+    return serve
+
+# Benchmarks: (name, setup), where setup() returns the callable to time
+
+def building_block_benchmarks():
+    body = make_document(random.Random(0), 1)
+    documents = [make_document(random.Random(0), i) for i in range(100)]
+    accept = parse_http_accept(accept_header)
+    json_type = parse_mime_type('application/json')
+    return [
+        ('parse_http_accept', lambda: lambda: parse_http_accept(accept_header)),
+        ('match_mime', lambda: lambda: [
+            match_mime(pattern, json_type, ['charset']) for pattern in accept]),
+        ('hateoas/document', lambda: lambda: hateoas(
+            ('things', 'apple'), body)),
+        ('hateoas/listing_page', lambda: lambda: hateoas(
+            ('things',), body, page=3, offset=40, count=20)),
+        ('join_url', lambda: lambda: join_url(
+            path=('things', 'apple pie', 'slices'),
+            query={'page': 2, 'count': 20, 'order': '-price'})),
+        ('json/document', lambda: lambda: json_writer(body)),
+        ('json/100_documents', lambda: lambda: json_writer(documents)),
+        ('json/100_documents_pretty',
+            lambda: lambda: json_writer(documents, pretty='1')),
+    ]
+
+def request_benchmarks():
+    benchmarks = []
+    for depth in (1, 4, 16):
+        benchmarks.append((
+            'routing/depth_{0}'.format(depth),
+            lambda depth=depth: request(
+                serve_resource(make_deep_tree(depth)),
+                '/' + '/'.join(['n0'] * depth),
+                'hateoas=off')))
+    for size in (10, 100, 1000):
+        benchmarks.append((
+            'listing/size_{0}'.format(size),
+            lambda size=size: request(
+                serve_resource(make_wide_tree(size)),
+                '/items', 'count={0}'.format(size))))
+    queries = (
+        ('filter', 'where=color:red&count=20'),
+        ('order', 'order=-price&count=20'),
+        ('filter_order', 'where=color:red,price<500&order=-price&count=20'),
+    )
+    for name, query in queries:
+        benchmarks.append((
+            'query/{0}'.format(name),
+            lambda query=query: request(
+                serve_resource(make_indexed_tree(10000)), '/items', query)))
+    benchmarks.append((
+        'request/accept_negotiation',
+        lambda: request(
+            serve_resource(make_wide_tree(10)), '/items/item000001',
+            accept=accept_header)))
+    for name, headers in (
+            ('full', []),
+            ('range', [('Range', 'bytes=1000-2000')])):
+        benchmarks.append((
+            'range/{0}'.format(name),
+            lambda headers=headers: request(
+                serve_resource(TextResource(100000)), '/',
+                accept='text/plain', headers=headers)))
+    return benchmarks
+
+def all_benchmarks():
+    return building_block_benchmarks() + request_benchmarks()
+
+def measure(f, repeat=5, min_time=0.05):
+    """Return (best time per call in microseconds, calls per repetition).
+    """
+    timer = timeit.Timer(f)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e6, number
+
+def run(only=None, repeat=5):
+    results = {}
+    # serve.py prints debugging output; keep it out of the measurements
+    with open(os.devnull, 'w') as devnull:
+        for name, setup in all_benchmarks():
+            if only and only not in name:
+                continue
+            with contextlib.redirect_stdout(devnull):
+                us, number = measure(setup(), repeat)
+            results[name] = {'us': us, 'number': number}
+            sys.stderr.write('{0:40} {1:12.3f} us\n'.format(name, us))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+def compare(old, new, threshold=0.1):
+    """Compare two runs; returns a list of (name, old_us, new_us, change,
+    regressed) tuples, for the benchmarks present in both, where "change"
+    is the relative change in time per call.
+    """
+    rows = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        old_us = old['results'][name]['us']
+        new_us = new['results'][name]['us']
+        change = new_us / old_us - 1
+        rows.append((name, old_us, new_us, change, change > threshold))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the papi request path.')
+    parser.add_argument('--output',
+        help='write the results to this file (default: standard output)')
+    parser.add_argument('--only',
+        help='only run benchmarks whose name contains this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+        help='compare two result files instead of running the benchmarks')
+    parser.add_argument('--threshold', type=float, default=0.1,
+        help='relative slowdown that counts as a regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        runs = []
+        for filename in args.compare:
+            with open(filename) as f:
+                runs.append(json.load(f))
+        rows = compare(runs[0], runs[1], args.threshold)
+        for name, old_us, new_us, change, regressed in rows:
+            print('{0:40} {1:12.3f} {2:12.3f} {3:+8.1%}{4}'.format(
+                name, old_us, new_us, change,
+                '  REGRESSION' if regressed else ''))
+        return 1 if any(row[4] for row in rows) else 0
+
+    results = run(args.only, args.repeat)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,8 @@ from papi.serve import serve_resource
 import papi.fp as fp
 from papi.mime import match_mime, parse_mime_type
 from papi.exceptions import ResourceException
+from papi.filters import compile_filters, get_prop
+from papi.ordering import order_key
 import random
 import string
 from functools import partial
@@ -61,41 +63,30 @@ class DictResource(object):
         else:
             count = int(count)
 
-        def apply_filter(f, target):
-            compare_funcs = {
-                'equals': lambda x, y: x == y,
-            }
-
-            compare_func = compare_funcs.get(f.operator)
-            if compare_func is None:
-                return False
-            comparee = target if type(target) is dict else {"_value": target}
-            return compare_func(f.value, fp.prop(f.propname, comparee))
-            
-        def apply_filters(target):
-            for f in (filters or []):
-                if not apply_filter(f, target[1]):
-                    return False
-            return True
+        def filter_prop(propname, item):
+            name, child = item
+            if propname == "_name":
+                return name
+            return get_prop(propname, child.data)
+
+        def order_prop(propname, item):
+            name, child = item
+            if propname == "_name":
+                return name
+            return child.get_order_prop(propname)
 
-        def apply_orderings(target):
-            print(target)
-            if order is None:
-                return target
-            for desc, key in reversed(order):
-                target = sorted(
-                    target,
-                    key=lambda item: \
-                            item[0] if key == "_name" \
-                            else item[1].get_order_prop(key),
-                    reverse=desc)
-            return target
-
-        return fp.chain(
-            partial(fp.take, count),
-            partial(fp.drop, offset),
-            apply_orderings,
-            partial(filter, apply_filters))(self.children.items())
+        if order is None:
+            orderings = []
+        else:
+            orderings = [fp.ordering(
+                order_key(order, order_prop),
+                limit=(offset or 0) + count)]
+
+        xform = fp.chain(*(
+            [fp.filtering(compile_filters(filters, filter_prop))] +
+            orderings +
+            [fp.dropping(offset), fp.taking(count)]))
+        return fp.into(xform, self.children.items())
 
     def get_child(self, name):
         print("Get child: {0}".format(name))
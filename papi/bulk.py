@@ -0,0 +1,220 @@
+"""Bulk writes: newline-delimited JSON (application/x-ndjson) request bodies
+on collections.
+
+A POST to a collection with an NDJSON body creates one document per line; a
+PUT stores one document per line, named by the line's "_name" property (if
+the remaining document is of the form {"_value": value}, value is stored,
+mirroring how listings wrap non-dict documents). The body is parsed
+incrementally from the request's input stream and handed to the collection
+in batches:
+
+    def create_many(self, documents)
+    def store_many(self, items)
+
+"documents" is a list of parsed JSON values, "items" a list of
+(name, document) pairs; both return a list with one outcome per record, in
+order: a (name, body) pair on success, or a ResourceException (or
+RestException) instance on failure. Collections that do not implement these
+get one create() or store() call per record instead, with the record as a
+JSON input.
+
+The response is itself an NDJSON stream, with one status line per record,
+produced as the batches are processed:
+
+    {"index": 0, "status": 201, "_name": "apple"}
+    {"index": 1, "status": 400, "error": "Malformed Input"}
+
+Since the records are written while the response is streamed, after the
+200 status has been sent, an exception raised by a batch (other than the
+ResourceExceptions returned as outcomes) cannot become an error response:
+it is logged, and every record of the batch gets a 500 status line. For the
+same reason, the writes are not part of a request's timings (papi.timing)
+and metrics (papi.metrics), and API middleware does not see their
+exceptions.
+"""
+
+import io
+import itertools
+import json
+import logging
+from papi.exceptions import ResourceException, \
+                            RestException, \
+                            MalformedException
+from papi.mime import match_mime, parse_mime_type
+from papi.capabilities import capabilities
+
+ndjson = parse_mime_type("application/x-ndjson")
+application_json = parse_mime_type("application/json")
+
+default_batch_size = 1000
+
+logger = logging.getLogger(__name__)
+
+def is_ndjson(content_type):
+    return content_type is not None and match_mime(ndjson, content_type)
+
+def read_lines(input, content_length=None, chunk_size=65536):
+    """Iterate over the lines of a binary input stream, reading it in chunks,
+    and never reading more than "content_length" bytes (if given).
+    """
+    remaining = content_length
+    buffer = b''
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = input.read(size)
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+def parse_records(lines, charset='utf8'):
+    """Parse NDJSON lines into (index, record) pairs, skipping blank lines.
+    Lines that are not valid JSON yield a MalformedException as their record.
+    """
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line.decode(charset))
+        except (ValueError, LookupError):
+            record = MalformedException()
+        yield index, record
+        index += 1
+
+def batches(items, size):
+    """Split an iterable into lists of at most "size" items.
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+def exception_status(e):
+    """Get the HTTP status (code, message) for a failed record.
+    """
+    if isinstance(e, ResourceException):
+        ctor = e.rest_exception_mapping.get(e.reason, RestException)
+        e = ctor()
+    if isinstance(e, RestException):
+        return e.get_http_status()
+    return (500, 'Internal Server Error')
+
+def named_document(record):
+    """Split a PUT record into (name, document); raises MalformedException
+    if the record has no "_name".
+    """
+    if not isinstance(record, dict) or \
+            not isinstance(record.get('_name'), str):
+        raise MalformedException()
+    document = dict((k, v) for k, v in record.items() if k != '_name')
+    if list(document.keys()) == ['_value']:
+        document = document['_value']
+    return record['_name'], document
+
+def json_input(document):
+    return io.BytesIO(json.dumps(document).encode('utf8'))
+
+def create_one(resource, document):
+    try:
+        return resource.create(json_input(document), application_json)
+    except (ResourceException, RestException) as e:
+        return e
+
+def store_one(resource, item):
+    name, document = item
+    try:
+        return resource.store(json_input(document), name, application_json)
+    except (ResourceException, RestException) as e:
+        return e
+
+def write_batch(resource, batch, create):
+    """Write a batch of valid records, returning their outcomes.
+    """
+    if create:
+        if capabilities(resource).create_many:
+            return resource.create_many(batch)
+        return [create_one(resource, document) for document in batch]
+    if capabilities(resource).store_many:
+        return resource.store_many(batch)
+    return [store_one(resource, item) for item in batch]
+
+def write_valid(resource, valid, create):
+    """Write a batch of valid (index, record) pairs, returning one outcome
+    per record. The response has already started when a batch is written,
+    so an exception can no longer become an error response: it is logged,
+    and becomes the outcome of every record in the batch. So does a batch
+    that returns the wrong number of outcomes.
+    """
+    try:
+        written = list(write_batch(resource, [r for i, r in valid], create))
+    except (ResourceException, RestException) as e:
+        return [e] * len(valid)
+    except Exception as e:
+        logger.error("Bulk write failed", exc_info=True)
+        return [e] * len(valid)
+    if len(written) != len(valid):
+        message = "Bulk write returned {0} outcomes for {1} records".format(
+            len(written), len(valid))
+        logger.error(message)
+        return [RuntimeError(message)] * len(valid)
+    return written
+
+def status_line(index, outcome, success_status):
+    if isinstance(outcome, Exception):
+        code, message = exception_status(outcome)
+        line = {'index': index, 'status': code, 'error': message}
+    else:
+        name = outcome[0]
+        line = {'index': index, 'status': success_status, '_name': name}
+    return (json.dumps(line) + '\n').encode('utf8')
+
+def bulk_write(resource, records, create, batch_size=None, written=None):
+    """Write (index, record) pairs to a collection in batches, yielding one
+    NDJSON status line per record. If given, "written" gets called without
+    arguments after each batch has been written.
+    """
+    batch_size = batch_size or default_batch_size
+    success_status = 201 if create else 200
+    for batch in batches(records, batch_size):
+        outcomes = {}
+        valid = []
+        for index, record in batch:
+            if not create and not isinstance(record, Exception):
+                try:
+                    record = named_document(record)
+                except MalformedException as e:
+                    record = e
+            if isinstance(record, Exception):
+                outcomes[index] = record
+            else:
+                valid.append((index, record))
+        if valid:
+            try:
+                for (index, record), outcome in zip(
+                        valid, write_valid(resource, valid, create)):
+                    outcomes[index] = outcome
+            finally:
+                if written is not None:
+                    written()
+        for index, record in batch:
+            yield status_line(index, outcomes[index], success_status)
+
+def handle_bulk_write(resource, input, content_type, create,
+        content_length=None, batch_size=None, written=None):
+    """Serve an NDJSON bulk write; returns a (status, headers, body) triple
+    whose body is a generator of status lines. The records are only written
+    as the body is iterated; "written" is passed on to bulk_write().
+    """
+    charset = content_type.props.get('charset', 'utf8')
+    records = parse_records(read_lines(input, content_length), charset)
+    body = bulk_write(resource, records, create, batch_size, written)
+    return ((200, 'OK'), [('Content-type', 'application/x-ndjson')], body)
@@ -0,0 +1,190 @@
+"""Which protocol methods a resource implements.
+
+Resources are duck-typed, so papi has to find out which of the protocol
+methods (get_child(), get_children(), get_structured_body(), store(), ...)
+each resource on a request's path implements. Rather than probing every
+resource with hasattr() on every request, capabilities() looks at the
+resource's class once, and caches the result in a weak-keyed dict, so that
+classes that go away (say, ones created on the fly in tests) do not leak:
+
+    if capabilities(resource).get_child:
+        child = resource.get_child(name)
+
+Only the class is examined: protocol methods assigned to individual
+instances are not seen. Classes that compute their attributes dynamically
+(through __getattr__ or __getattribute__, like papi.tracing.TracingProxy)
+cannot be described by their class, and are probed per instance instead.
+
+validate_tree() checks a resource tree up front for malformed protocol
+implementations, such as a protocol method that is not callable or that
+does not take the arguments papi passes; serve_resource(validate=True)
+runs it at startup.
+"""
+
+import inspect
+import threading
+import types
+import weakref
+from papi.exceptions import InvalidResourceException
+
+protocol_methods = frozenset([
+    'get_child',
+    'get_children',
+    'get_children_digests',
+    'resolve_path',
+    'get_structured_body',
+    'get_typed_body',
+    'get_typed_body_range',
+    'get_response_writers',
+    'get_version',
+    'create',
+    'create_many',
+    'store',
+    'store_many',
+    'delete',
+])
+
+# How papi calls each protocol method: (positional arguments, keyword
+# arguments); used by validate_resource() to check signatures.
+_children_kwargs = ('offset', 'count', 'filters', 'order')
+protocol_calls = {
+    'get_child': (['name'], ()),
+    'get_children': ([], _children_kwargs),
+    'get_children_digests': ([], _children_kwargs),
+    'resolve_path': (['segments'], ()),
+    'get_structured_body': ([], ('digest',)),
+    'get_typed_body': (['mime_pattern'], ()),
+    'get_typed_body_range': (['mime_pattern', 'byte_range'], ()),
+    'get_response_writers': ([], ()),
+    'get_version': (['name'], ()),
+    'create': (['input', 'content_type'], ()),
+    'create_many': (['documents'], ()),
+    'store': (['input', 'name', 'content_type'], ()),
+    'store_many': (['items'], ()),
+    'delete': (['name'], ()),
+}
+
+class Capabilities(object):
+    """The protocol methods a resource implements, as one boolean attribute
+    per method name.
+    """
+    def __init__(self, methods):
+        self.methods = frozenset(methods)
+        for name in protocol_methods:
+            setattr(self, name, name in self.methods)
+
+    def __repr__(self):
+        return 'Capabilities({0!r})'.format(sorted(self.methods))
+
+# Marks classes whose attributes are dynamic.
+_dynamic = object()
+
+_cache = weakref.WeakKeyDictionary()
+_cache_lock = threading.Lock()
+
+def is_dynamic(cls):
+    """Check whether the attributes of a class's instances may differ from
+    the class's own.
+    """
+    return hasattr(cls, '__getattr__') or \
+        isinstance(cls.__getattribute__, types.FunctionType)
+
+def class_capabilities(cls):
+    """Describe the protocol methods that a class implements; a method counts
+    if the class has a callable attribute of its name.
+    """
+    return Capabilities(
+        name for name in protocol_methods
+        if callable(getattr(cls, name, None)))
+
+def instance_capabilities(resource):
+    """Describe the protocol methods that a resource implements by probing
+    the resource itself.
+    """
+    return Capabilities(
+        name for name in protocol_methods
+        if callable(getattr(resource, name, None)))
+
+def capabilities(resource):
+    """Get the Capabilities of a resource, computed once per class.
+    """
+    cls = type(resource)
+    try:
+        cached = _cache[cls]
+    except KeyError:
+        cached = _dynamic if is_dynamic(cls) else class_capabilities(cls)
+        with _cache_lock:
+            _cache[cls] = cached
+    if cached is _dynamic:
+        return instance_capabilities(resource)
+    return cached
+
+def accepts(function, positional, keywords):
+    """Check whether a function can be called with the given numbers of
+    positional arguments and keyword argument names. Functions whose
+    signature cannot be inspected (some builtins) are accepted.
+    """
+    try:
+        signature = inspect.signature(function)
+    except (TypeError, ValueError):
+        return True
+    try:
+        signature.bind(*positional, **dict.fromkeys(keywords))
+    except TypeError:
+        return False
+    return True
+
+def validate_resource(resource):
+    """Check a resource's protocol methods, raising InvalidResourceException
+    if one of them is not callable, or cannot be called the way papi calls
+    it.
+    """
+    name = type(resource).__name__
+    for method_name in sorted(protocol_methods):
+        method = getattr(resource, method_name, None)
+        if method is None:
+            continue
+        if not callable(method):
+            raise InvalidResourceException(
+                '{0}.{1} is not callable'.format(name, method_name))
+        positional, keywords = protocol_calls[method_name]
+        if not accepts(method, positional, keywords):
+            raise InvalidResourceException(
+                '{0}.{1}() must accept the arguments ({2})'.format(
+                    name, method_name,
+                    ', '.join(list(positional) +
+                        ['{0}=...'.format(k) for k in keywords])))
+    caps = capabilities(resource)
+    if caps.get_typed_body_range and not caps.get_typed_body:
+        raise InvalidResourceException(
+            '{0} implements get_typed_body_range() but not get_typed_body()'
+                .format(name))
+
+def validate_tree(resource, max_depth=3, max_children=100):
+    """Validate a resource and the resources reachable from it through
+    get_children(), down to "max_depth" levels, listing at most
+    "max_children" children per collection. Each class is validated once
+    (with the first of its instances that is found), and plain values in
+    listings are skipped. Resources that are only reachable through
+    get_child() cannot be found this way.
+
+    Raises InvalidResourceException, or any exception get_children()
+    raises.
+    """
+    validated = set()
+    level = [resource]
+    for depth in range(max_depth + 1):
+        next_level = []
+        for current in level:
+            cls = type(current)
+            if cls not in validated:
+                validated.add(cls)
+                validate_resource(current)
+            if depth == max_depth or not capabilities(current).get_children:
+                continue
+            children = current.get_children(
+                offset=None, count=max_children, filters=None, order=None)
+            for child_name, child in list(children or ())[:max_children]:
+                if capabilities(child).methods:
+                    next_level.append(child)
+        level = next_level
@@ -0,0 +1,393 @@
+"""Traffic capture and replay.
+
+capture_middleware() is a WSGI middleware that records requests (method,
+path, query string, headers and body) and their outcome (status, response
+size and hash, and latency) in a log file, one compact JSON record per
+line, gzip-compressed if the file name ends in ".gz":
+
+    application = capture_middleware(
+        serve_resource(root), 'traffic.jsonl.gz', rate=0.1)
+
+Records pass through a redaction hook before they are written; the default
+one, redact_headers(), drops the Authorization and Cookie headers. A hook
+can also return None to drop a record altogether.
+
+replay() feeds a log back into an application, at the original pacing, an
+accelerated one, or as fast as possible, compares statuses and response
+bodies with the recorded ones, and reports the differences in latency:
+
+    python -m papi.capture example.app:application traffic.jsonl.gz \\
+        --speed 10 --concurrency 8
+
+Records have the keys "t" (seconds since the capture started), "m"
+(method), "p" (path, URL-quoted), "q" (query string), "h" (headers, as
+[name, value] pairs), "b" (request body, as text, or "b64" for base64 if
+it is not UTF-8; absent for requests without a body, and None if it was
+too large to capture), "s" (status code), "n" (response size in bytes),
+"x" (a hash of the response body) and "d" (latency in seconds, up to the
+end of the response body).
+"""
+
+import argparse
+import base64
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote
+from papi.loadtest import RequestSpec, percentile
+
+sensitive_headers = frozenset(['authorization', 'cookie', 'proxy-authorization'])
+
+def redact_headers(record):
+    """Default redaction hook: drops credentials from the headers.
+    """
+    record['h'] = [
+        [name, value] for name, value in record['h']
+        if name.lower() not in sensitive_headers
+    ]
+    return record
+
+def open_log(filename, mode):
+    """Open a capture log for reading ('r') or appending ('a') text.
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf8')
+    return open(filename, mode, encoding='utf8')
+
+def read_log(filename):
+    """Iterate over the records in a capture log.
+    """
+    with open_log(filename, 'r') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            # a compressed log that is still being written
+            pass
+
+def encode_body(record, data):
+    try:
+        record['b'] = data.decode('utf8')
+    except UnicodeDecodeError:
+        record['b64'] = base64.b64encode(data).decode('ascii')
+
+def decode_body(record):
+    if 'b64' in record:
+        return base64.b64decode(record['b64'])
+    if record.get('b') is not None:
+        return record['b'].encode('utf8')
+    return None
+
+def environ_headers(environ):
+    headers = []
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers.append([key[5:].replace('_', '-').title(), value])
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+            headers.append([key.replace('_', '-').title(), value])
+    return sorted(headers)
+
+class CaptureLog(object):
+    """A capture log file that records are appended to, from any thread.
+    """
+    def __init__(self, filename):
+        self.file = open_log(filename, 'a')
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class _CapturedBody(object):
+    """Wraps a WSGI response body, hashing it as it is sent, and writing
+    the record when it has been sent completely (or closed).
+    """
+    def __init__(self, body, record, started, finish):
+        self.body = body
+        self.record = record
+        self.started = started
+        self.finish = finish
+        self.hash = hashlib.sha1()
+        self.size = 0
+        self.done = False
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.hash.update(chunk)
+            self.size += len(chunk)
+            yield chunk
+        self.complete()
+
+    def complete(self):
+        if self.done:
+            return
+        self.done = True
+        self.record['n'] = self.size
+        self.record['x'] = self.hash.hexdigest()[:16]
+        self.record['d'] = time.perf_counter() - self.started
+        self.finish(self.record)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.complete()
+
+def capture_middleware(app, log, rate=1.0, redact=redact_headers,
+        max_body_bytes=1 << 20):
+    """WSGI middleware that captures a fraction ("rate") of the requests to
+    "app" in "log" (a CaptureLog, or a file name). "redact" gets each
+    record before it is written, and returns it (possibly modified) or
+    None; request bodies larger than "max_body_bytes" are not captured.
+    """
+    if isinstance(log, str):
+        log = CaptureLog(log)
+    rng = random.Random()
+    def finish(record):
+        if redact is not None:
+            record = redact(record)
+        if record is not None:
+            log.write(record)
+    def wrapped(environ, start_response):
+        if rate < 1.0 and rng.random() >= rate:
+            return app(environ, start_response)
+        record = {
+            't': round(time.time() - log.started, 6),
+            'm': environ.get('REQUEST_METHOD', 'GET'),
+            # PATH_INFO holds the path's bytes as latin-1 text (PEP 3333)
+            'p': quote(environ.get('PATH_INFO', '').encode('latin-1')),
+            'q': environ.get('QUERY_STRING', ''),
+            'h': environ_headers(environ),
+        }
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > max_body_bytes:
+            record['b'] = None
+        elif length > 0 and environ.get('wsgi.input') is not None:
+            data = environ['wsgi.input'].read(length)
+            encode_body(record, data)
+            environ = dict(environ)
+            environ['wsgi.input'] = io.BytesIO(data)
+        def capturing_start_response(status, headers, exc_info=None):
+            record['s'] = int(status.split(None, 1)[0])
+            if exc_info is None:
+                return start_response(status, headers)
+            return start_response(status, headers, exc_info)
+        started = time.perf_counter()
+        body = app(environ, capturing_start_response)
+        return _CapturedBody(body, record, started, finish)
+    return wrapped
+
+def record_spec(record):
+    """A papi.loadtest.RequestSpec for a captured request.
+    """
+    return RequestSpec(
+        method=record['m'],
+        path=record['p'],
+        query=record.get('q', ''),
+        headers=dict(record.get('h', ())),
+        body=decode_body(record))
+
+def replay_one(application, record):
+    """Send a captured request to an application; returns (status, size,
+    hash, latency).
+    """
+    status = []
+    def start_response(status_str, headers, exc_info=None):
+        status.append(int(status_str.split(None, 1)[0]))
+    environ = record_spec(record).environ()
+    started = time.perf_counter()
+    result = application(environ, start_response)
+    h = hashlib.sha1()
+    size = 0
+    try:
+        for chunk in result:
+            h.update(chunk)
+            size += len(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return status[0], size, h.hexdigest()[:16], time.perf_counter() - started
+
+def replay(application, records, speed=None, concurrency=1,
+        compare_bodies=True):
+    """Replay captured records against an application, and return a report
+    (see replay_report()).
+
+    Args:
+        application: the WSGI application.
+        records: the records, or the file name of a capture log.
+        speed: None to replay as fast as possible, in order; otherwise, the
+            pacing relative to the original (1 is the original pacing, 10
+            ten times as fast).
+        concurrency: the number of requests that may be in flight at once.
+        compare_bodies: whether to count responses whose body differs from
+            the recorded one as mismatches.
+    """
+    if isinstance(records, str):
+        records = read_log(records)
+    records = [r for r in records if 's' in r and r.get('b', '') is not None]
+    results = [None] * len(records)
+    def run(i):
+        try:
+            results[i] = replay_one(application, records[i])
+        except Exception:
+            results[i] = (None, None, None, None)
+    if concurrency <= 1 and speed is None:
+        for i in range(len(records)):
+            run(i)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, concurrency)) as executor:
+            started = time.perf_counter()
+            first = records[0]['t'] if records else 0
+            futures = []
+            for i, record in enumerate(records):
+                if speed is not None:
+                    delay = (record['t'] - first) / speed - \
+                        (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(executor.submit(run, i))
+            concurrent.futures.wait(futures)
+    return replay_report(records, results, compare_bodies)
+
+def replay_report(records, results, compare_bodies=True):
+    """Compare replayed results with the records. The report holds the
+    number of "requests", "status_mismatches" and "body_mismatches",
+    "errors" (requests that raised an exception), the first few
+    "mismatches", latency percentiles ("latency": {"recorded": ...,
+    "replayed": ...}, in seconds) and a per-request breakdown in "routes",
+    keyed by method and path.
+    """
+    report = {
+        'requests': len(records),
+        'status_mismatches': 0,
+        'body_mismatches': 0,
+        'errors': 0,
+        'mismatches': [],
+    }
+    recorded = collections.defaultdict(list)
+    replayed = collections.defaultdict(list)
+    for record, (status, size, digest, latency) in zip(records, results):
+        route = '{0} {1}'.format(record['m'], record['p'])
+        if status is None:
+            report['errors'] += 1
+            continue
+        recorded[route].append(record['d'])
+        replayed[route].append(latency)
+        mismatch = None
+        if status != record['s']:
+            report['status_mismatches'] += 1
+            mismatch = 'status {0} != {1}'.format(status, record['s'])
+        elif compare_bodies and digest != record.get('x'):
+            report['body_mismatches'] += 1
+            mismatch = 'body differs ({0} bytes, recorded {1})'.format(
+                size, record.get('n'))
+        if mismatch is not None and len(report['mismatches']) < 20:
+            report['mismatches'].append({
+                'request': route + ('?' + record['q'] if record['q'] else ''),
+                'mismatch': mismatch,
+            })
+    def latencies(values):
+        values = sorted(values)
+        return dict(
+            (name, percentile(values, q))
+            for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)))
+    report['latency'] = {
+        'recorded': latencies(
+            d for values in recorded.values() for d in values),
+        'replayed': latencies(
+            d for values in replayed.values() for d in values),
+    }
+    report['routes'] = dict(
+        (route, {
+            'requests': len(recorded[route]),
+            'recorded': latencies(recorded[route]),
+            'replayed': latencies(replayed[route]),
+        })
+        for route in recorded)
+    return report
+
+def format_ms(seconds):
+    return '-' if seconds is None else '{0:.2f}'.format(seconds * 1e3)
+
+def format_report(report):
+    lines = [
+        '{0} requests: {1} status mismatches, {2} body mismatches, '
+        '{3} errors'.format(
+            report['requests'], report['status_mismatches'],
+            report['body_mismatches'], report['errors']),
+    ]
+    for mismatch in report['mismatches']:
+        lines.append('  {request}: {mismatch}'.format(**mismatch))
+    lines.append('')
+    width = max([5] + [len(route) for route in report['routes']])
+    lines.append('{0:<{1}}{2:>10}'.format('route', width, 'requests') + ''.join(
+        '{0:>12}'.format(c) for c in (
+            'p50 before', 'p50 after', 'p95 before', 'p95 after', 'change')) +
+        '   (latencies in ms)')
+    rows = sorted(report['routes'].items()) + [('all', dict(
+        report['latency'], requests=report['requests'] - report['errors']))]
+    for route, summary in rows:
+        before = summary['recorded']
+        after = summary['replayed']
+        change = '-'
+        if before['p50'] and after['p50'] is not None:
+            change = '{0:+.1%}'.format(after['p50'] / before['p50'] - 1)
+        lines.append('{0:<{1}}{2:>10}'.format(
+            route, width, summary['requests']) + ''.join(
+            '{0:>12}'.format(value) for value in (
+                format_ms(before['p50']), format_ms(after['p50']),
+                format_ms(before['p95']), format_ms(after['p95']), change)))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m papi.capture',
+        description='Replay a capture log against a WSGI application.')
+    parser.add_argument('application',
+        help='the application, as "module:attribute"')
+    parser.add_argument('log', help='the capture log')
+    parser.add_argument('--speed', type=float,
+        help='pacing relative to the original (default: as fast as '
+             'possible, in order)')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--ignore-bodies', action='store_true',
+        help='only compare statuses, not response bodies')
+    parser.add_argument('--json', action='store_true',
+        help='print the report as JSON')
+    args = parser.parse_args(argv)
+    from papi.server import load_application
+    report = replay(load_application(args.application), args.log,
+        speed=args.speed,
+        concurrency=args.concurrency,
+        compare_bodies=not args.ignore_bodies)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+    mismatches = report['status_mismatches'] + report['errors'] + (
+        0 if args.ignore_bodies else report['body_mismatches'])
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Request coalescing ("single flight") at the API middleware level.
+
+When many identical GET requests arrive at the same time - typically right
+after a popular listing has expired from a cache - SingleFlight lets only
+one of them (the "leader") run the handler, while the others wait for it and
+share its (status, headers, body) response, or a copy of its exception:
+
+    application = serve_resource(root, api_middleware=SingleFlight(timeout=5))
+
+Requests are considered identical if they have the same method, path, query
+string, Accept header (which determines the negotiated content type), Range
+header and credentials (the Authorization and Cookie headers); a different
+key function can be passed in.
+
+Followers get the leader's response without going through the inner
+api_middleware, which is where access checks usually live. The default key
+only coalesces requests that carry the same credentials, but it cannot tell
+which other headers matter: if responses depend on anything else about the
+client, pass a key that includes it, or requests from one client will be
+answered with another's response.
+"""
+
+import collections
+import copy
+import threading
+import papi.fp as fp
+from papi.mime import mime_str
+
+def request_key(request):
+    """Default coalescing key: method, path, query, accepted content types,
+    requested range and credentials.
+    """
+    return (
+        fp.prop('method', request).upper(),
+        tuple(fp.prop('path', request) or ()),
+        tuple(sorted((fp.prop('query', request) or {}).items())),
+        tuple(mime_str(m) for m in fp.prop('accept', request) or ()),
+        fp.path(('headers', 'Range'), request),
+        fp.path(('headers', 'Authorization'), request),
+        fp.path(('headers', 'Cookie'), request),
+    )
+
+def follower_exception(exception):
+    """Copy the leader's exception for a follower to raise: raising the same
+    instance in several threads at once would have them all append to its
+    traceback.
+    """
+    try:
+        return copy.copy(exception)
+    except Exception:
+        return RuntimeError(
+            'Coalesced request failed: {0!r}'.format(exception))
+
+class _Call(object):
+    """A computation in flight, and eventually its outcome.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.route = None
+
+class SingleFlight(object):
+    """API middleware that coalesces concurrent identical requests (see the
+    module documentation).
+
+    Args:
+        timeout: how long, in seconds, a request waits for the leader before
+            giving up and running the handler itself; None waits forever.
+        key: a function that maps a request to a hashable key; requests with
+            equal keys are coalesced.
+        methods: the request methods to coalesce; only safe methods should
+            be listed here.
+        api_middleware: an inner API middleware to run the handler through.
+
+    The "metrics" attribute counts "leaders" (requests that ran the handler
+    on behalf of others), "coalesced" (requests that shared a leader's
+    outcome) and "timeouts" (requests that gave up waiting).
+    """
+    def __init__(self,
+            timeout=None,
+            key=request_key,
+            methods=('GET',),
+            api_middleware=None):
+        self.timeout = timeout
+        self.key = key
+        self.methods = frozenset(m.upper() for m in methods)
+        self.api_middleware = api_middleware
+        self.metrics = collections.Counter()
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def handle(self, handle, resource, request):
+        if self.api_middleware is None:
+            return handle(resource, request)
+        return self.api_middleware(handle, resource, request)
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def __call__(self, handle, resource, request):
+        if fp.prop('method', request).upper() not in self.methods:
+            return self.handle(handle, resource, request)
+        key = self.key(request)
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+        if leader:
+            return self.lead(call, key, handle, resource, request)
+        return self.follow(call, handle, resource, request)
+
+    def lead(self, call, key, handle, resource, request):
+        self.count('leaders')
+        # the leader's route (see papi.metrics) is shared with the followers
+        call.route = request.get('route')
+        try:
+            call.result = self.handle(handle, resource, request)
+            return call.result
+        except Exception as e:
+            call.exception = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def follow(self, call, handle, resource, request):
+        if not call.done.wait(self.timeout):
+            self.count('timeouts')
+            return self.handle(handle, resource, request)
+        if call.result is None and call.exception is None:
+            # the leader died of something other than an Exception
+            return self.handle(handle, resource, request)
+        self.count('coalesced')
+        route = request.get('route')
+        if route is not None and call.route is not None:
+            route.extend(call.route)
+        if call.exception is not None:
+            raise follower_exception(call.exception) from call.exception
+        status, headers, body = call.result
+        return status, list(headers), body
@@ -0,0 +1,363 @@
+"""An in-memory collection resource with secondary indexes.
+
+IndexedCollectionResource keeps its documents in a dict, plus two kinds of
+secondary indexes, both of which are maintained incrementally as documents
+are created, stored and deleted:
+
+- Hash indexes map property values to the set of names of the documents that
+  have them; they serve "equals" and "in" filters without scanning.
+- Sorted indexes are sorted lists of (key, name) pairs, searched and updated
+  with bisect; they serve order= without sorting. Documents are always
+  sorted-indexed by name, which is also the default listing order.
+
+A listing page is produced by narrowing down the candidate documents through
+the hash indexes, walking the sorted index of the most significant order key
+(or sorting the candidates directly, if there are only few of them), applying
+any remaining filters to each visited document, and stopping as soon as the
+page is full. So an ordered page with indexed equality filters costs
+O(log n + k) rather than O(n log n).
+
+Documents are treated as immutable: modifying a document in place, rather
+than storing a new one, would leave the indexes out of date.
+
+Every stored document gets a new version (see get_version()), which lets
+clients update documents with If-Match requests instead of locking.
+"""
+
+import bisect
+import itertools
+import json
+import operator
+import threading
+import uuid
+import papi.fp as fp
+from papi.exceptions import ResourceException
+from papi.filters import Filter, compile_filters, get_prop
+from papi.mime import match_mime, parse_mime_type
+from papi.ordering import sort_key, order_key
+
+# Default for expected_version, which is only passed for conditional requests
+_unconditional = object()
+
+text_plain = parse_mime_type("text/plain")
+text_json = parse_mime_type("text/json")
+application_json = parse_mime_type("application/json")
+
+class DocumentResource(object):
+    """Default child resource for an IndexedCollectionResource: a plain,
+    read-only document.
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def get_structured_body(self, **kwargs):
+        return self.data
+
+class IndexedCollectionResource(object):
+    """A writable in-memory collection of documents, with hash indexes on the
+    properties named in "indexes" and sorted indexes on the properties named
+    in "sorted_indexes" (see the module documentation).
+
+    Args:
+        documents: initial documents, as a dict or a list of (name, document)
+            pairs.
+        indexes: names of properties to keep hash indexes for.
+        sorted_indexes: names of properties to keep sorted indexes for.
+        make_child: a function that turns a document into a child resource;
+            defaults to DocumentResource.
+    """
+    default_count = 20
+
+    # Below this fraction of the collection, filtered candidates are sorted
+    # directly rather than found by walking a sorted index.
+    sort_candidates_ratio = 0.125
+
+    # Bulk writes of at least this fraction of the collection rebuild the
+    # sorted indexes in one go rather than updating them per document.
+    bulk_rebuild_ratio = 0.125
+
+    def __init__(self,
+            documents=None,
+            indexes=(),
+            sorted_indexes=(),
+            make_child=None):
+        self.documents = {}
+        self.children = {}
+        self.versions = {}
+        self.version_counter = itertools.count(1)
+        self.make_child = make_child or DocumentResource
+        self.indexes = dict((p, {}) for p in indexes)
+        self.sorted_indexes = dict((p, []) for p in sorted_indexes)
+        self.sorted_indexes.setdefault('_name', [])
+        self.lock = threading.RLock()
+        if documents is not None:
+            self.put_documents(documents)
+
+    # Document access
+
+    def get_prop(self, propname, name):
+        """Get a property of the document called "name"; "_name" is the name
+        itself.
+        """
+        if propname == '_name':
+            return name
+        return get_prop(propname, self.documents[name])
+
+    def put_document(self, name, data):
+        """Create or replace a single document, updating all indexes.
+        """
+        with self.lock:
+            if name in self.documents:
+                self._unindex(name)
+            self.documents[name] = data
+            self.children[name] = self.make_child(data)
+            self.versions[name] = str(next(self.version_counter))
+            self._index(name)
+
+    def put_documents(self, documents):
+        """Create or replace many documents at once. Sorted indexes are
+        rebuilt with a single sort rather than updated one document at a
+        time, which makes this the preferred way of loading large amounts of
+        data.
+        """
+        if hasattr(documents, 'items') and callable(documents.items):
+            documents = documents.items()
+        with self.lock:
+            for name, data in documents:
+                if name in self.documents:
+                    self._unindex(name)
+                self.documents[name] = data
+                self.children[name] = self.make_child(data)
+                self.versions[name] = str(next(self.version_counter))
+                self._index(name, sorted_indexes=False)
+            for propname, index in self.sorted_indexes.items():
+                index[:] = sorted(
+                    (sort_key(self.get_prop(propname, name)), name)
+                    for name in self.documents)
+
+    def delete_document(self, name):
+        """Remove a document, updating all indexes. Returns False if there
+        was no such document.
+        """
+        with self.lock:
+            if name not in self.documents:
+                return False
+            self._unindex(name)
+            del self.documents[name]
+            del self.children[name]
+            del self.versions[name]
+            return True
+
+    def _index(self, name, sorted_indexes=True):
+        for propname, index in self.indexes.items():
+            value = self.get_prop(propname, name)
+            try:
+                index.setdefault(value, set()).add(name)
+            except TypeError:
+                # unhashable values can never equal a filter literal anyway
+                pass
+        if sorted_indexes:
+            for propname, index in self.sorted_indexes.items():
+                entry = (sort_key(self.get_prop(propname, name)), name)
+                bisect.insort(index, entry)
+
+    def _unindex(self, name):
+        for propname, index in self.indexes.items():
+            value = self.get_prop(propname, name)
+            try:
+                names = index.get(value)
+            except TypeError:
+                continue
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del index[value]
+        for propname, index in self.sorted_indexes.items():
+            entry = (sort_key(self.get_prop(propname, name)), name)
+            pos = bisect.bisect_left(index, entry)
+            if pos < len(index) and index[pos] == entry:
+                del index[pos]
+
+    # Resource protocol
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+    def get_children(self,
+            offset=None,
+            count=None,
+            filters=None,
+            order=None,
+            *args, **kwargs):
+        offset = offset or 0
+        count = self.default_count if count is None else count
+        predicate = compile_filters(filters, self.get_prop)
+        with self.lock:
+            candidates = self._candidates(filters)
+            names = (
+                name
+                for name in self._ordered_names(candidates, order)
+                if predicate(name))
+            return [
+                (name, self.children[name])
+                for name in itertools.islice(names, offset, offset + count)
+            ]
+
+    def _candidates(self, filters):
+        """Use the hash indexes to find a set of names that includes all
+        documents matching the filters, or None if no filter can be answered
+        from an index.
+        """
+        candidates = None
+        for f in (filters or ()):
+            if not isinstance(f, Filter):
+                continue
+            if f.operator == 'equals':
+                values = ((f.value, f.raw_value),)
+            elif f.operator == 'in':
+                values = tuple(zip(f.value, f.raw_value))
+            else:
+                continue
+            # Look up both the typed value and its source text, since
+            # filters treat "18" and 18 as equal for string properties.
+            lookups = set(fp.concat((value, str(raw)) for value, raw in values))
+            if f.propname == '_name':
+                matched = set(v for v in lookups if v in self.documents)
+            elif f.propname in self.indexes:
+                index = self.indexes[f.propname]
+                hits = [index[v] for v in lookups if v in index]
+                # A single hit is used as-is rather than copied; it is
+                # only ever read from.
+                matched = hits[0] if len(hits) == 1 else set().union(*hits)
+            else:
+                continue
+            candidates = matched if candidates is None else candidates & matched
+        return candidates
+
+    def _sort_key(self, order):
+        key = order_key(order, self.get_prop)
+        return lambda name: (key(name), name)
+
+    def _ordered_names(self, candidates, order):
+        """Iterate over the names in "candidates" (or all names, if None) in
+        the requested order. Ties are broken by name.
+        """
+        order = tuple(order or ((False, '_name'),))
+        desc, propname = order[0]
+        index = self.sorted_indexes.get(propname)
+        few_candidates = \
+            candidates is not None and \
+            len(candidates) < len(self.documents) * self.sort_candidates_ratio
+        if index is None or few_candidates:
+            pool = self.documents if candidates is None else candidates
+            return iter(sorted(pool, key=self._sort_key(order)))
+        return self._walk_index(index, desc, order[1:], candidates)
+
+    def _walk_index(self, index, desc, rest, candidates):
+        entries = reversed(index) if desc else iter(index)
+        for key, group in itertools.groupby(entries, key=operator.itemgetter(0)):
+            names = [
+                name for _, name in group
+                if candidates is None or name in candidates
+            ]
+            if rest:
+                names.sort(key=self._sort_key(rest))
+            elif desc:
+                names.reverse()
+            for name in names:
+                yield name
+
+    def parse_body(self, input, content_type=None):
+        """Parse a request body into a document: JSON for JSON content
+        types, a string for text/plain.
+        """
+        content_type = content_type or application_json
+        if match_mime(text_plain, content_type):
+            charset = content_type.props.get('charset', 'ascii')
+            try:
+                return input.read().decode(charset)
+            except (UnicodeDecodeError, LookupError):
+                raise ResourceException(ResourceException.reason_malformed)
+        elif match_mime(text_json, content_type) or \
+             match_mime(application_json, content_type):
+            charset = content_type.props.get('charset', 'utf8')
+            try:
+                return json.loads(input.read().decode(charset))
+            except (ValueError, LookupError):
+                raise ResourceException(ResourceException.reason_malformed)
+        else:
+            raise ResourceException(ResourceException.reason_wrong_type)
+
+    def make_name(self, data):
+        """Generate a name for a newly created document.
+        """
+        name = uuid.uuid4().hex
+        while name in self.documents:
+            name = uuid.uuid4().hex
+        return name
+
+    def get_version(self, name):
+        """The current version of a document, or None if there is no such
+        document. Versions are never reused, not even after a delete.
+        """
+        return self.versions.get(name)
+
+    def check_version(self, name, expected_version):
+        """Raise a ResourceException if the document's version is not
+        "expected_version": a version, "*" for any existing document, or
+        None for no document at all.
+        """
+        if expected_version is _unconditional:
+            return
+        current = self.versions.get(name)
+        if expected_version == '*':
+            matches = current is not None
+        else:
+            matches = current == expected_version
+        if not matches:
+            raise ResourceException(ResourceException.reason_version_mismatch)
+
+    def create(self, input, content_type=None):
+        data = self.parse_body(input, content_type)
+        with self.lock:
+            name = self.make_name(data)
+            self.put_document(name, data)
+        return name, data
+
+    def store(self, input, name, content_type=None,
+            expected_version=_unconditional):
+        data = self.parse_body(input, content_type)
+        with self.lock:
+            self.check_version(name, expected_version)
+            self.put_document(name, data)
+            version = self.versions[name]
+        return name, data, version
+
+    def put_batch(self, items):
+        """Store a list of (name, document) pairs, choosing between
+        put_documents() and put_document() by batch size.
+        """
+        with self.lock:
+            if len(items) >= len(self.documents) * self.bulk_rebuild_ratio:
+                self.put_documents(items)
+            else:
+                for name, data in items:
+                    self.put_document(name, data)
+
+    def create_many(self, documents):
+        with self.lock:
+            items = [(self.make_name(data), data) for data in documents]
+            self.put_batch(items)
+        return items
+
+    def store_many(self, items):
+        items = list(items)
+        self.put_batch(items)
+        return items
+
+    def delete(self, name, expected_version=_unconditional):
+        with self.lock:
+            self.check_version(name, expected_version)
+            if not self.delete_document(name):
+                raise ResourceException(ResourceException.reason_does_not_exist)
+        return True
@@ -42,6 +42,13 @@ class ConflictException(RestException):
     def get_http_status(self):
         return (409, 'Conflict')
 
+class PreconditionFailedException(ConflictException):
+    """A precondition of a conditional request (If-Match, If-None-Match) does
+    not hold, typically because the document has been modified concurrently.
+    """
+    def get_http_status(self):
+        return (412, 'Precondition Failed')
+
 class UnsupportedMediaException(RestException):
     """Received input of a content type that the resource does not understand
     or accept.
@@ -55,6 +62,13 @@ class RangeNotSatisfiableException(RestException):
     def get_http_status(self):
         return (416, 'Requested Range Not Satisfiable')
 
+class TimeoutException(RestException):
+    """The request could not be completed before its deadline, typically
+    because a backend took too long to respond.
+    """
+    def get_http_status(self):
+        return (504, 'Gateway Timeout')
+
 # ResourceException hierarchy
 #
 # ResourceExceptions describe failures at the "storage" level, i.e., reasons
@@ -66,6 +80,8 @@ class ResourceException(Exception):
     reason_exists = 'exists'
     reason_does_not_exist = 'not_exists'
     reason_out_of_range = 'out_of_range'
+    reason_timeout = 'timeout'
+    reason_version_mismatch = 'version_mismatch'
 
     rest_exception_mapping = {
         reason_wrong_type: UnsupportedMediaException,
@@ -73,6 +89,8 @@ class ResourceException(Exception):
         reason_exists: ConflictException,
         reason_does_not_exist: NotFoundException,
         reason_out_of_range: RangeNotSatisfiableException,
+        reason_timeout: TimeoutException,
+        reason_version_mismatch: PreconditionFailedException,
     }
 
     def __init__(self, reason):
@@ -82,3 +100,12 @@ class ResourceException(Exception):
     def raise_as_rest_exception(self):
         ctor = self.rest_exception_mapping.get(self.reason, RestException)
         raise ctor()
+
+# InvalidResourceException
+#
+# Raised while validating a resource tree (see papi.capabilities), for
+# resources that implement the resource protocol incorrectly. This is a
+# programming error, not a REST or storage level failure.
+
+class InvalidResourceException(TypeError):
+    pass
@@ -0,0 +1,403 @@
+"""Filter expressions, as used in the "where" query string parameter.
+
+Grammar (informally; keywords are case-insensitive):
+
+    expr        := and_expr ( ("|" | "or") and_expr )*
+    and_expr    := not_expr ( ("," | "&" | "and") not_expr )*
+    not_expr    := ("!" | "not") not_expr | "(" expr ")" | comparison
+    comparison  := name operator literal
+                 | name "in" "[" literal ( "," literal )* "]"
+                 | name "in" literal ".." literal
+    operator    := ":" | "=" | "==" | "!=" | "<" | "<=" | ">" | ">=" | "^="
+    literal     := number | "true" | "false" | "null" | quoted | bare word
+
+":", "=" and "==" all mean equality; "^=" is a string prefix match, and
+"lo..hi" is an inclusive range. Quoted strings use single or double quotes
+and backslash escapes; anything else that is not a number, boolean or null is
+a bare string. Examples:
+
+    where=name:apple
+    where=price<10,color in [red,green]
+    where=(size>=3|!name^=ban),updated in 2016-01-01..2016-12-31
+
+Expressions that do not parse, but are a comma-separated list of "name:value"
+terms, are read the way papi used to read them before this grammar existed:
+as equality filters with the values taken verbatim, as strings, up to the
+next comma. So "where=title:Hello (world)!" still works; only expressions
+that the grammar accepts get typed values.
+
+Parsing produces an AST made of Filter (comparison) nodes and And, Or and Not
+nodes; backends can translate this AST to their own query language, while
+in-memory resources can use compile_filter() to turn it into a Python
+predicate. Parsed expressions are cached by their source string, so
+resources must treat the AST as read-only.
+"""
+
+import re
+from papi.exceptions import MalformedException
+
+class Filter(object):
+    """A single comparison: "propname" "operator" "value".
+
+    Operators are "equals", "not_equals", "less", "less_or_equal",
+    "greater", "greater_or_equal", "prefix", "in" (value is a tuple of
+    literals), and "between" (value is a (low, high) pair, both inclusive).
+
+    "value" holds the typed literal(s); "raw_value" holds the corresponding
+    source text, which is useful for backends that store everything as
+    strings.
+    """
+    def __init__(self, propname, value, operator, raw_value=None):
+        self.propname = propname
+        self.value = value
+        self.operator = operator
+        self.raw_value = value if raw_value is None else raw_value
+        self._predicate = None
+
+    def __repr__(self):
+        return "Filter({0!r}, {1!r}, {2!r})".format(
+            self.propname, self.value, self.operator)
+
+class And(object):
+    """Conjunction; matches if all "operands" match.
+    """
+    operator = 'and'
+
+    def __init__(self, operands):
+        self.operands = tuple(operands)
+        self._predicate = None
+
+    def __repr__(self):
+        return "And({0!r})".format(self.operands)
+
+class Or(object):
+    """Disjunction; matches if any of the "operands" matches.
+    """
+    operator = 'or'
+
+    def __init__(self, operands):
+        self.operands = tuple(operands)
+        self._predicate = None
+
+    def __repr__(self):
+        return "Or({0!r})".format(self.operands)
+
+class Not(object):
+    """Negation; matches if "operand" does not match.
+    """
+    operator = 'not'
+
+    def __init__(self, operand):
+        self.operand = operand
+        self._predicate = None
+
+    def __repr__(self):
+        return "Not({0!r})".format(self.operand)
+
+# Tokenizer
+
+_token_re = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op><=|>=|!=|==|\^=|\.\.|[:=<>!(),|&\[\]])
+      | (?P<word>(?:[^\s"'<>=!:(),|&\[\]^.]|\.(?!\.))+)
+    )''', re.VERBOSE)
+
+_keywords = set(['and', 'or', 'not', 'in'])
+
+_comparison_operators = {
+    ':': 'equals',
+    '=': 'equals',
+    '==': 'equals',
+    '!=': 'not_equals',
+    '<': 'less',
+    '<=': 'less_or_equal',
+    '>': 'greater',
+    '>=': 'greater_or_equal',
+    '^=': 'prefix',
+}
+
+_escape_re = re.compile(r'\\(.)')
+
+def tokenize(src):
+    """Split a filter expression into a list of (kind, text) tokens, where
+    kind is one of "string", "op", "word" or "keyword".
+    """
+    tokens = []
+    pos = 0
+    src = src.rstrip()
+    while pos < len(src):
+        match = _token_re.match(src, pos)
+        if match is None or match.end() == pos:
+            raise MalformedException()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'word' and text.lower() in _keywords:
+            kind, text = 'keyword', text.lower()
+        tokens.append((kind, text))
+        pos = match.end()
+    return tokens
+
+def parse_literal(kind, text):
+    """Convert a literal token into a typed value.
+    """
+    if kind == 'string':
+        return _escape_re.sub(r'\1', text[1:-1])
+    lowered = text.lower()
+    if lowered == 'true':
+        return True
+    if lowered == 'false':
+        return False
+    if lowered == 'null':
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+# Parser
+
+class _Parser(object):
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise MalformedException()
+        self.pos += 1
+        return token
+
+    def accept(self, *candidates):
+        token = self.peek()
+        if token in candidates:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, *candidates):
+        if not self.accept(*candidates):
+            raise MalformedException()
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise MalformedException()
+        return node
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.accept(('op', '|'), ('keyword', 'or')):
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.accept(('op', ','), ('op', '&'), ('keyword', 'and')):
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def parse_not(self):
+        if self.accept(('op', '!'), ('keyword', 'not')):
+            return Not(self.parse_not())
+        if self.accept(('op', '(')):
+            node = self.parse_or()
+            self.expect(('op', ')'))
+            return node
+        return self.parse_comparison()
+
+    def parse_literal(self):
+        kind, text = self.next()
+        if kind not in ('string', 'word'):
+            raise MalformedException()
+        value = parse_literal(kind, text)
+        return value, (value if kind == 'string' else text)
+
+    def parse_comparison(self):
+        kind, propname = self.next()
+        if kind == 'string':
+            propname = parse_literal(kind, propname)
+        elif kind != 'word':
+            raise MalformedException()
+        if self.accept(('keyword', 'in')):
+            return self.parse_in(propname)
+        kind, op = self.next()
+        operator = _comparison_operators.get(op)
+        if kind != 'op' or operator is None:
+            raise MalformedException()
+        value, raw_value = self.parse_literal()
+        return Filter(propname, value, operator, raw_value)
+
+    def parse_in(self, propname):
+        if self.accept(('op', '[')):
+            values = []
+            raw_values = []
+            if not self.accept(('op', ']')):
+                while True:
+                    value, raw_value = self.parse_literal()
+                    values.append(value)
+                    raw_values.append(raw_value)
+                    if self.accept(('op', ']')):
+                        break
+                    self.expect(('op', ','))
+            return Filter(propname, tuple(values), 'in', tuple(raw_values))
+        low, raw_low = self.parse_literal()
+        self.expect(('op', '..'))
+        high, raw_high = self.parse_literal()
+        return Filter(propname, (low, high), 'between', (raw_low, raw_high))
+
+_filter_cache = {}
+_filter_cache_max_size = 256
+
+def parse_legacy_filter(src):
+    """Parse a comma-separated list of "name:value" terms into equality
+    filters with verbatim string values. Raises MalformedException if a term
+    has no value, or a name that is not a bare word.
+    """
+    filters = []
+    for term in src.split(','):
+        propname, colon, value = term.partition(':')
+        if not value or tokenize(propname) != [('word', propname)]:
+            raise MalformedException()
+        filters.append(Filter(propname, value, 'equals'))
+    return filters[0] if len(filters) == 1 else And(filters)
+
+def parse_filter(src):
+    """Parse a filter expression into an AST, falling back to
+    parse_legacy_filter() for expressions the grammar rejects. Raises
+    MalformedException on syntax errors. Results are cached by source string.
+    """
+    node = _filter_cache.get(src)
+    if node is None:
+        try:
+            node = _Parser(tokenize(src)).parse()
+        except MalformedException:
+            node = parse_legacy_filter(src)
+        if len(_filter_cache) >= _filter_cache_max_size:
+            _filter_cache.clear()
+        _filter_cache[src] = node
+    return node
+
+def conjuncts(node):
+    """Split a filter AST into a tuple of nodes that must all match; this is
+    the form in which filters get passed to a resource's get_children().
+    """
+    if node is None:
+        return ()
+    if isinstance(node, And):
+        return node.operands
+    return (node,)
+
+# Compiling to predicates
+
+def get_prop(propname, target):
+    """Default property getter for compiled predicates: looks up "propname"
+    in dict-like targets; any other target is treated as its own "_value"
+    property.
+    """
+    if hasattr(target, 'get'):
+        return target.get(propname)
+    if propname == '_value':
+        return target
+    return None
+
+def _lenient_equals(actual, value, raw_value):
+    # Properties stored as strings still match literals that parse as
+    # numbers or keywords, e.g. "18" matches 18 and "true" matches true.
+    return actual == value or \
+        (type(actual) is str and actual == str(raw_value))
+
+def _compile_comparison(node, get):
+    propname = node.propname
+    value = node.value
+    raw_value = node.raw_value
+    operator = node.operator
+
+    if operator == 'equals':
+        def test(actual):
+            return _lenient_equals(actual, value, raw_value)
+    elif operator == 'not_equals':
+        def test(actual):
+            return not _lenient_equals(actual, value, raw_value)
+    elif operator == 'less':
+        def test(actual):
+            return actual < value
+    elif operator == 'less_or_equal':
+        def test(actual):
+            return actual <= value
+    elif operator == 'greater':
+        def test(actual):
+            return actual > value
+    elif operator == 'greater_or_equal':
+        def test(actual):
+            return actual >= value
+    elif operator == 'prefix':
+        prefix = str(raw_value)
+        def test(actual):
+            return type(actual) is str and actual.startswith(prefix)
+    elif operator == 'in':
+        candidates = tuple(zip(value, raw_value))
+        def test(actual):
+            for v, raw_v in candidates:
+                if _lenient_equals(actual, v, raw_v):
+                    return True
+            return False
+    elif operator == 'between':
+        low, high = value
+        def test(actual):
+            return low <= actual <= high
+    else:
+        return lambda target: False
+
+    def predicate(target):
+        try:
+            return bool(test(get(propname, target)))
+        except TypeError:
+            # incomparable types (e.g. None < 3) simply don't match
+            return False
+    return predicate
+
+def compile_filter(node, get=None):
+    """Compile a filter AST into a predicate function that takes a single
+    target and returns True or False. "get" is a function (propname, target)
+    that extracts a property from a target; it defaults to get_prop().
+    Predicates compiled with the default getter are memoized on the AST.
+    """
+    if get is None:
+        if node._predicate is None:
+            node._predicate = _compile(node, get_prop)
+        return node._predicate
+    return _compile(node, get)
+
+def _compile(node, get):
+    if isinstance(node, Filter):
+        return _compile_comparison(node, get)
+    if isinstance(node, Not):
+        inner = _compile(node.operand, get)
+        return lambda target: not inner(target)
+    operands = tuple(_compile(operand, get) for operand in node.operands)
+    if isinstance(node, And):
+        return lambda target: all(p(target) for p in operands)
+    return lambda target: any(p(target) for p in operands)
+
+def compile_filters(filters, get=None):
+    """Compile a list of filters, as passed to get_children(), into a single
+    predicate that matches if all of them match. None, or an empty list,
+    matches everything.
+    """
+    predicates = tuple(compile_filter(f, get) for f in (filters or ()))
+    if len(predicates) == 0:
+        return lambda target: True
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda target: all(p(target) for p in predicates)
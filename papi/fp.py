@@ -29,6 +29,8 @@ Other design principles:
   its argument.
 """
 
+from collections.abc import Mapping, ItemsView, ValuesView
+
 def fmap(f, d):
     """ A generalized "map()", similar to the "fmap" function in Haskell.
     Applies the function "f" in the functor "d". For the purposes of this
@@ -62,8 +64,13 @@ def assoc(key, val, obj=None):
     """Add ("associate") "val" as "key" to "obj". "obj" should be a
     dictionary-like object; if it is None, then a new empty dict will be
     created. The return value will always be a dict, casting the original
-    argument as needed.
+    argument as needed, except when "obj" is a PMap, in which case a new PMap
+    is returned that shares structure with the original, or a LazyMap, in
+    which case a new LazyMap is returned that shares its pending values with
+    the original.
     """
+    if isinstance(obj, (PMap, LazyMap)):
+        return obj.assoc(key, val)
     new_obj = {} if obj is None else dict(obj)
     new_obj[key] = val
     return new_obj
@@ -72,16 +79,26 @@ def assocs(keyvals, obj=None):
     """Associate multiple key/value pairs into "obj". "keyvals" should be a
     list-like collection of pairs (2-tuples or other 2-element list-likes).
     """
+    if isinstance(obj, (PMap, LazyMap)):
+        return obj.assocs(keyvals)
     new_obj = obj
     for k,v in keyvals:
-        new_obj = assoc(k, v, new_obj)
+        if new_obj is obj:
+            new_obj = assoc(k, v, obj)
+        else:
+            # new_obj is our own fresh copy at this point, so we can safely
+            # update it in place instead of copying it again for every key.
+            new_obj[k] = v
     return new_obj
 
 def dissoc(key, obj):
     """Remove ("associate") "key" from "obj". "obj" should be a dictionary-like
     object. The return value will always be a dict, casting the original
-    argument as needed.
+    argument as needed, except when "obj" is a PMap or a LazyMap, in which
+    case a map of the same kind is returned.
     """
+    if isinstance(obj, (PMap, LazyMap)):
+        return obj.dissoc(key)
     new_obj = dict(obj)
     if key in new_obj:
         new_obj.pop(key)
@@ -221,15 +238,41 @@ def flatten(items):
 
 def prop(p, item):
     """Get property "p" from "item", or None if it doesn't exist.
+
+    Equivalent to prop_lens(p).get(item), but reads the property directly
+    rather than constructing a lens first.
     """
-    return prop_lens(p).get(item)
+    if item is None:
+        return None
+    return item.get(p)
+
+def _plain_path(p):
+    """Return "p" as a tuple of property names if it is a flat path that
+    consists of plain (string or integer) property names only, or None if it
+    needs the general path_lens() treatment (nested paths, spliced lenses,
+    etc.).
+    """
+    if type(p) is str:
+        return (p,)
+    if type(p) is not tuple and type(p) is not list:
+        return None
+    for key in p:
+        if type(key) is not str and type(key) is not int:
+            return None
+    return tuple(p)
 
 def path(p, item):
     """Given a list-like "p", interpret each of its elements as a property and
     follow the resulting path recursively like "prop()" does. Any failing
     property lookup along the way short-circuits the lookup and returns None.
+
+    Flat paths of plain property names are walked directly; anything else
+    goes through path_lens().
     """
-    return path_lens(p).get(item)
+    keys = _plain_path(p)
+    if keys is None:
+        return path_lens(p).get(item)
+    return _get_keys(keys, item)
 
 def assoc_path(p, value, item):
     """Associate a "value" into "item" along a "path". The semantics for the
@@ -286,6 +329,201 @@ def cat_maybes(items):
     """
     return tuple((item for item in items if item is not None))
 
+# Transducers
+#
+# A transducer transforms a reducer into another reducer; transducers compose
+# with compose() / chain(), and a composed transducer processes each item in
+# a single pass, without building intermediate collections. Note that,
+# because each transducer wraps the reducer of the *next* processing step,
+# composition order is pipeline order: chain(filtering(p), taking(10))
+# filters first and then takes.
+
+class Reduced(object):
+    """Wraps a reduction result to signal that the reduction is complete and
+    no further items should be processed.
+    """
+    def __init__(self, value):
+        self.value = value
+
+def reduced(value):
+    """Mark "value" as the final result of a reduction.
+    """
+    if isinstance(value, Reduced):
+        return value
+    return Reduced(value)
+
+class Reducer(object):
+    """A reducing function ("step"), which takes an accumulator and an item
+    and returns the new accumulator (or a Reduced to stop early), paired with
+    a completion function ("complete"), which gets called once with the final
+    accumulator and returns the result of the reduction.
+    """
+    def __init__(self, step, complete=None):
+        self.step = step
+        self.complete = complete or identity
+
+def _as_reducer(rf):
+    if isinstance(rf, Reducer):
+        return rf
+    return Reducer(rf)
+
+def transduce(xform, func, items, initial=None):
+    """Like fold(), but first transforms "func" through the transducer
+    "xform". "func" can be a plain two-argument reducing function or a
+    Reducer. Stops consuming "items" as soon as any step signals that the
+    reduction is complete (see reduced()).
+    """
+    reducer = xform(_as_reducer(func))
+    accum = initial
+    for item in (() if items is None else items):
+        accum = reducer.step(accum, item)
+        if isinstance(accum, Reduced):
+            accum = accum.value
+            break
+    return reducer.complete(accum)
+
+def _append(accum, item):
+    accum.append(item)
+    return accum
+
+def into(xform, items):
+    """Run "items" through the transducer "xform" and collect the results into
+    a tuple.
+    """
+    return transduce(xform, Reducer(_append, tuple), items, [])
+
+def mapping(f):
+    """Transducer that applies "f" to each item.
+    """
+    def xform(rf):
+        next_step = rf.step
+        def step(accum, item):
+            return next_step(accum, f(item))
+        return Reducer(step, rf.complete)
+    return xform
+
+def filtering(pred):
+    """Transducer that passes on only the items for which "pred" returns a
+    truthy value.
+    """
+    def xform(rf):
+        next_step = rf.step
+        def step(accum, item):
+            if pred(item):
+                return next_step(accum, item)
+            return accum
+        return Reducer(step, rf.complete)
+    return xform
+
+def taking(n):
+    """Transducer that passes on the first "n" items and then ends the
+    reduction. If "n" is None, all items are passed on.
+    """
+    if n is None:
+        return identity
+    def xform(rf):
+        next_step = rf.step
+        remaining = [n]
+        def step(accum, item):
+            if remaining[0] <= 0:
+                return reduced(accum)
+            remaining[0] -= 1
+            accum = next_step(accum, item)
+            if remaining[0] <= 0:
+                return reduced(accum)
+            return accum
+        return Reducer(step, rf.complete)
+    return xform
+
+def dropping(n):
+    """Transducer that skips the first "n" items and passes on the rest. If
+    "n" is None, all items are passed on.
+    """
+    if n is None or n <= 0:
+        return identity
+    def xform(rf):
+        next_step = rf.step
+        remaining = [n]
+        def step(accum, item):
+            if remaining[0] > 0:
+                remaining[0] -= 1
+                return accum
+            return next_step(accum, item)
+        return Reducer(step, rf.complete)
+    return xform
+
+class Descending(object):
+    """Wraps a value such that comparisons are reversed; useful for building
+    sort keys that mix ascending and descending components.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __gt__(self, other):
+        return other.value > self.value
+
+    def __eq__(self, other):
+        return isinstance(other, Descending) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+_ordering_chunk_size = 1024
+
+def ordering(key=None, reverse=False, limit=None):
+    """Transducer that sorts all items by "key" (like sorted(), this is a
+    stable sort), passing them on only once the input is exhausted.
+
+    If "limit" is given, only the first "limit" items of the sorted result
+    are kept: whenever the buffer grows a chunk beyond "limit", it is cut
+    back down to the best "limit" items, so memory use stays bounded no matter
+    how many items come in. For a pipeline that ends in dropping(offset) and
+    taking(count), pass offset + count.
+    """
+    key = key or identity
+    # Entries are (key, tiebreaker, item); the tiebreaker is unique, so items
+    # themselves never get compared, and it keeps the sort stable in both
+    # directions.
+    sign = -1 if reverse else 1
+
+    def xform(rf):
+        buffered = []
+        counter = [0]
+
+        def prune():
+            buffered.sort(reverse=reverse)
+            del buffered[limit:]
+
+        def step(accum, item):
+            counter[0] += 1
+            buffered.append((key(item), sign * counter[0], item))
+            if limit is not None and \
+                    len(buffered) >= limit + _ordering_chunk_size:
+                prune()
+            return accum
+
+        def complete(accum):
+            if limit is None:
+                buffered.sort(reverse=reverse)
+            else:
+                prune()
+            entries = tuple(buffered)
+            del buffered[:]
+            for entry in entries:
+                accum = rf.step(accum, entry[2])
+                if isinstance(accum, Reduced):
+                    accum = accum.value
+                    break
+            return rf.complete(accum)
+
+        return Reducer(step, complete)
+    return xform
+
 class Lens(object):
     """A Lens abstracts over a getter/setter pair and represents a "view" on
     a data object.
@@ -303,10 +541,16 @@ class Lens(object):
 
     Lenses are composable: see the compose_lens() function for a primitive
     lens combinator.
+
+    Lenses that merely drill down a path of dict properties (as created by
+    prop_lens(), path_lens() and identity_lens()) carry that path in their
+    "keys" attribute; compose_lens() uses this to fuse such lenses into a
+    single flat lens. For all other lenses, "keys" is None.
     """
-    def __init__(self, getter, setter):
+    def __init__(self, getter, setter, keys=None):
         self.getter = getter
         self.setter = setter
+        self.keys = keys
 
     def get(self, subject):
         """Apply the lens' getter to the subject.
@@ -326,6 +570,57 @@ class Lens(object):
             return subject
         return self.set(f(value), subject)
 
+def _get_keys(keys, subject):
+    """Follow a tuple of property names into "subject", returning None as soon
+    as a lookup fails.
+    """
+    for key in keys:
+        if subject is None:
+            return None
+        subject = subject.get(key)
+    return subject
+
+def _set_keys(keys, value, subject):
+    """Associate "value" into "subject" along a tuple of property names,
+    creating empty dicts for missing (or empty) intermediate levels. The
+    result is the same as that of the equivalent chain of composed
+    prop_lens() setters.
+    """
+    if len(keys) == 0:
+        return value
+    # Missing levels are created as the same kind of map as the subject.
+    empty = _empty_pmap if isinstance(subject, PMap) else {}
+    containers = []
+    current = subject
+    for key in keys[:-1]:
+        current = _or_empty(current, empty)
+        containers.append(current)
+        current = current.get(key)
+    result = assoc(keys[-1], value, _or_empty(current, empty))
+    for key, container in zip(reversed(keys[:-1]), reversed(containers)):
+        result = assoc(key, result, container)
+    return result
+
+def _or_empty(subject, empty):
+    if subject or isinstance(subject, PMap):
+        return subject
+    return empty
+
+def keys_lens(keys):
+    """Create a Lens that follows a flat tuple of property names, walking the
+    nested dicts in a single loop. This is what path_lens() and
+    compose_lens() produce for paths that consist only of property names.
+    """
+    keys = tuple(keys)
+
+    def getter(subject):
+        return _get_keys(keys, subject)
+
+    def setter(value, subject):
+        return _set_keys(keys, value, subject)
+
+    return Lens(getter, setter, keys)
+
 def prop_lens(prop_name):
     """Create a Lens that drills down into a dict-like object's named property.
     """
@@ -339,7 +634,10 @@ def prop_lens(prop_name):
             subject = {}
         return assoc(prop_name, value, subject)
 
-    return Lens(getter, setter)
+    return Lens(getter, setter, (prop_name,))
+
+_path_lens_cache = {}
+_path_lens_cache_max_size = 256
 
 def path_lens(*path):
     """Create a Lens that follows a path of properties.
@@ -372,13 +670,34 @@ def path_lens(*path):
     path_lens(lens1, lens2, lens3)
     compose_lens(lens1, compose_lens(lens2, lens3))
 
+    Compiled lenses are cached by path, so calling path_lens() repeatedly with
+    the same (hashable) path returns the same Lens object. The cache is
+    bounded; when it fills up, it is simply emptied.
     """
+    try:
+        lens = _path_lens_cache.get(path)
+    except TypeError:
+        path = flatten(path)
+        try:
+            lens = _path_lens_cache.get(path)
+        except TypeError:
+            return _compile_path_lens(path)
+    if lens is None:
+        lens = _compile_path_lens(path)
+        if len(_path_lens_cache) >= _path_lens_cache_max_size:
+            _path_lens_cache.clear()
+        _path_lens_cache[path] = lens
+    return lens
+
+def _compile_path_lens(path):
     path = flatten(path)
     def to_lens(item):
         if isinstance(item, Lens):
             return item
         else:
             return prop_lens(item)
+    if not any(isinstance(item, Lens) for item in path):
+        return keys_lens(path)
     return fold(
         compose_lens,
         map(to_lens, path),
@@ -388,7 +707,14 @@ def compose_lens(left, right):
     """Compose lenses outer-to-inner.
     The following are equivalent:
         get(compose_lens(left, right), subject) == get(left, get(right, subject))
+
+    If both lenses are plain property paths (see Lens.keys), the result is a
+    single flat lens over the combined path rather than a nested pair of
+    closures.
     """
+    if left.keys is not None and right.keys is not None:
+        return keys_lens(left.keys + right.keys)
+
     def getter(subject):
         return right.get(left.get(subject))
 
@@ -409,4 +735,409 @@ def identity_lens():
         return subject
     def setter(value, subject):
         return value
-    return Lens(getter, setter)
+    return Lens(getter, setter, ())
+
+# Persistent maps
+#
+# PMap is an immutable hash-array-mapped trie (HAMT). Each trie level
+# consumes 5 bits of a key's hash; bitmap nodes store only the occupied slots,
+# and keys whose hashes are fully equal end up in a collision node. Updating a
+# PMap copies only the nodes along the path to the affected key, so assoc and
+# dissoc run in O(log n) and share all other nodes with the original.
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+def _bitpos(h, shift):
+    return 1 << ((h >> shift) & _MASK)
+
+def _index(bitmap, bit):
+    return bin(bitmap & (bit - 1)).count('1')
+
+def _replace(entries, idx, entry):
+    return entries[:idx] + (entry,) + entries[idx + 1:]
+
+def _remove(entries, idx):
+    return entries[:idx] + entries[idx + 1:]
+
+def _same_key(a, b):
+    return a is b or a == b
+
+def _make_node(shift, h1, k1, v1, h2, k2, v2):
+    """Create the smallest subtree that holds two distinct keys.
+    """
+    if h1 == h2:
+        return _CollisionNode(h1, ((k1, v1), (k2, v2)))
+    b1 = (h1 >> shift) & _MASK
+    b2 = (h2 >> shift) & _MASK
+    if b1 == b2:
+        return _BitmapNode(
+            1 << b1,
+            (_make_node(shift + _BITS, h1, k1, v1, h2, k2, v2),))
+    if b1 < b2:
+        entries = ((k1, v1), (k2, v2))
+    else:
+        entries = ((k2, v2), (k1, v1))
+    return _BitmapNode((1 << b1) | (1 << b2), entries)
+
+def _collapse(node):
+    """If "node" holds exactly one key/value pair and nothing else, return that
+    pair, so that it can be stored inline in the parent node; otherwise return
+    the node itself.
+    """
+    if type(node) is _BitmapNode:
+        if len(node.entries) == 1 and type(node.entries[0]) is tuple:
+            return node.entries[0]
+    elif len(node.pairs) == 1:
+        return node.pairs[0]
+    return node
+
+class _BitmapNode(object):
+    """HAMT node; "entries" holds one item per set bit in "bitmap", each item
+    being either a (key, value) tuple or a child node.
+    """
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def find(self, shift, h, key, default):
+        bit = _bitpos(h, shift)
+        if not self.bitmap & bit:
+            return default
+        entry = self.entries[_index(self.bitmap, bit)]
+        if type(entry) is tuple:
+            return entry[1] if _same_key(entry[0], key) else default
+        return entry.find(shift + _BITS, h, key, default)
+
+    def assoc(self, shift, h, key, val):
+        """Returns (node, added), where "added" tells whether the key was new.
+        """
+        bit = _bitpos(h, shift)
+        idx = _index(self.bitmap, bit)
+        entries = self.entries
+        if not self.bitmap & bit:
+            return (
+                _BitmapNode(
+                    self.bitmap | bit,
+                    entries[:idx] + ((key, val),) + entries[idx:]),
+                True)
+        entry = entries[idx]
+        if type(entry) is tuple:
+            entry_key, entry_val = entry
+            if _same_key(entry_key, key):
+                if entry_val is val:
+                    return self, False
+                return (
+                    _BitmapNode(self.bitmap, _replace(entries, idx, (key, val))),
+                    False)
+            child = _make_node(
+                shift + _BITS,
+                _hash(entry_key), entry_key, entry_val,
+                h, key, val)
+            return (
+                _BitmapNode(self.bitmap, _replace(entries, idx, child)),
+                True)
+        child, added = entry.assoc(shift + _BITS, h, key, val)
+        if child is entry:
+            return self, False
+        return _BitmapNode(self.bitmap, _replace(entries, idx, child)), added
+
+    def dissoc(self, shift, h, key):
+        """Returns the new node, None if it became empty, or the node itself
+        if the key was not found.
+        """
+        bit = _bitpos(h, shift)
+        if not self.bitmap & bit:
+            return self
+        idx = _index(self.bitmap, bit)
+        entries = self.entries
+        entry = entries[idx]
+        if type(entry) is tuple:
+            if not _same_key(entry[0], key):
+                return self
+            if len(entries) == 1:
+                return None
+            return _BitmapNode(self.bitmap ^ bit, _remove(entries, idx))
+        child = entry.dissoc(shift + _BITS, h, key)
+        if child is entry:
+            return self
+        if child is None:
+            if len(entries) == 1:
+                return None
+            return _BitmapNode(self.bitmap ^ bit, _remove(entries, idx))
+        return _BitmapNode(self.bitmap, _replace(entries, idx, _collapse(child)))
+
+    def iteritems(self):
+        for entry in self.entries:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                for item in entry.iteritems():
+                    yield item
+
+class _CollisionNode(object):
+    """HAMT node for keys that share the exact same hash.
+    """
+    __slots__ = ('hash', 'pairs')
+
+    def __init__(self, h, pairs):
+        self.hash = h
+        self.pairs = pairs
+
+    def _find_index(self, key):
+        for idx, (k, v) in enumerate(self.pairs):
+            if _same_key(k, key):
+                return idx
+        return None
+
+    def find(self, shift, h, key, default):
+        idx = self._find_index(key)
+        if idx is None:
+            return default
+        return self.pairs[idx][1]
+
+    def assoc(self, shift, h, key, val):
+        if h != self.hash:
+            # A key with a different hash arrived here; push this node one
+            # level down and let a bitmap node sort them out.
+            node = _BitmapNode(_bitpos(self.hash, shift), (self,))
+            return node.assoc(shift, h, key, val)
+        idx = self._find_index(key)
+        if idx is None:
+            return _CollisionNode(h, self.pairs + ((key, val),)), True
+        if self.pairs[idx][1] is val:
+            return self, False
+        return _CollisionNode(h, _replace(self.pairs, idx, (key, val))), False
+
+    def dissoc(self, shift, h, key):
+        idx = self._find_index(key)
+        if idx is None:
+            return self
+        if len(self.pairs) == 1:
+            return None
+        return _CollisionNode(h, _remove(self.pairs, idx))
+
+    def iteritems(self):
+        return iter(self.pairs)
+
+_missing = object()
+
+class PMap(Mapping):
+    """An immutable, persistent map.
+
+    PMap implements the read-only Mapping protocol, so it can be used wherever
+    a read-only dict is expected; "updating" methods (assoc(), assocs(),
+    dissoc()) return a new PMap that shares most of its structure with the
+    original, making them O(log n) rather than O(n) like copying a dict.
+    assoc(), assocs() and dissoc() in this module, as well as the lens setters,
+    return PMaps when given PMaps.
+
+    Use to_dict() (or just dict()) to convert back to a plain dict at the
+    edges, e.g. before JSON-encoding.
+    """
+    __slots__ = ('_root', '_count')
+
+    def __init__(self, items=None):
+        other = pmap(items)
+        self._root = other._root
+        self._count = other._count
+
+    @classmethod
+    def _make(cls, root, count):
+        pm = cls.__new__(cls)
+        pm._root = root
+        pm._count = count
+        return pm
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        val = self._root.find(0, _hash(key), key, _missing)
+        if val is _missing:
+            raise KeyError(key)
+        return val
+
+    def get(self, key, default=None):
+        return self._root.find(0, _hash(key), key, default)
+
+    def __contains__(self, key):
+        return self._root.find(0, _hash(key), key, _missing) is not _missing
+
+    def __iter__(self):
+        for k, v in self._root.iteritems():
+            yield k
+
+    def items(self):
+        return _PMapItems(self)
+
+    def values(self):
+        return _PMapValues(self)
+
+    def assoc(self, key, val):
+        """Return a new PMap with "key" set to "val".
+        """
+        root, added = self._root.assoc(0, _hash(key), key, val)
+        if root is self._root:
+            return self
+        return PMap._make(root, self._count + 1 if added else self._count)
+
+    def assocs(self, keyvals):
+        """Return a new PMap with all of the (key, value) pairs in "keyvals"
+        set.
+        """
+        root = self._root
+        count = self._count
+        for key, val in keyvals:
+            root, added = root.assoc(0, _hash(key), key, val)
+            if added:
+                count += 1
+        if root is self._root:
+            return self
+        return PMap._make(root, count)
+
+    def dissoc(self, key):
+        """Return a new PMap without "key". Removing a nonexistent key
+        returns the PMap itself.
+        """
+        root = self._root.dissoc(0, _hash(key), key)
+        if root is self._root:
+            return self
+        if root is None:
+            return _empty_pmap
+        return PMap._make(root, self._count - 1)
+
+    def to_dict(self):
+        """Convert to a plain dict.
+        """
+        return dict(self._root.iteritems())
+
+    def __repr__(self):
+        return "pmap({0!r})".format(self.to_dict())
+
+class _PMapItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._root.iteritems()
+
+class _PMapValues(ValuesView):
+    def __iter__(self):
+        for k, v in self._mapping._root.iteritems():
+            yield v
+
+_empty_pmap = PMap._make(_BitmapNode(0, ()), 0)
+
+def pmap(items=None):
+    """Create a PMap from a dictionary-like object or a list-like collection of
+    key/value pairs. Calling it without arguments (or with None) produces an
+    empty PMap.
+    """
+    if isinstance(items, PMap):
+        return items
+    if items is None:
+        return _empty_pmap
+    if hasattr(items, "items") and callable(items.items):
+        items = items.items()
+    return _empty_pmap.assocs(items)
+
+# Lazy maps
+#
+# A LazyMap is a dict in which the values of some keys are computed only when
+# they are first looked up, by calling a function without arguments. Until
+# then, the dict holds a placeholder that memoises the result; copies made by
+# assoc() and assocs() share the placeholders (and are as cheap to make as
+# copying a plain dict), so each value is computed at most once, however
+# many updated copies of the map are made.
+
+class _Pending(object):
+    __slots__ = ('compute', 'value', 'done')
+
+    def __init__(self, compute):
+        self.compute = compute
+        self.done = False
+
+    def get(self):
+        if not self.done:
+            self.value = self.compute()
+            self.done = True
+        return self.value
+
+    def __repr__(self):
+        return repr(self.value) if self.done else '<pending>'
+
+class LazyMap(dict):
+    """A dict whose values for the keys of "lazy" (a dict of functions
+    without arguments) are computed on first access. Values in "items" take
+    precedence over lazy ones.
+
+    Lookups (m[key], get()), values(), items() and comparison see the
+    computed values; keys, "in" and len() work like they do for a dict. Use
+    to_dict() rather than dict() to convert a LazyMap to a plain dict, as
+    dict() copies the placeholders of values that have not been computed.
+    """
+    __slots__ = ()
+
+    def __init__(self, items=(), lazy=None):
+        dict.__init__(self, items)
+        for key, compute in (lazy or {}).items():
+            if not dict.__contains__(self, key):
+                dict.__setitem__(self, key, _Pending(compute))
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is _Pending:
+            return value.get()
+        return value
+
+    def get(self, key, default=None):
+        value = dict.get(self, key, default)
+        if type(value) is _Pending:
+            return value.get()
+        return value
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        new_obj = _new_lazy_map(LazyMap)
+        dict.update(new_obj, self)
+        return new_obj
+
+    def assoc(self, key, val):
+        new_obj = self.copy()
+        dict.__setitem__(new_obj, key, val)
+        return new_obj
+
+    def assocs(self, keyvals):
+        new_obj = self.copy()
+        for k, v in keyvals:
+            dict.__setitem__(new_obj, k, v)
+        return new_obj
+
+    def dissoc(self, key):
+        new_obj = self.copy()
+        if key in new_obj:
+            dict.__delitem__(new_obj, key)
+        return new_obj
+
+    def __repr__(self):
+        return "LazyMap({0})".format(dict.__repr__(self))
+
+_new_lazy_map = LazyMap.__new__
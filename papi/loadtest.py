@@ -0,0 +1,437 @@
+"""A load generator for WSGI applications.
+
+Sends a weighted mix of requests from a number of concurrent threads (or
+processes) for a given duration or number of requests, and reports
+throughput, latency percentiles, error rates and a per-route breakdown:
+
+    mix = [
+        {'path': '/things', 'weight': 3},
+        {'path': '/things/apple', 'headers': {'Accept': 'text/plain'}},
+        {'method': 'PUT', 'path': '/things/pear', 'body': 'A pear.',
+            'headers': {'Content-Type': 'text/plain'}},
+    ]
+    report = run_load(application, mix, concurrency=8, duration=10)
+    print(format_report(report))
+
+By default, requests call the WSGI application directly, which measures the
+application alone. With http=True, the application is served on a local
+socket by papi.server's Worker, and requests go through HTTP/1.1 (with
+keep-alive), which includes the overhead of the server and the network
+stack; a running server can be targeted with address=(host, port) instead.
+
+From the command line:
+
+    python -m papi.loadtest example.app:application --get /things \\
+        --get /things/apple --concurrency 8 --duration 10
+
+Requests that raise an exception, or get a 4xx or 5xx status, count as
+errors. In process mode, the processes are forked (where available), so
+the application does not need to be importable.
+"""
+
+import argparse
+import bisect
+import collections
+import http.client
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from urllib.parse import unquote
+
+class RequestSpec(object):
+    """One kind of request in a mix. "name" identifies it in the report;
+    it defaults to the method and path.
+    """
+    def __init__(self, method='GET', path='/', query='', headers=None,
+            body=None, weight=1, name=None):
+        self.method = method.upper()
+        self.path = path
+        self.query = query
+        self.headers = dict(headers or {})
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        self.body = body
+        self.weight = weight
+        self.name = name or '{0} {1}'.format(self.method, path)
+
+    def url(self):
+        return self.path + ('?' + self.query if self.query else '')
+
+    def environ(self):
+        """A fresh WSGI environ for this request.
+        """
+        environ = {
+            'REQUEST_METHOD': self.method,
+            # the path's bytes as latin-1 text, as WSGI servers pass it
+            'PATH_INFO': unquote(self.path, encoding='latin-1'),
+            'QUERY_STRING': self.query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'CONTENT_TYPE': '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(self.body or b''),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if self.body is not None:
+            environ['CONTENT_LENGTH'] = str(len(self.body))
+        for name, value in self.headers.items():
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                environ['HTTP_' + key] = value
+        return environ
+
+def parse_mix(mix):
+    """Turn a list of RequestSpecs, or of dicts of RequestSpec arguments,
+    into a list of RequestSpecs.
+    """
+    return [
+        spec if isinstance(spec, RequestSpec) else RequestSpec(**spec)
+        for spec in mix
+    ]
+
+def wsgi_sender(application):
+    """A function that sends a request to a WSGI application directly, and
+    returns the status code.
+    """
+    def send(spec):
+        status = []
+        def start_response(status_str, headers, exc_info=None):
+            status.append(status_str)
+        result = application(spec.environ(), start_response)
+        try:
+            for chunk in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split(None, 1)[0])
+    return send
+
+def http_sender(host, port, timeout=30):
+    """A function that sends a request over HTTP, on one keep-alive
+    connection per thread, and returns the status code.
+    """
+    local = threading.local()
+    def send(spec):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = \
+                http.client.HTTPConnection(host, port, timeout=timeout)
+        try:
+            connection.request(
+                spec.method, spec.url(), body=spec.body, headers=spec.headers)
+            response = connection.getresponse()
+            response.read()
+        except Exception:
+            connection.close()
+            local.connection = None
+            raise
+        if response.will_close:
+            connection.close()
+            local.connection = None
+        return response.status
+    return send
+
+def load_loop(send, mix, seed, deadline=None, count=None):
+    """Send requests from the mix, picked at random by weight, until the
+    deadline (a time.perf_counter() timestamp) or "count" requests. Returns
+    (latencies, statuses): latencies per mix index, in seconds, and counts
+    per (mix index, status), where the status is None for exceptions.
+    """
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(spec.weight for spec in mix))
+    total_weight = cum_weights[-1]
+    latencies = collections.defaultdict(list)
+    statuses = collections.Counter()
+    clock = time.perf_counter
+    sent = 0
+    while True:
+        if count is not None and sent >= count:
+            break
+        if deadline is not None and clock() >= deadline:
+            break
+        i = bisect.bisect_right(cum_weights, rng.random() * total_weight)
+        i = min(i, len(mix) - 1)
+        started = clock()
+        try:
+            status = send(mix[i])
+        except Exception:
+            status = None
+        latencies[i].append(clock() - started)
+        statuses[(i, status)] += 1
+        sent += 1
+    return dict(latencies), dict(statuses)
+
+def _process_main(queue, send, mix, seed, deadline, count):
+    try:
+        queue.put(load_loop(send, mix, seed, deadline, count))
+    except BaseException as e:
+        queue.put(e)
+
+def percentile(sorted_values, q):
+    """The q-th quantile (0 < q <= 1) of sorted values, by the nearest-rank
+    method.
+    """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(q * len(sorted_values)))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+percentiles = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('p999', 0.999))
+
+def is_error(status):
+    return status is None or status >= 400
+
+def summarize(latencies, statuses, elapsed):
+    """Summarize the latencies (in seconds) and statuses of a set of
+    requests that took "elapsed" seconds.
+    """
+    latencies = sorted(latencies)
+    requests = len(latencies)
+    errors = sum(n for status, n in statuses.items() if is_error(status))
+    summary = {
+        'requests': requests,
+        'throughput': requests / elapsed if elapsed > 0 else 0.0,
+        'errors': errors,
+        'error_rate': errors / requests if requests else 0.0,
+        'statuses': dict(
+            ('exception' if status is None else str(status), n)
+            for status, n in sorted(
+                statuses.items(), key=lambda kv: (kv[0] is None, kv[0]))),
+        'latency': {
+            'mean': sum(latencies) / requests if requests else None,
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+    for name, q in percentiles:
+        summary['latency'][name] = percentile(latencies, q)
+    return summary
+
+def make_report(mix, results, elapsed):
+    """Merge per-worker (latencies, statuses) results into a report: a
+    summary (see summarize()) of all requests, plus "elapsed" and a "routes"
+    dict with a summary per request name.
+    """
+    route_latencies = collections.defaultdict(list)
+    route_statuses = collections.defaultdict(collections.Counter)
+    for latencies, statuses in results:
+        for i, values in latencies.items():
+            route_latencies[mix[i].name].extend(values)
+        for (i, status), n in statuses.items():
+            route_statuses[mix[i].name][status] += n
+    all_statuses = collections.Counter()
+    for statuses in route_statuses.values():
+        all_statuses.update(statuses)
+    report = summarize(
+        itertools.chain.from_iterable(route_latencies.values()),
+        all_statuses, elapsed)
+    report['elapsed'] = elapsed
+    report['routes'] = dict(
+        (name, summarize(values, route_statuses[name], elapsed))
+        for name, values in route_latencies.items())
+    return report
+
+def run_load(application=None, mix=(), concurrency=8, duration=None,
+        requests=None, processes=False, http=False, address=None, seed=0):
+    """Run a load test (see the module documentation), and return a report
+    (see make_report()).
+
+    Args:
+        application: the WSGI application (not needed with "address").
+        mix: the requests to send, as RequestSpecs or dicts.
+        concurrency: the number of threads (or processes) sending requests.
+        duration: how long to run, in seconds.
+        requests: how many requests to send in total (if no duration is
+            given; defaults to 1000).
+        processes: send from processes rather than threads.
+        http: serve the application on a local socket, and send requests
+            over HTTP.
+        address: a (host, port) to send requests to over HTTP, instead.
+        seed: seed for picking requests from the mix, so that runs are
+            repeatable.
+    """
+    mix = parse_mix(mix)
+    if not mix:
+        raise ValueError('empty request mix')
+    if duration is None and requests is None:
+        requests = 1000
+    counts = [None] * concurrency
+    if duration is None:
+        counts = [
+            requests // concurrency + (1 if i < requests % concurrency else 0)
+            for i in range(concurrency)]
+    worker = None
+    if http and address is None:
+        from papi.server import Worker, make_listener
+        worker = Worker(make_listener('127.0.0.1', 0), application,
+            threads=concurrency)
+        worker_thread = threading.Thread(target=worker.serve, daemon=True)
+        worker_thread.start()
+        address = (worker.server_name, worker.server_port)
+    if address is not None:
+        send = http_sender(*address)
+    else:
+        send = wsgi_sender(application)
+    try:
+        started = time.perf_counter()
+        deadline = None if duration is None else started + duration
+        if processes:
+            results = run_processes(send, mix, seed, deadline, counts)
+        else:
+            results = run_threads(send, mix, seed, deadline, counts)
+        elapsed = time.perf_counter() - started
+    finally:
+        if worker is not None:
+            worker.stop()
+            worker_thread.join()
+            worker.listener.close()
+    return make_report(mix, results, elapsed)
+
+def run_threads(send, mix, seed, deadline, counts):
+    results = [None] * len(counts)
+    def target(i):
+        results[i] = load_loop(send, mix, seed + i, deadline, counts[i])
+    threads = [
+        threading.Thread(target=target, args=(i,))
+        for i in range(len(counts))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def run_processes(send, mix, seed, deadline, counts):
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in methods else None)
+    queue = context.Queue()
+    # time.perf_counter() is system-wide on the platforms that fork, so the
+    # deadline carries over into the child processes
+    processes = [
+        context.Process(target=_process_main,
+            args=(queue, send, mix, seed + i, deadline, counts[i]))
+        for i in range(len(counts))
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for process in processes]
+    for process in processes:
+        process.join()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+def format_ms(seconds):
+    return '-' if seconds is None else '{0:.2f}'.format(seconds * 1e3)
+
+def format_report(report):
+    """Format a report as a human-readable table.
+    """
+    lines = [
+        '{0} requests in {1:.2f}s: {2:.1f} req/s, {3} errors ({4:.2%})'.format(
+            report['requests'], report['elapsed'], report['throughput'],
+            report['errors'], report['error_rate']),
+        'statuses: ' + ', '.join(
+            '{0}: {1}'.format(status, n)
+            for status, n in report['statuses'].items()),
+        '',
+    ]
+    columns = ['requests', 'req/s', 'errors'] + \
+        [name for name, q in percentiles] + ['max']
+    width = max([5] + [len(name) for name in report['routes']])
+    lines.append('{0:<{1}}'.format('route', width) + ''.join(
+        '{0:>10}'.format(c) for c in columns) + '   (latencies in ms)')
+    rows = sorted(report['routes'].items()) + [('all', report)]
+    for name, summary in rows:
+        latency = summary['latency']
+        lines.append('{0:<{1}}'.format(name, width) + ''.join(
+            '{0:>10}'.format(value) for value in
+            [summary['requests'], '{0:.1f}'.format(summary['throughput']),
+                summary['errors']] +
+            [format_ms(latency[name]) for name, q in percentiles] +
+            [format_ms(latency['max'])]))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m papi.loadtest',
+        description='Send a mix of requests to a WSGI application, and '
+                    'report throughput and latencies.')
+    parser.add_argument('application', nargs='?',
+        help='the application, as "module:attribute"')
+    parser.add_argument('--mix',
+        help='a JSON file holding a list of requests, with the keys '
+             '"method", "path", "query", "headers", "body", "weight" and '
+             '"name" (all optional)')
+    parser.add_argument('--get', action='append', default=[],
+        metavar='PATH[?QUERY]',
+        help='add a GET request to the mix (can be repeated)')
+    parser.add_argument('--accept', default='application/json',
+        help='Accept header for --get requests (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float,
+        help='seconds to run for')
+    parser.add_argument('--requests', type=int,
+        help='number of requests to send (default: 1000, if no duration)')
+    parser.add_argument('--processes', action='store_true',
+        help='send requests from processes rather than threads')
+    parser.add_argument('--http', action='store_true',
+        help='serve the application on a local socket, and send requests '
+             'over HTTP')
+    parser.add_argument('--address', metavar='HOST:PORT',
+        help='send requests over HTTP to a running server instead')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true',
+        help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    mix = []
+    if args.mix:
+        with open(args.mix) as f:
+            mix.extend(json.load(f))
+    for url in args.get:
+        path, _, query = url.partition('?')
+        mix.append({'path': path, 'query': query,
+            'headers': {'Accept': args.accept}})
+    if not mix:
+        parser.error('no requests: use --mix and/or --get')
+    application = None
+    address = None
+    if args.address:
+        host, _, port = args.address.rpartition(':')
+        address = (host.strip('[]') or '127.0.0.1', int(port))
+    elif args.application:
+        from papi.server import load_application
+        application = load_application(args.application)
+    else:
+        parser.error('an application or --address is required')
+    report = run_load(application, mix,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        requests=args.requests,
+        processes=args.processes,
+        http=args.http,
+        address=address,
+        seed=args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+
+if __name__ == '__main__':
+    main()
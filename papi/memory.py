@@ -0,0 +1,132 @@
+"""Per-request memory accounting, using tracemalloc.
+
+When serve_resource() gets a memory_callback, each request gets a
+MemoryTimer instead of a plain PhaseTimer (see papi.timing), which records,
+along with the time, the memory used by each phase:
+
+- allocated: the net number of bytes allocated (and not freed again)
+- peak: the highest traced memory reached, relative to the start of the
+  phase
+- blocks: the net number of memory blocks allocated, as counted by
+  sys.getallocatedblocks()
+
+For the request as a whole, the same numbers are reported as the "total"
+phase. tracemalloc is started on the first request if it is not running
+yet; it slows Python down considerably, so this is meant for tests,
+benchmarks and debugging rather than production. tracemalloc measures the
+whole process, so the numbers are only accurate when requests are served
+one at a time.
+
+measure() does the same for a whole WSGI request, from the outside.
+"""
+
+import gc
+import sys
+import tracemalloc
+from papi.timing import PhaseTimer
+
+class MemoryTimer(PhaseTimer):
+    """A PhaseTimer that also accounts for the memory used by each phase.
+    """
+    def __init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # phases in progress, as [peak, current at start, blocks at start]
+        self.frames = []
+        self.usage = {}
+        tracemalloc.reset_peak()
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start_memory
+        self.start_blocks = sys.getallocatedblocks()
+        PhaseTimer.__init__(self)
+
+    def fold_peak(self):
+        """Fold the peak traced memory since the last reset into the request
+        and all phases in progress, and start over; this lets nested phases
+        each have their own peak.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self.frames:
+            frame[0] = max(frame[0], peak)
+        self.peak = max(self.peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def add_usage(self, phase, allocated, peak, blocks):
+        usage = self.usage.get(phase)
+        if usage is None:
+            self.usage[phase] = {
+                'allocated': allocated, 'peak': peak, 'blocks': blocks}
+        else:
+            usage['allocated'] += allocated
+            usage['peak'] = max(usage['peak'], peak)
+            usage['blocks'] += blocks
+
+    def call(self, phase, f, *args, **kwargs):
+        current = self.fold_peak()
+        frame = [current, current, sys.getallocatedblocks()]
+        self.frames.append(frame)
+        try:
+            return PhaseTimer.call(self, phase, f, *args, **kwargs)
+        finally:
+            current = self.fold_peak()
+            self.frames.pop()
+            self.add_usage(phase,
+                current - frame[1],
+                frame[0] - frame[1],
+                sys.getallocatedblocks() - frame[2])
+
+    def mark(self, phase):
+        PhaseTimer.mark(self, phase)
+        current = self.fold_peak()
+        self.add_usage(phase,
+            current - self.start_memory,
+            self.peak - self.start_memory,
+            sys.getallocatedblocks() - self.start_blocks)
+
+    def memory_usage(self):
+        """The phases and their memory usage, as a list of (phase, usage)
+        pairs, in the order in which the phases were first seen; "usage" is
+        a dict with the keys "allocated", "peak" and "blocks".
+        """
+        return list(self.usage.items())
+
+def measure(application, environ):
+    """Run a WSGI request (including iterating over the response body)
+    under tracemalloc, and return (status, usage), where usage is a dict
+    like the ones MemoryTimer records. Garbage is collected before and after
+    the request, so that "allocated" is the memory that the request left
+    behind.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    response = {}
+    def start_response(status, headers):
+        response['status'] = status
+    try:
+        gc.collect()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start_blocks = sys.getallocatedblocks()
+        # middlewares may store things in the environ; a copy keeps them
+        # from counting as left behind
+        environ = dict(environ)
+        body = application(environ, start_response)
+        chunk = None
+        for chunk in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+        del body, chunk, environ
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        usage = {
+            'allocated': current - start_memory,
+            'peak': peak - start_memory,
+            'blocks': sys.getallocatedblocks() - start_blocks,
+        }
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return response.get('status'), usage
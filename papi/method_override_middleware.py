@@ -1,16 +1,21 @@
-from urllib.parse import parse_qsl
+from papi.request import get_request
 import papi.fp as fp
 
 def method_override_middleware(application):
+    """WSGI-level middleware that lets clients override the request method
+    through a "_method" query string parameter or an X-Method-Override
+    header. The override goes into the request (see papi.request), reusing
+    its parsed query string; the environ's REQUEST_METHOD is left alone.
+    WSGI middleware sees the original method, along with the parameter or
+    header that overrides it; papi.capture, for instance, records both, so
+    that replayed requests are overridden again.
+    """
     def wrapped(environ, start_response):
-        query = dict(
-                    parse_qsl(
-                        environ['QUERY_STRING'],
-                        keep_blank_values=True))
+        request = get_request(environ)
         method_override = \
-            fp.prop('_method', query) or \
-            fp.prop('HTTP_X_METHOD_OVERRIDE', environ) or \
-            fp.prop('REQUEST_METHOD', environ)
-        new_environ = fp.assoc('REQUEST_METHOD', method_override, environ)
-        return application(new_environ, start_response)
+            fp.prop('_method', request['query']) or \
+            fp.prop('HTTP_X_METHOD_OVERRIDE', environ)
+        if method_override:
+            request['method'] = method_override
+        return application(environ, start_response)
     return wrapped
@@ -0,0 +1,308 @@
+"""Request metrics, and a resource that exposes them in the Prometheus text
+format.
+
+A MetricsRegistry passed to serve_resource() records, for each request:
+
+- the number of requests, by route, method and status class ("2xx" etc.)
+- a latency histogram, and the time spent in each phase (see papi.timing)
+- a histogram of response body sizes (for bodies that are not streamed)
+
+Requests are keyed by a route template rather than the raw path: each path
+segment is replaced by the class name of the resource it resolved to, so
+that /things/apple and /things/banana both count as
+"/{DictResource}/{DictResource}". Segments resolved in one go by
+resolve_path() show up as "{*}" (except for the last one), and a segment
+that was not found as "{?}".
+
+Methods are counted in upper case; since clients can send any method (or
+override it, see papi.method_override_middleware), methods other than the
+standard ones are all counted as "OTHER", which keeps the number of series
+bounded.
+
+Other counters, such as SingleFlight's, can be added with add_counters().
+
+Recording is lock-free: each thread updates its own statistics, which are
+only merged when the metrics are collected. To expose them, mount a
+MetricsResource somewhere in the resource tree:
+
+    metrics = MetricsRegistry()
+    root.children['metrics'] = MetricsResource(metrics)
+    application = serve_resource(root, metrics=metrics)
+"""
+
+import threading
+
+def status_class(code):
+    return '{0}xx'.format(code // 100)
+
+known_methods = frozenset(
+    ['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS'])
+
+def method_label(method):
+    """The label value for a request method: the method in upper case, or
+    "OTHER" for nonstandard ones; an empty method (for requests that were
+    never parsed) stays empty.
+    """
+    if not method:
+        return ''
+    method = method.upper()
+    return method if method in known_methods else 'OTHER'
+
+def route_template(route):
+    """Format a route (a list of class names, one per consumed path segment)
+    as a template string.
+    """
+    return '/' + '/'.join('{' + name + '}' for name in route)
+
+class _ThreadStats(object):
+    """The statistics recorded by a single thread.
+    """
+    def __init__(self):
+        self.requests = {}
+        self.phases = {}
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets)
+
+class MetricsRegistry(object):
+    """Collects request metrics (see the module documentation).
+    """
+    latency_buckets = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0)
+    size_buckets = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+    def __init__(self, prefix='papi'):
+        self.prefix = prefix
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.thread_stats = []
+        self.counter_sources = {}
+
+    def stats(self):
+        """The calling thread's statistics.
+        """
+        stats = getattr(self.local, 'stats', None)
+        if stats is None:
+            stats = _ThreadStats()
+            self.local.stats = stats
+            with self.lock:
+                self.thread_stats.append(stats)
+        return stats
+
+    def observe_request(self, route, method, status, seconds, size=None,
+            timings=None):
+        """Record a finished request. "route" is a route template, "status"
+        the numeric status code, "size" the body size in bytes (None if
+        unknown), and "timings" a list of (phase, seconds) pairs.
+        """
+        stats = self.stats()
+        key = (route, method_label(method), status_class(status))
+        entry = stats.requests.get(key)
+        if entry is None:
+            entry = stats.requests[key] = [
+                0,
+                [0] * (len(self.latency_buckets) + 1), 0.0,
+                [0] * (len(self.size_buckets) + 1), 0, 0,
+            ]
+        entry[0] += 1
+        entry[1][_bucket_index(self.latency_buckets, seconds)] += 1
+        entry[2] += seconds
+        if size is not None:
+            entry[3][_bucket_index(self.size_buckets, size)] += 1
+            entry[4] += size
+            entry[5] += 1
+        for phase, duration in (timings or ()):
+            if phase != 'total':
+                phase_key = (route, phase)
+                stats.phases[phase_key] = \
+                    stats.phases.get(phase_key, 0.0) + duration
+
+    def add_counters(self, name, counters, label, help=''):
+        """Expose a dict-like of counters (such as a collections.Counter) as
+        a counter metric called "name", with the counters' keys as values of
+        the label "label". Adding counters under an existing name replaces
+        them.
+        """
+        self.counter_sources[name] = (counters, label, help)
+
+    def merged(self):
+        """Merge all threads' statistics; returns (requests, phases) dicts
+        shaped like the per-thread ones.
+        """
+        with self.lock:
+            thread_stats = list(self.thread_stats)
+        requests = {}
+        phases = {}
+        for stats in thread_stats:
+            for key, entry in list(stats.requests.items()):
+                total = requests.get(key)
+                if total is None:
+                    requests[key] = [
+                        entry[0], list(entry[1]), entry[2],
+                        list(entry[3]), entry[4], entry[5]]
+                else:
+                    total[0] += entry[0]
+                    total[1] = [a + b for a, b in zip(total[1], entry[1])]
+                    total[2] += entry[2]
+                    total[3] = [a + b for a, b in zip(total[3], entry[3])]
+                    total[4] += entry[4]
+                    total[5] += entry[5]
+            for key, duration in list(stats.phases.items()):
+                phases[key] = phases.get(key, 0.0) + duration
+        return requests, phases
+
+    def collect(self):
+        """Collect all metrics, as a list of metric families: dicts with a
+        "name", "type", "help", and "samples", a list of
+        [name, labels, value] triples.
+        """
+        requests, phases = self.merged()
+        prefix = self.prefix
+        families = []
+
+        samples = []
+        for (route, method, status), entry in sorted(requests.items()):
+            labels = {'route': route, 'method': method, 'status': status}
+            samples.append([prefix + '_requests_total', labels, entry[0]])
+        families.append({
+            'name': prefix + '_requests_total',
+            'type': 'counter',
+            'help': 'Requests served, by route template and status class.',
+            'samples': samples,
+        })
+
+        samples = []
+        for (route, method, status), entry in sorted(requests.items()):
+            labels = {'route': route, 'method': method}
+            samples.extend(histogram_samples(
+                prefix + '_request_duration_seconds', labels,
+                self.latency_buckets, entry[1], entry[2], entry[0]))
+        families.append({
+            'name': prefix + '_request_duration_seconds',
+            'type': 'histogram',
+            'help': 'Request latency, up to the start of the response body.',
+            'samples': merge_histogram_samples(samples),
+        })
+
+        samples = []
+        for (route, method, status), entry in sorted(requests.items()):
+            if entry[5]:
+                labels = {'route': route, 'method': method}
+                samples.extend(histogram_samples(
+                    prefix + '_response_size_bytes', labels,
+                    self.size_buckets, entry[3], entry[4], entry[5]))
+        families.append({
+            'name': prefix + '_response_size_bytes',
+            'type': 'histogram',
+            'help': 'Response body sizes (streamed bodies are not counted).',
+            'samples': merge_histogram_samples(samples),
+        })
+
+        families.append({
+            'name': prefix + '_request_phase_seconds_total',
+            'type': 'counter',
+            'help': 'Time spent in each phase of serving requests.',
+            'samples': [
+                [prefix + '_request_phase_seconds_total',
+                    {'route': route, 'phase': phase}, duration]
+                for (route, phase), duration in sorted(phases.items())
+            ],
+        })
+
+        for name, (counters, label, help) in sorted(
+                self.counter_sources.items()):
+            families.append({
+                'name': name,
+                'type': 'counter',
+                'help': help,
+                'samples': [
+                    [name, {label: str(key)}, value]
+                    for key, value in sorted(
+                        list(counters.items()), key=lambda kv: str(kv[0]))
+                ],
+            })
+        return families
+
+def histogram_samples(name, labels, buckets, counts, total, count):
+    samples = []
+    cumulative = 0
+    for bound, n in zip(list(buckets) + ['+Inf'], counts):
+        cumulative += n
+        bucket_labels = dict(labels)
+        bucket_labels['le'] = str(bound)
+        samples.append([name + '_bucket', bucket_labels, cumulative])
+    samples.append([name + '_sum', labels, total])
+    samples.append([name + '_count', labels, count])
+    return samples
+
+def merge_histogram_samples(samples):
+    """Add up samples with the same name and labels; histograms are recorded
+    per status class, but exposed per route and method only.
+    """
+    merged = {}
+    order = []
+    for name, labels, value in samples:
+        key = (name, tuple(sorted(labels.items())))
+        if key in merged:
+            merged[key][2] += value
+        else:
+            merged[key] = [name, labels, value]
+            order.append(key)
+    return [merged[key] for key in order]
+
+def escape_label_value(value):
+    return str(value) \
+        .replace('\\', '\\\\') \
+        .replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def prometheus_text(families):
+    """Render metric families (see MetricsRegistry.collect()) in the
+    Prometheus text exposition format.
+    """
+    lines = []
+    for family in families:
+        lines.append('# HELP {0} {1}'.format(
+            family['name'], family['help'].replace('\n', ' ')))
+        lines.append('# TYPE {0} {1}'.format(family['name'], family['type']))
+        for name, labels, value in family['samples']:
+            if labels:
+                label_str = '{' + ','.join(
+                    '{0}="{1}"'.format(k, escape_label_value(v))
+                    for k, v in labels.items()) + '}'
+            else:
+                label_str = ''
+            lines.append('{0}{1} {2}'.format(
+                name, label_str, format_value(value)))
+    return ('\n'.join(lines) + '\n').encode('utf8')
+
+def prometheus_writer(body, **query):
+    """Response writer that renders a MetricsResource's body as Prometheus
+    text; other formats (such as JSON) get the body as is.
+    """
+    return prometheus_text(body.get('metrics') or [])
+
+class MetricsResource(object):
+    """A read-only resource that exposes a MetricsRegistry's metrics: in the
+    Prometheus text format for text/plain (as requested by Prometheus
+    scrapers), or as structured data for JSON.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def get_structured_body(self, **kwargs):
+        return {'metrics': self.registry.collect()}
+
+    def get_response_writers(self):
+        return [(self.content_type, prometheus_writer)]
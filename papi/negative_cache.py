@@ -0,0 +1,147 @@
+"""A negative lookup cache for paths that do not exist.
+
+Scanners and broken clients tend to request the same nonexistent URLs over
+and over, and each such request walks the resource tree with get_child()
+down to the first segment that does not exist. With a NegativeCache, papi
+remembers the paths for which get_child() returned None, and answers later
+requests for such a path, or for any path below it, with a 404 right away,
+without asking the parent again:
+
+    application = serve_resource(root, negative_cache=NegativeCache(10000))
+
+Writes through papi (PUT, POST, DELETE and bulk writes) invalidate the
+entries at and below the path they write to, in the cache of the process
+that handles them. Changes that bypass that cache are not seen: writes
+handled by other processes (such as the other workers of a
+papi.server.Master, which each have a cache of their own), or by other
+programs writing to the same database. Pass a "ttl" to bound how long a
+path is considered missing, or call invalidate() yourself. Without a ttl,
+requests from multi-process servers (whose WSGI environ has
+"wsgi.multiprocess" set, as papi.server's workers do) fall back to
+"multiprocess_ttl", 60 seconds by default, so that they never cache a
+missing path forever.
+
+Since entries are shared by all requests, the cache is only correct for
+trees that look the same to every client; do not use it if an API
+middleware hands different clients different resources.
+"""
+
+import collections
+import threading
+import time
+
+class NegativeCache(object):
+    """A bounded, least-recently-used set of missing paths (tuples of path
+    segments).
+
+    Args:
+        max_entries: the number of paths to remember; the least recently
+            used path is evicted to make room for a new one.
+        ttl: how long, in seconds, a path stays in the cache; None keeps it
+            until it is evicted or invalidated, unless it was added for a
+            request from a multi-process server.
+        multiprocess_ttl: the ttl for paths added for requests from
+            multi-process servers when "ttl" is None; it cannot be None, as
+            writes handled by other processes do not invalidate entries.
+        clock: a function returning the current time in seconds.
+
+    The "metrics" attribute counts "hits" (lookups of a cached path),
+    "misses" (lookups of a path that was not cached), "stores", "evictions",
+    "expirations" and "invalidations" (entries dropped by invalidate()).
+    """
+    def __init__(self, max_entries=10000, ttl=None, multiprocess_ttl=60.0,
+            clock=time.monotonic):
+        if multiprocess_ttl is None:
+            raise ValueError('multiprocess_ttl must be a number of seconds')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.multiprocess_ttl = multiprocess_ttl
+        self.clock = clock
+        self.metrics = collections.Counter()
+        self.lock = threading.Lock()
+        # path -> expiry time (or None), least recently used first
+        self.entries = collections.OrderedDict()
+        # path -> set of the cached paths below it (at any depth), for
+        # every proper prefix of a cached path; lets invalidate() visit only
+        # the affected entries
+        self.below = {}
+        # bumped by every invalidation; see add()
+        self.generation = 0
+
+    def lookup(self, path):
+        """Check whether a path is known to be missing.
+        """
+        path = tuple(path)
+        with self.lock:
+            try:
+                expiry = self.entries[path]
+            except KeyError:
+                self.metrics['misses'] += 1
+                return False
+            if expiry is not None and expiry <= self.clock():
+                self._remove(path)
+                self.metrics['expirations'] += 1
+                self.metrics['misses'] += 1
+                return False
+            self.entries.move_to_end(path)
+            self.metrics['hits'] += 1
+            return True
+
+    def add(self, path, generation=None, multiprocess=False):
+        """Remember a missing path. If "generation" is given, it should be
+        the value of the "generation" attribute from before the path was
+        looked up in the tree; if an invalidation has happened since, the
+        path may have been created meanwhile, and is not added.
+        "multiprocess" tells whether the path was looked up for a request
+        from a multi-process server.
+        """
+        path = tuple(path)
+        if not path:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            ttl = self.ttl
+            if ttl is None and multiprocess:
+                ttl = self.multiprocess_ttl
+            expiry = None if ttl is None else self.clock() + ttl
+            if path not in self.entries:
+                for i in range(len(path)):
+                    self.below.setdefault(path[:i], set()).add(path)
+            self.entries[path] = expiry
+            self.entries.move_to_end(path)
+            self.metrics['stores'] += 1
+            while len(self.entries) > self.max_entries:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.metrics['evictions'] += 1
+
+    def invalidate(self, prefix=()):
+        """Forget the missing paths that start with "prefix" (all of them,
+        by default); returns how many were dropped. Only the entries that
+        are dropped are visited.
+        """
+        prefix = tuple(prefix)
+        with self.lock:
+            self.generation += 1
+            stale = list(self.below.get(prefix, ()))
+            if prefix in self.entries:
+                stale.append(prefix)
+            for path in stale:
+                self._remove(path)
+            self.metrics['invalidations'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.invalidate()
+
+    def _remove(self, path):
+        del self.entries[path]
+        for i in range(len(path)):
+            paths = self.below[path[:i]]
+            paths.discard(path)
+            if not paths:
+                del self.below[path[:i]]
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,80 @@
+"""Helpers for implementing order= in a resource's get_children().
+
+get_children() receives the requested ordering as a list of
+(descending, propname) pairs, most significant first. Rather than sorting
+once per pair, order_key() builds a single composite sort key that honors
+each pair's direction, and order_page() uses it to produce one page of
+results, switching to a heap-based partial sort when the page is small
+compared to the whole collection:
+
+    def get_children(self, offset=None, count=20, filters=None, order=None,
+            *args, **kwargs):
+        return order_page(self.children.items(), order, offset, count,
+            get=lambda propname, item: item[1].get_prop(propname))
+
+Property values of different types are ordered deterministically (see
+sort_key()); in particular, missing (None) values come first in ascending
+order and last in descending order.
+"""
+
+import heapq
+import itertools
+import papi.fp as fp
+from papi.filters import get_prop
+
+def sort_key(value):
+    """Turn a property value into a key that can be ordered against the keys
+    of any other value: None sorts first, then booleans and numbers, then
+    strings, then anything else (by its repr()).
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, repr(value))
+
+def order_key(order, get=None):
+    """Build a key function for sorted() and friends from a list of
+    (descending, propname) pairs. "get" is a function (propname, item) that
+    extracts a property from an item; it defaults to
+    papi.filters.get_prop().
+    """
+    get = get or get_prop
+    order = tuple(order)
+    if len(order) == 1:
+        descending, propname = order[0]
+        if descending:
+            return lambda item: fp.Descending(sort_key(get(propname, item)))
+        return lambda item: sort_key(get(propname, item))
+    def key(item):
+        return tuple(
+            fp.Descending(sort_key(get(propname, item)))
+            if descending
+            else sort_key(get(propname, item))
+            for descending, propname in order)
+    return key
+
+# A heap is used when the requested page (offset + count) is less than this
+# fraction of the items; otherwise, a full sort is faster.
+heap_ratio = 0.125
+
+def order_page(items, order, offset=None, count=None, get=None):
+    """Order "items" according to "order" (a list of (descending, propname)
+    pairs, or None to keep the original order), and return the "count" items
+    starting at "offset" as a list. The sort is stable.
+    """
+    offset = offset or 0
+    if not order:
+        stop = None if count is None else offset + count
+        return list(itertools.islice(items, offset, stop))
+    key = order_key(order, get)
+    if count is None:
+        return sorted(items, key=key)[offset:]
+    limit = offset + count
+    if hasattr(items, '__len__') and limit >= len(items) * heap_ratio:
+        ordered = sorted(items, key=key)
+    else:
+        ordered = heapq.nsmallest(limit, items, key=key)
+    return ordered[offset:limit]
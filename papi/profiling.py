@@ -0,0 +1,236 @@
+"""Sampling request profiler.
+
+Profiler is an API middleware that runs cProfile on a fraction of requests,
+and/or on all requests whose path starts with one of a set of prefixes:
+
+    profiler = Profiler('/var/tmp/papi-profiles', rate=0.001,
+        path_prefixes=['/reports'])
+    application = serve_resource(root, api_middleware=profiler)
+
+Profiles are aggregated per method and route template (see papi.metrics),
+and the route's aggregate is written to a .pstats file in the profile
+directory (one file per route and process, so that prefork workers do not
+overwrite each other's profiles). To keep disk writes off the requests'
+latency, a route's file is written at most once per "save_interval" seconds:
+profiles taken in between are written along with a later profiled request,
+or by flush(). Errors writing profiles are logged, and never fail the
+request. Disk usage is bounded: when the directory holds more than
+"max_files" profiles or "max_bytes" bytes, the least recently written
+profiles are removed. load_stats() merges the profiles back into a single
+pstats.Stats.
+
+At most one request per process is profiled at a time; other requests that
+are selected while a profile is running are served without profiling. The
+profile covers the handler, up to the point where the response body is
+returned (streamed bodies are not included), and only the thread that
+serves the request.
+"""
+
+import collections
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import papi.fp as fp
+from papi.metrics import method_label, route_template
+
+logger = logging.getLogger(__name__)
+
+def profile_name(method, route):
+    """A file name for the profile of a route template, e.g.
+    "GET_ListResource_ItemResource".
+    """
+    name = method + '_' + route.replace('*', 'any').replace('?', 'missing')
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_')
+
+def profile_files(directory):
+    return [
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith('.pstats')
+    ]
+
+def load_stats(directory, name=None):
+    """Merge the profiles in "directory" (only those of the route "name", as
+    returned by profile_name(), if given) into a pstats.Stats; returns None
+    if there are none.
+    """
+    files = sorted(
+        f for f in profile_files(directory)
+        if name is None or os.path.basename(f).split('.')[0] == name)
+    if not files:
+        return None
+    return pstats.Stats(*files)
+
+class Profiler(object):
+    """API middleware that profiles a sample of requests (see the module
+    documentation).
+
+    Args:
+        directory: where to write the .pstats files; created if needed.
+        rate: the fraction of requests to profile, from 0 to 1.
+        path_prefixes: profile all requests whose path (a string like
+            '/things/apple') starts with any of these.
+        max_files: the maximum number of .pstats files in the directory.
+        max_bytes: the maximum total size of the .pstats files.
+        save_interval: the minimum time, in seconds, between two writes of
+            a route's profile.
+        api_middleware: an inner API middleware to run the handler through.
+        clock: a function returning the current time in seconds.
+
+    The "metrics" attribute counts "profiled" requests, "busy" requests
+    (selected while another profile was running), "saved" and "evicted"
+    files, and "save_errors".
+    """
+    def __init__(self,
+            directory,
+            rate=0.0,
+            path_prefixes=(),
+            max_files=100,
+            max_bytes=50 * 2**20,
+            save_interval=10.0,
+            api_middleware=None,
+            clock=time.monotonic):
+        self.directory = directory
+        self.rate = rate
+        self.path_prefixes = tuple(path_prefixes)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.save_interval = save_interval
+        self.api_middleware = api_middleware
+        self.clock = clock
+        self.random = random.Random()
+        self.metrics = collections.Counter()
+        # guards "metrics", which requests that find "lock" taken update too
+        self.metrics_lock = threading.Lock()
+        # held while a profile runs; also guards the attributes below and
+        # the directory
+        self.lock = threading.Lock()
+        self.stats = {}
+        # route name -> when its profile was last written
+        self.saved = {}
+        # routes with profiles that have not been written yet
+        self.unsaved = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def handle(self, handle, resource, request):
+        if self.api_middleware is None:
+            return handle(resource, request)
+        return self.api_middleware(handle, resource, request)
+
+    def count(self, metric):
+        with self.metrics_lock:
+            self.metrics[metric] += 1
+
+    def selected(self, request):
+        if self.path_prefixes:
+            path = '/' + '/'.join(fp.prop('path', request) or ())
+            if path.startswith(self.path_prefixes):
+                return True
+        return self.rate > 0 and self.random.random() < self.rate
+
+    def __call__(self, handle, resource, request):
+        if not self.selected(request):
+            return self.handle(handle, resource, request)
+        if not self.lock.acquire(blocking=False):
+            self.count('busy')
+            return self.handle(handle, resource, request)
+        try:
+            route = request.get('route')
+            if route is None:
+                route = []
+                request = fp.assoc('route', route, request)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return self.handle(handle, resource, request)
+            finally:
+                profile.disable()
+                self.count('profiled')
+                self.add(
+                    profile_name(
+                        method_label(fp.prop('method', request)),
+                        route_template(route)),
+                    profile)
+        finally:
+            self.lock.release()
+
+    def add(self, name, profile):
+        """Add a profile to a route's aggregate, and write out the routes
+        whose save interval has passed. Called with the lock held.
+        """
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+        self.unsaved.add(name)
+        now = self.clock()
+        self.save_routes(
+            route for route in self.unsaved
+            if route not in self.saved or
+                now - self.saved[route] >= self.save_interval)
+
+    def flush(self):
+        """Write out all profiles that have not been written yet.
+        """
+        with self.lock:
+            self.save_routes(self.unsaved)
+
+    def save_routes(self, names):
+        """Write out the aggregates of some routes; errors are logged and
+        counted rather than raised. Called with the lock held.
+        """
+        for name in list(names):
+            self.unsaved.discard(name)
+            self.saved[name] = self.clock()
+            try:
+                self.save(name)
+            except Exception:
+                self.count('save_errors')
+                logger.error("Saving profile %s failed", name, exc_info=True)
+            else:
+                self.count('saved')
+
+    def save(self, name):
+        """Write out a route's aggregate, and evict old profiles. Called
+        with the lock held.
+        """
+        stats = self.stats[name]
+        filename = os.path.join(
+            self.directory, '{0}.{1}.pstats'.format(name, os.getpid()))
+        tmp_filename = filename + '.tmp'
+        stats.dump_stats(tmp_filename)
+        os.replace(tmp_filename, filename)
+        self.evict(filename)
+
+    def evict(self, keep):
+        """Remove the least recently written profiles, other than "keep",
+        until the directory is within bounds.
+        """
+        files = []
+        for filename in profile_files(self.directory):
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            files.append((st.st_mtime, filename, st.st_size))
+        files.sort()
+        total = sum(size for mtime, filename, size in files)
+        count = len(files)
+        for mtime, filename, size in files:
+            if count <= self.max_files and total <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self.count('evicted')
+            count -= 1
+            total -= size
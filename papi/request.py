@@ -1,44 +1,69 @@
 from urllib.parse import parse_qsl
 from papi.mime import parse_http_accept, parse_mime_type
 import papi.fp as fp
-from functools import partial
 
 def parse_request_middleware(application):
+    """WSGI-level middleware that makes sure the environ carries a request
+    (see get_request()) under the "request" key.
+    """
     def wrapped(environ, start_response):
-        request = parse_request(environ)
-        new_environ = fp.assoc('request', request, environ)
-        return application(new_environ, start_response)
+        get_request(environ)
+        return application(environ, start_response)
     return wrapped
 
+def get_request(environ):
+    """Get the request for a WSGI environ, parsing it (see parse_request())
+    and storing it in the environ on first use, so that all middlewares
+    share one request, and parse each field at most once.
+    """
+    request = environ.get('request')
+    if request is None:
+        request = environ['request'] = parse_request(environ)
+    return request
+
 def parse_request(environ):
-    return {
-        'path': parse_path(environ['PATH_INFO']),
-        'accept': parse_http_accept(
-            environ.get('HTTP_ACCEPT', 'application/json'),
-            sort=True),
-        'content_type': parse_mime_type(
-            environ.get('CONTENT_TYPE', 'application/json')),
-        'headers': get_headers(environ),
-        'method': environ['REQUEST_METHOD'],
-        'query': dict(parse_qsl(environ['QUERY_STRING'], keep_blank_values=True)),
-        'input': environ.get('wsgi.input'),
-    }
+    """Turn a WSGI environ into a request: a fp.LazyMap, whose fields
+    (except for the method and the input stream) are only parsed when they
+    are first looked up.
+    """
+    return fp.LazyMap(
+        [
+            ('method', environ['REQUEST_METHOD']),
+            ('input', environ.get('wsgi.input')),
+        ],
+        {
+            'path': lambda: parse_path(environ['PATH_INFO']),
+            'accept': lambda: parse_http_accept(
+                environ.get('HTTP_ACCEPT', 'application/json'),
+                sort=True),
+            'content_type': lambda: parse_mime_type(
+                environ.get('CONTENT_TYPE', 'application/json')),
+            'headers': lambda: get_headers(environ),
+            'query': lambda: parse_query(environ.get('QUERY_STRING', '')),
+            'content_length': lambda: parse_content_length(
+                environ.get('CONTENT_LENGTH')),
+        })
+
+def parse_query(s):
+    return dict(parse_qsl(s, keep_blank_values=True))
+
+def parse_content_length(s):
+    """Parse a CONTENT_LENGTH value; None if it is missing or invalid.
+    """
+    try:
+        return int(s)
+    except (TypeError, ValueError):
+        return None
 
 def get_headers(environ):
-    def convert_header_name(hname):
-        return fp.chain(
-            '-'.join,
-            partial(map, str.capitalize),
-            lambda x: x.split('_'),
-            lambda x: x[len('HTTP_'):])(hname)
-    headers = (
-            (convert_header_name(name), val)
-            for name, val
-            in dict(environ).items()
-            if name.startswith('HTTP_')
-        )
-    return dict(headers)
-            
+    """Collect the HTTP_* variables of a WSGI environ into a dict of
+    headers, with their names capitalized ("HTTP_IF_MATCH" -> "If-Match").
+    """
+    return dict(
+        ('-'.join(part.capitalize() for part in name[5:].split('_')), val)
+        for name, val in environ.items()
+        if name.startswith('HTTP_'))
+
 def parse_path(s, skip_trailing_slash=True):
     parts = s.strip().split('/')
     if len(parts) > 0 and parts[0] == '':
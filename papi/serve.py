@@ -1,4 +1,8 @@
+import collections
+import concurrent.futures
 import logging
+import threading
+import time
 from papi.request import parse_request_middleware
 from papi.method_override_middleware import method_override_middleware
 from papi.exceptions import RestException, \
@@ -8,6 +12,8 @@ from papi.exceptions import RestException, \
                             NotAcceptableException, \
                             ConflictException, \
                             UnsupportedMediaException, \
+                            PreconditionFailedException, \
+                            TimeoutException, \
                             ResourceException
 from traceback import format_exc
 import json
@@ -15,6 +21,13 @@ import papi.fp as fp
 from functools import partial
 from papi.hateoas import hateoas
 from papi.mime import match_mime, mime_str, parse_mime_type
+from papi.filters import Filter, parse_filter, conjuncts
+from papi.bulk import is_ndjson, handle_bulk_write
+from papi.timing import PhaseTimer, timed
+from papi.metrics import route_template
+from papi.memory import MemoryTimer
+from papi.capabilities import capabilities, validate_tree
+from papi.negative_cache import NegativeCache
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +52,19 @@ def def_api_middleware(handle, resource, request):
     """
     return handle(resource, request)
 
-def serve_resource(resource, response_writers=None, api_middleware=None):
+def serve_resource(
+        resource,
+        response_writers=None,
+        api_middleware=None,
+        digest_executor=None,
+        request_timeout=None,
+        bulk_batch_size=None,
+        server_timing=False,
+        timing_callback=None,
+        metrics=None,
+        memory_callback=None,
+        validate=False,
+        negative_cache=None):
     """Turns a resource into a WSGI application.
 
     Args:
@@ -63,18 +88,83 @@ def serve_resource(resource, response_writers=None, api_middleware=None):
                 request: request to pass through to the handler
             Returns:
                 A triple of (status_code, headers, body).
+            Paths that do not exist come back from the handler as a 404
+            response (see make_not_found_response()), rather than as a
+            raised NotFoundException.
+        digest_executor: Opt-in concurrent computation of child digests in
+            listings (for resources that do not implement
+            get_children_digests()): either a concurrent.futures.Executor,
+            or a number of worker threads for a ThreadPoolExecutor.
+        request_timeout: Per-request deadline, in seconds, for waiting on
+            concurrently computed digests; when it expires, outstanding work
+            is cancelled and the request fails with a 504.
+        bulk_batch_size: Number of records per create_many() / store_many()
+            call for NDJSON bulk writes (see papi.bulk).
+        server_timing: If true, time the phases of each request (see
+            papi.timing) and report them in a Server-Timing header.
+        timing_callback: A function that gets called with the request and
+            a list of (phase, seconds) pairs after each request; also
+            enables timing.
+        metrics: A papi.metrics.MetricsRegistry that records request counts,
+            latencies and response sizes per route template; also enables
+            timing.
+        memory_callback: A function that gets called with the request and
+            a list of (phase, usage) pairs after each request, where usage
+            holds the memory allocated in that phase (see papi.memory);
+            also enables timing.
+        validate: If true, check the resource tree for malformed protocol
+            implementations up front (see papi.capabilities.validate_tree),
+            raising papi.exceptions.InvalidResourceException.
+        negative_cache: Opt-in caching of paths that were not found: either
+            a papi.negative_cache.NegativeCache, or the number of paths for
+            a NegativeCache to remember. The cache is per process, see
+            papi.negative_cache for multi-process servers.
     """
+    if validate:
+        validate_tree(resource)
     if api_middleware is None:
         api_middleware = def_api_middleware
+    if isinstance(digest_executor, int):
+        digest_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=digest_executor)
     if isinstance(response_writers, dict):
         response_writers = response_writers.items()
+    if isinstance(negative_cache, int):
+        negative_cache = NegativeCache(max_entries=negative_cache)
+    if metrics is not None:
+        metrics.add_counters(
+            'papi_n_plus_one_digest_calls_total', n_plus_one_digests,
+            'resource',
+            'Children whose digests were fetched one get_structured_body() '
+            'call at a time.')
+        if negative_cache is not None:
+            metrics.add_counters(
+                'papi_negative_cache_events_total', negative_cache.metrics,
+                'event', 'Lookups and updates of the cache of paths that '
+                'were not found.')
+    timing = server_timing or timing_callback is not None or \
+        metrics is not None or memory_callback is not None
     def application(environ, start_response):
+        timer = environ.get('papi.timer')
+        if timer is not None:
+            timer.mark('parse')
+        request = None
         try:
             request = fp.assocs(
                         [
                             ('consumed_path', ()),
                             ('remaining_path', fp.path(['request', 'path'], environ)),
                             ('response_writers', response_writers or []),
+                            ('digest_executor', digest_executor),
+                            ('deadline',
+                                None if request_timeout is None
+                                else time.monotonic() + request_timeout),
+                            ('bulk_batch_size', bulk_batch_size),
+                            ('timer', timer),
+                            ('route', None if metrics is None else []),
+                            ('negative_cache', negative_cache),
+                            ('multiprocess',
+                                environ.get('wsgi.multiprocess', False)),
                         ],
                         environ['request'])
             try:
@@ -82,45 +172,154 @@ def serve_resource(resource, response_writers=None, api_middleware=None):
                     api_middleware(handle_resource, resource, request)
             except ResourceException as e:
                 e.raise_as_rest_exception()
+            except RestException:
+                raise
+            except Exception:
+                if metrics is not None:
+                    timer.mark('total')
+                    observe_request(metrics, request, 500, timer, None)
+                raise
         except RestException as e:
-            status = e.get_http_status()
-            status_code, status_msg = status
-            headers = [('Content-type', 'text/plain;charset=utf8')]
-            body = status_msg
+            status, headers, body = make_error_response(e.get_http_status())
+        if timer is not None:
+            timer.mark('total')
+            if server_timing:
+                headers = list(headers) + [
+                    ('Server-Timing', timer.server_timing())]
+            if timing_callback is not None:
+                timing_callback(request, timer.timings())
+            if memory_callback is not None:
+                memory_callback(request, timer.memory_usage())
         status_str = "{0} {1}".format(*status)
         start_response(status_str, headers)
         if type(body) is str:
             body = body.encode('utf8')
+        if type(body) is bytes:
+            # a WSGI body is an iterable of bytestrings, not a bytestring
+            body = [body]
+        if metrics is not None:
+            size = sum(len(b) for b in body) if type(body) is list else None
+            observe_request(metrics, request, status[0], timer, size)
         return body
     middlewares = fp.chain(
         uncaught_exceptions_middleware,
+        partial(timing_middleware,
+            timer_class=PhaseTimer if memory_callback is None else MemoryTimer)
+        if timing else fp.identity,
         method_override_middleware,
         parse_request_middleware)
     return middlewares(application)
 
+def timing_middleware(app, timer_class=PhaseTimer):
+    """WSGI-level middleware that starts a PhaseTimer (or an instance of
+    another timer class, such as papi.memory.MemoryTimer) for each request,
+    and passes it on in the environ.
+    """
+    def wrapped(environ, start_response):
+        environ['papi.timer'] = timer_class()
+        return app(environ, start_response)
+    return wrapped
+
+def observe_request(metrics, request, status_code, timer, size):
+    """Record a finished request in a MetricsRegistry.
+    """
+    if request is None:
+        # the request did not get as far as routing
+        route, method = '', ''
+    else:
+        route = route_template(request['route'])
+        method = request.get('method', '')
+    metrics.observe_request(
+        route, method, status_code, timer.durations.get('total', 0.0),
+        size, timer.timings())
+
+def record_route(request, resource, skipped=0):
+    """Add the class of a resource found while routing to the request's
+    route (see papi.metrics); "skipped" is the number of path segments
+    resolved along with it, whose resources are unknown. A resource of None
+    marks a segment that was not found.
+    """
+    route = request.get('route')
+    if route is not None:
+        route.extend(['*'] * skipped)
+        route.append(
+            '?' if resource is None else resource.__class__.__name__)
+
 def handle_resource(resource, request, parent_resource=None):
     """Main entry point for handling an API request. Called recursively for
     nested resources.
+
+    Paths that do not exist result in a 404 response, which is returned
+    rather than raised as a NotFoundException, so that it does not have to
+    unwind the recursion.
     """
     if resource is None:
-        raise NotFoundException
+        return make_not_found_response()
     remaining_path = fp.prop('remaining_path', request)
     if len(remaining_path) == 0:
         return handle_resource_self(
             resource,
             request,
             parent_resource=parent_resource)
-    else:
-        child_name, new_request = consume_path_item(request)
-        if not hasattr(resource, 'get_child'):
-            raise NotFoundException
-        child = resource.get_child(child_name)
-        if child is None:
-            raise NotFoundException
+    negative_cache = fp.prop('negative_cache', request)
+    if negative_cache is not None:
+        child_path = fp.snoc(
+            remaining_path[0], fp.prop('consumed_path', request))
+        if negative_cache.lookup(child_path):
+            record_route(request, None)
+            return make_not_found_response()
+        generation = negative_cache.generation
+    resolved = timed(request, 'route', resolve_path, resource, remaining_path)
+    if resolved is not None:
+        target, parent, consumed = resolved
+        record_route(request, target, consumed - 1)
+        if target is None:
+            return make_not_found_response()
         return handle_resource(
-            child,
-            new_request,
-            parent_resource=resource)
+            target,
+            consume_path_items(request, consumed),
+            parent_resource=parent)
+    child_name, new_request = consume_path_item(request)
+    if not capabilities(resource).get_child:
+        record_route(request, None)
+        return make_not_found_response()
+    child = timed(request, 'route', resource.get_child, child_name)
+    record_route(request, child)
+    if child is None:
+        if negative_cache is not None:
+            negative_cache.add(child_path, generation,
+                fp.prop('multiprocess', request))
+        return make_not_found_response()
+    return handle_resource(
+        child,
+        new_request,
+        parent_resource=resource)
+
+def resolve_path(resource, segments):
+    """Let a resource resolve several path segments at once, through its
+    optional resolve_path() method.
+
+    resource.resolve_path(segments) gets the tuple of remaining path
+    segments, and returns either None, to fall back to get_child(), or a
+    (target, parent, remaining) triple: "target" is the resource found by
+    following as many segments as the resource could resolve (None if the
+    path does not exist), "parent" is the target's parent, and "remaining"
+    holds the segments that have not been resolved yet, which papi then
+    continues to resolve from "target".
+
+    Returns None, or a (target, parent, consumed) triple, where "consumed"
+    is the number of segments resolved.
+    """
+    if not capabilities(resource).resolve_path:
+        return None
+    resolved = resource.resolve_path(tuple(segments))
+    if resolved is None:
+        return None
+    target, parent, remaining = resolved
+    consumed = len(segments) - len(remaining or ())
+    if consumed <= 0 or consumed > len(segments):
+        return None
+    return target, parent, consumed
 
 def handle_resource_self(resource, request, parent_resource):
     """Handles requests on the target resource in the resource tree. In other
@@ -131,71 +330,202 @@ def handle_resource_self(resource, request, parent_resource):
     method = fp.prop('method', request).upper()
     if method == 'GET':
         return handle_resource_get(resource, request, parent_resource)
-    elif method == 'POST':
-        return handle_resource_post(resource, request, parent_resource)
+    if method == 'POST':
+        handler = handle_resource_post
     elif method == 'PUT':
-        return handle_resource_put(resource, request, parent_resource)
+        handler = handle_resource_put
     elif method == 'DELETE':
-        return handle_resource_delete(resource, request, parent_resource)
+        handler = handle_resource_delete
     else:
         raise MethodNotAllowedException
+    try:
+        return handler(resource, request, parent_resource)
+    finally:
+        # a write can create the path, or paths below it, and even a failed
+        # one may have written something (bulk writes also invalidate after
+        # each batch, see handle_bulk())
+        negative_cache = fp.prop('negative_cache', request)
+        if negative_cache is not None:
+            negative_cache.invalidate(fp.prop('consumed_path', request))
 
 def handle_resource_get(resource, request, parent_resource):
     """Handles a GET request on a resource
     """
     if resource is None:
-        raise NotFoundException
+        return make_not_found_response()
+    # The version is read before the body: should the document be stored
+    # in between, the ETag is older than the body, so that a conditional
+    # write based on it fails instead of overwriting a version the client
+    # has not seen.
+    version = get_current_version(parent_resource, request)
     accepts = fp.prop('accept', request)
     for mime_pattern in accepts:
         accepted = handle_resource_get_typed(mime_pattern, resource, request)
         if accepted is not None:
-            return accepted
+            return add_etag(accepted, version)
     raise NotAcceptableException
 
 def handle_resource_put(resource, request, parent_resource):
     """Handles a PUT request on a resource
     """
+    if is_bulk_write(resource, request, 'store'):
+        return handle_bulk(resource, request, create=False)
     if parent_resource is None:
-        raise NotFoundException
+        return make_not_found_response()
     content_type = fp.prop('content_type', request)
     path = fp.prop('consumed_path', request)
     name = fp.last(path)
-    if not hasattr(parent_resource, 'store'):
+    if not capabilities(parent_resource).store:
         raise MethodNotAllowedException
 
     input = fp.prop('input',  request)
-    name, body = parent_resource.store(input, name, content_type)
+    version_kwargs = get_expected_version(parent_resource, name, request)
+    stored = timed(request, 'store', parent_resource.store,
+        input, name, content_type, **version_kwargs)
+    name, body = stored[:2]
+    # only the version store() reports is known to belong to this body
+    version = stored[2] if len(stored) > 2 else None
 
-    return make_json_response(hateoas(path, body))
+    return add_etag(
+        timed(request, 'write', make_json_response, hateoas(path, body)),
+        version)
 
 def handle_resource_delete(resource, request, parent_resource):
     """Handles a DELETE request on a resource
     """
     if parent_resource is None:
-        raise NotFoundException
+        return make_not_found_response()
     path = fp.prop('consumed_path', request)
     name = fp.last(path)
-    if not hasattr(parent_resource, 'delete'):
+    if not capabilities(parent_resource).delete:
         raise MethodNotAllowedException
 
-    parent_resource.delete(name)
+    version_kwargs = get_expected_version(parent_resource, name, request)
+    timed(request, 'store', parent_resource.delete, name, **version_kwargs)
 
     return make_empty_response()
 
+def parse_etags(s):
+    """Parse the value of an If-Match or If-None-Match header into a list of
+    entity tags, with surrounding quotes removed; "*" is returned as is.
+    Weak tags (W/"...") are returned with their W/ prefix, so that they never
+    match a version.
+    """
+    etags = []
+    for etag in s.split(','):
+        etag = etag.strip()
+        if len(etag) >= 2 and etag.startswith('"') and etag.endswith('"'):
+            etag = etag[1:-1]
+        if etag:
+            etags.append(etag)
+    return etags
+
+def format_etag(version):
+    return '"{0}"'.format(version)
+
+def get_expected_version(parent_resource, name, request):
+    """Turn If-Match / If-None-Match request headers into keyword arguments
+    for a versioned store() or delete() (see the README): an empty dict for
+    unconditional requests, otherwise {'expected_version': v}, where v is
+    the version the document must currently have, "*" if it must merely
+    exist, or None if it must not exist.
+
+    If-Match takes precedence over If-None-Match, which is only supported
+    as "*": a list of entity tags could not be checked atomically with the
+    write. Raises PreconditionFailedException if the resource does not
+    support versions, for any other If-None-Match, or if the precondition
+    can be seen to fail up front.
+    """
+    headers = fp.prop('headers', request) or {}
+    if_match = headers.get('If-Match')
+    if_none_match = headers.get('If-None-Match')
+    if if_match is None and if_none_match is None:
+        return {}
+    if not capabilities(parent_resource).get_version:
+        raise PreconditionFailedException
+    if if_match is None:
+        if parse_etags(if_none_match) == ['*']:
+            return {'expected_version': None}
+        raise PreconditionFailedException
+    etags = parse_etags(if_match)
+    if etags == ['*'] or len(etags) == 1:
+        return {'expected_version': etags[0]}
+    # With several candidates, pick the current version if it is among them;
+    # the resource still verifies it atomically while writing.
+    current = parent_resource.get_version(name)
+    if current is None or current not in etags:
+        raise PreconditionFailedException
+    return {'expected_version': current}
+
+def get_current_version(parent_resource, request):
+    """Get the current version of the requested resource from its parent,
+    or None if the parent does not support versions.
+    """
+    if parent_resource is None or \
+            not capabilities(parent_resource).get_version:
+        return None
+    return parent_resource.get_version(
+        fp.last(fp.prop('consumed_path', request)))
+
+def add_etag(response, version):
+    """Add an ETag header with a version to a response, unless the version
+    is None.
+    """
+    if version is None:
+        return response
+    status, headers, body = response
+    return status, list(headers) + [('ETag', format_etag(version))], body
+
 def handle_resource_post(resource, request, parent_resource):
     """Handles a POST request on a resource
     """
     if resource is None:
-        raise NotFoundException
+        return make_not_found_response()
+    if is_bulk_write(resource, request, 'create'):
+        return handle_bulk(resource, request, create=True)
     content_type = fp.prop('content_type', request)
     path = fp.prop('consumed_path', request)
-    if not hasattr(resource, 'create'):
+    if not capabilities(resource).create:
         raise MethodNotAllowedException
 
     input = fp.prop('input',  request)
-    name, body = resource.create(input, content_type)
+    name, body = timed(request, 'store', resource.create, input, content_type)
 
-    return make_json_response(hateoas(fp.snoc(name, path), body))
+    return timed(request, 'write',
+        make_json_response, hateoas(fp.snoc(name, path), body))
+
+def is_bulk_write(resource, request, method_name):
+    """Check whether a request is an NDJSON bulk write to a collection that
+    supports it, through either "method_name" or its "_many" variant.
+    """
+    if not is_ndjson(fp.prop('content_type', request)):
+        return False
+    methods = capabilities(resource).methods
+    return method_name in methods or method_name + '_many' in methods
+
+def handle_bulk(resource, request, create):
+    """Handles an NDJSON bulk write on a collection (see papi.bulk)
+    """
+    # conditional headers cannot apply to a whole batch of documents, and
+    # ignoring them would leave the client believing its writes were checked
+    headers = fp.prop('headers', request) or {}
+    if 'If-Match' in headers or 'If-None-Match' in headers:
+        raise PreconditionFailedException
+    # the records are only written as the response body is iterated, so
+    # missing paths are forgotten again after each batch
+    negative_cache = fp.prop('negative_cache', request)
+    written = None
+    if negative_cache is not None:
+        written = partial(
+            negative_cache.invalidate, fp.prop('consumed_path', request))
+    return handle_bulk_write(
+        resource,
+        fp.prop('input', request),
+        fp.prop('content_type', request),
+        create,
+        content_length=fp.prop('content_length', request),
+        batch_size=fp.prop('bulk_batch_size', request),
+        written=written)
 
 def handle_resource_get_typed(mime_pattern, resource, request):
     """Serve a 'typed' response to a GET.
@@ -208,7 +538,7 @@ def handle_resource_get_typed(mime_pattern, resource, request):
 def resource_accepts_ranges(resource):
     """Check whether a resource can serve ranged bodies
     """
-    return hasattr(resource, 'get_typed_body_range')
+    return capabilities(resource).get_typed_body_range
 
 def parse_range_header(s):
     """Parse a Range header.
@@ -236,7 +566,7 @@ def handle_resource_get_binary(mime_pattern, resource, request):
     """Serve a binary response (raw body as reported by resource, no HATEOAS)
     based on a given MIME type pattern.
     """
-    if not hasattr(resource, 'get_typed_body'):
+    if not capabilities(resource).get_typed_body:
         return None
     accepts_ranges = resource_accepts_ranges(resource)
     range_header = request['headers'].get('Range')
@@ -245,9 +575,10 @@ def handle_resource_get_binary(mime_pattern, resource, request):
     else:
         byte_range = parse_range_header(range_header)
     if byte_range is None or not accepts_ranges:
-        matched = resource.get_typed_body(mime_pattern)
+        matched = timed(request, 'body', resource.get_typed_body, mime_pattern)
     else:
-        matched = resource.get_typed_body_range(mime_pattern, byte_range)
+        matched = timed(request, 'body',
+            resource.get_typed_body_range, mime_pattern, byte_range)
     if matched is None:
         return None
     if byte_range is None:
@@ -263,30 +594,100 @@ def handle_resource_get_binary(mime_pattern, resource, request):
 def get_resource_digest(resource):
     """Get a 'digest' version of the resource's body
     """
+    if capabilities(resource).get_structured_body:
+        return resource.get_structured_body(digest=True)
+    return resource
+
+# Number of per-child get_structured_body(digest=True) calls made while
+# listing resources that do not implement get_children_digests(), keyed by
+# the listed resource's class. Each entry is a listing that costs one call
+# (for database-backed resources, typically one query) per child.
+n_plus_one_digests = collections.Counter()
+_n_plus_one_digests_lock = threading.Lock()
+
+def get_children_digests(resource, children, request=None):
+    """Turn a list of (name, child) pairs, as returned by
+    resource.get_children(), into (name, digest, has_children) triples, one
+    child at a time. This is the fallback for resources that do not
+    implement get_children_digests(); calls are counted in
+    n_plus_one_digests.
+
+    If the request carries a digest executor, digests are computed
+    concurrently (see compute_digests()).
+    """
+    children = list(children)
+    executor = fp.prop('digest_executor', request)
+    if executor is not None and len(children) > 1:
+        digests = compute_digests(
+            executor,
+            [v for k, v in children],
+            fp.prop('deadline', request))
+    else:
+        digests = [get_resource_digest(v) for k, v in children]
+    children_alist = [
+        (k, digest, capabilities(v).get_children)
+        for (k, v), digest in zip(children, digests)
+    ]
+    calls = sum(
+        1 for k, v in children if capabilities(v).get_structured_body)
+    if calls:
+        cls = resource.__class__
+        key = "{0}.{1}".format(cls.__module__, cls.__name__)
+        with _n_plus_one_digests_lock:
+            first = key not in n_plus_one_digests
+            n_plus_one_digests[key] += calls
+        if first:
+            logger.info(
+                "%s lists children with one digest call per child; "
+                "implement get_children_digests() to fetch them in bulk",
+                key)
+    return children_alist
+
+def compute_digests(executor, resources, deadline=None):
+    """Compute the digests of "resources" concurrently on "executor",
+    returning them in the original order.
+
+    As soon as a digest fails, its exception is raised (if several have
+    failed by then, the one that comes first in list order wins). If
+    "deadline" (a time.monotonic() timestamp) passes first,
+    TimeoutException is raised. Either way, work that has not started yet
+    is cancelled; work that is already running cannot be interrupted, and
+    its result is discarded.
+    """
+    futures = [executor.submit(get_resource_digest, r) for r in resources]
     try:
-        digest = resource.get_structured_body(digest=True)
-    except AttributeError:
-        digest = resource
-    return digest
+        timeout = None
+        if deadline is not None:
+            timeout = max(0, deadline - time.monotonic())
+        done, pending = concurrent.futures.wait(
+            futures,
+            timeout=timeout,
+            return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        if pending:
+            raise TimeoutException()
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
 
 def get_resource_body(resource):
     """Get a full version of the resource's body
     """
-    try:
-        digest = resource.get_structured_body()
-    except AttributeError:
-        digest = resource
-    return digest
+    if capabilities(resource).get_structured_body:
+        return resource.get_structured_body()
+    return resource
 
 def get_resource_response_writers(resource):
     """Get a list of custom response writers from a resource.
     For resources that do not supply custom response writers, an empty list is
     returned.
     """
-    try:
-        response_writers = resource.get_response_writers()
-    except AttributeError:
-        response_writers = []
+    if not capabilities(resource).get_response_writers:
+        return []
+    response_writers = resource.get_response_writers()
     if isinstance(response_writers, dict):
         response_writers = response_writers.items()
     return [(parse_mime_type(k), v) for k, v in response_writers]
@@ -311,23 +712,14 @@ def int_param(key, request):
     except ValueError:
         raise MalformedException()
 
-class Filter(object):
-    def __init__(self, propname, value, operator):
-        self.propname = propname
-        self.value = value
-        self.operator = operator
-
-def parse_filter(src):
-    # TODO: currently only supports name:value syntax; needs more operators and
-    # a proper parser
-    propname, raw_value = tuple(src.split(':', 1))
-    return Filter(propname, raw_value, "equals")
-
 def parse_filters_param(key, request):
+    """Parse a filter expression from a request's query string (see
+    papi.filters) into a tuple of filters that must all match.
+    """
     p = fp.path(('query', key), request)
     if p is None or p == '':
         return None
-    return tuple(map(parse_filter, p.split(',')))
+    return conjuncts(parse_filter(p))
 
 def parse_ordering(src):
     descending = False
@@ -363,8 +755,9 @@ def handle_resource_get_structured(mime_pattern, resource, request):
     a suitable response writer (which also covers content type negotiation),
     which yields a serialized body.
     """
-    if hasattr(resource, 'get_structured_body'):
-        raw_body = resource.get_structured_body()
+    caps = capabilities(resource)
+    if caps.get_structured_body:
+        raw_body = timed(request, 'body', resource.get_structured_body)
     else:
         raw_body = {}
     current_path = fp.prop('consumed_path', request)
@@ -375,6 +768,7 @@ def handle_resource_get_structured(mime_pattern, resource, request):
     count = int_param('count', request)
     filters = parse_filters_param('where', request)
     order = parse_orderings_param('order', request)
+    cursor = fp.path(('query', 'cursor'), request)
     calculated_offset = offset
     if offset is None and count is not None and page is not None:
         calculated_offset = (page - 1) * count
@@ -392,21 +786,29 @@ def handle_resource_get_structured(mime_pattern, resource, request):
         else:
             return raw_body or {}
     print("PAGE: {0}".format(page))
-    body = add_hateoas(name, current_path, raw_body, page, offset, count)
-
-    if hasattr(resource, 'get_children'):
-        children = resource.get_children(
-            offset=calculated_offset,
-            count=count,
-            filters=filters,
-            order=order)
+    body = timed(request, 'hateoas',
+        add_hateoas, name, current_path, raw_body, page, offset, count)
+
+    # cursor is only passed when given, so that resources which do not
+    # support it keep working
+    children_kwargs = dict(
+        offset=calculated_offset,
+        count=count,
+        filters=filters,
+        order=order)
+    if cursor:
+        children_kwargs['cursor'] = cursor
+    if caps.get_children_digests:
+        children_alist = timed(request, 'children',
+            resource.get_children_digests, **children_kwargs)
+    elif caps.get_children:
+        children = timed(request, 'children',
+            resource.get_children, **children_kwargs)
+        children_alist = None if children is None else timed(request,
+            'digests', get_children_digests, resource, children, request)
     else:
-        children = None
-    if children is not None:
-        children_alist = [
-            (k, get_resource_digest(v), hasattr(v, 'get_children')) for k, v in children
-        ]
-
+        children_alist = None
+    if children_alist is not None:
         def prepare_child(kvp):
             name, value, pageable = kvp
             if use_hateoas and not isinstance(value, dict):
@@ -415,7 +817,8 @@ def handle_resource_get_structured(mime_pattern, resource, request):
                     partial(add_hateoas, name, fp.snoc(name, current_path), pageable=pageable)
                 )(raw_body=value)
 
-        children_list = list(map(prepare_child, children_alist))
+        children_list = timed(request, 'hateoas',
+            lambda: list(map(prepare_child, children_alist)))
         body['_items'] = children_list
 
     response_writers = fp.concat([
@@ -426,7 +829,7 @@ def handle_resource_get_structured(mime_pattern, resource, request):
     query = fp.prop('query', request)
     for mime_type, response_writer in response_writers:
         if match_mime(mime_pattern, mime_type, ["charset"]):
-            converted = response_writer(body, **query)
+            converted = timed(request, 'write', response_writer, body, **query)
             return make_binary_response(mime_type, converted)
 
 def json_writer(data, **query):
@@ -437,7 +840,15 @@ def json_writer(data, **query):
     kwargs = {}
     if query.get('pretty'):
         kwargs['indent'] = 2
-    return json.dumps(data, **kwargs)
+    return json.dumps(data, default=json_default, **kwargs)
+
+def json_default(obj):
+    """Fallback for json.dumps(): encodes persistent maps (fp.PMap) as JSON
+    objects.
+    """
+    if isinstance(obj, fp.PMap):
+        return obj.to_dict()
+    raise TypeError("{0!r} is not JSON serializable".format(obj))
 
 default_response_writers = [
     (parse_mime_type(k), v)
@@ -457,20 +868,45 @@ def consume_path_item(request):
         new_request: the updated request, with the rest of the request path in
             the 'remaining_path' key.
     """
-    first_item = fp.head(fp.prop('remaining_path', request))
+    remaining_path = fp.prop('remaining_path', request)
+    first_item = fp.head(remaining_path)
     if first_item is None:
         return None, request
-    new_request = fp.chain(
-        partial(
-            fp.Lens.over,
-            fp.prop_lens('remaining_path'),
-            partial(fp.drop, 1)),
-        partial(
-            fp.Lens.over,
-            fp.prop_lens('consumed_path'),
-            partial(fp.snoc, first_item)))(request)
+    new_request = fp.assocs(
+        [
+            ('remaining_path', fp.drop(1, remaining_path)),
+            ('consumed_path',
+                fp.snoc(first_item, fp.prop('consumed_path', request))),
+        ],
+        request)
     return first_item, new_request
 
+def consume_path_items(request, count):
+    """Move the first "count" elements of the remaining request path to the
+    consumed path, returning the updated request.
+    """
+    remaining_path = fp.prop('remaining_path', request)
+    consumed_path = fp.prop('consumed_path', request)
+    return fp.assocs(
+        [
+            ('remaining_path', fp.drop(count, remaining_path)),
+            ('consumed_path',
+                tuple(consumed_path) + fp.take(count, remaining_path)),
+        ],
+        request)
+
+def make_error_response(status):
+    """Make a plain text response for an error status, a (status_code,
+    reason) pair.
+    """
+    status_code, status_msg = status
+    return (status, [('Content-type', 'text/plain;charset=utf8')], status_msg)
+
+not_found_status = NotFoundException().get_http_status()
+
+def make_not_found_response():
+    return make_error_response(not_found_status)
+
 def make_json_response(
         data,
         status=200,
@@ -478,7 +914,7 @@ def make_json_response(
     content_type = 'application/json'
     headers = list(headers or [])
     headers.append(('Content-type', content_type))
-    body = json.dumps(data)
+    body = json.dumps(data, default=json_default)
     if type(body) is str:
         body = body.encode('utf8')
     return ((status, status_names.get(status, 'OK')), headers, body)
@@ -0,0 +1,663 @@
+"""A pre-forking, multi-threaded HTTP/1.1 server for WSGI applications, such
+as those made by serve_resource().
+
+    python -m papi.server example.app:application --bind 127.0.0.1:8000 \\
+        --workers 4 --threads 8
+
+The master process opens the listening socket and forks the workers; each
+worker runs a pool of threads that accept connections from the shared
+socket and serve them, keeping connections alive between requests (HTTP/1.1
+keep-alive). Responses without a Content-Length are sent with chunked
+transfer encoding, so streamed bodies keep the connection usable; request
+bodies may be chunked too, and are decoded as the application reads them.
+
+A thread serves one connection at a time, so "threads" bounds the number of
+concurrent connections per worker, not just of concurrent requests. An idle
+keep-alive connection is closed after "keepalive" seconds; and while every
+thread of a worker holds a connection and new connections are waiting to be
+accepted, connections are closed after each response instead of kept alive,
+so that idle clients cannot keep others from being served.
+
+The application is imported by each worker after forking, so that sending
+SIGHUP to the master reloads it gracefully: a new generation of workers is
+started, and the old workers stop accepting connections, finish the
+requests they are serving, and exit. SIGTERM or SIGINT shuts the server
+down the same way. On platforms without os.fork(), or with --workers 0,
+the server runs in a single process.
+"""
+
+import argparse
+import errno
+import importlib
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import unquote
+
+logger = logging.getLogger(__name__)
+
+def load_application(spec):
+    """Import a WSGI application from a "module:attribute" string; the
+    attribute defaults to "application".
+    """
+    module_name, _, attribute = spec.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or 'application')
+
+class RequestBody(object):
+    """wsgi.input: the request body, which ends after Content-Length bytes
+    even though the connection stays open.
+    """
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            return b''
+        data = self.rfile.read(size)
+        self.remaining = 0 if len(data) < size else self.remaining - size
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            return b''
+        data = self.rfile.readline(size)
+        self.remaining = 0 if not data else self.remaining - len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        """Skip whatever the application did not read, so that the next
+        request on the connection can be parsed.
+        """
+        while self.remaining and self.read(65536):
+            pass
+
+class ChunkedRequestBody(object):
+    """wsgi.input for a request body sent with chunked transfer encoding,
+    which is decoded as it is read. A malformed body raises ValueError, and
+    sets "failed", after which the connection cannot be reused.
+    """
+    max_line = 65536
+
+    def __init__(self, rfile):
+        self.rfile = rfile
+        self.remaining = 0
+        self.done = False
+        self.failed = False
+
+    def fail(self):
+        self.failed = self.done = True
+        self.remaining = 0
+        raise ValueError("Malformed chunked request body")
+
+    def next_chunk(self):
+        """Start reading the next chunk, if the current one has been read;
+        returns False at the end of the body.
+        """
+        if self.remaining == 0 and not self.done:
+            line = self.rfile.readline(self.max_line + 1)
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                size = -1
+            if size < 0 or len(line) > self.max_line:
+                self.fail()
+            if size == 0:
+                # skip the trailer, up to the empty line that ends it
+                while True:
+                    line = self.rfile.readline(self.max_line + 1)
+                    if not line or line in (b'\r\n', b'\n'):
+                        break
+                self.done = True
+            self.remaining = size
+        return not self.done
+
+    def consumed(self, data, size, line=False):
+        """Account for "data" read from the current chunk, having asked for
+        "size" bytes (or for a line of at most "size" bytes).
+        """
+        if len(data) < size and not (line and data.endswith(b'\n')):
+            # the connection ended in the middle of a chunk
+            self.fail()
+        self.remaining -= len(data)
+        if self.remaining == 0 and \
+                self.rfile.readline(3) not in (b'\r\n', b'\n'):
+            self.fail()
+        return data
+
+    def read(self, size=-1):
+        parts = []
+        while size is None or size < 0 or size > 0:
+            if not self.next_chunk():
+                break
+            n = self.remaining
+            if size is not None and size >= 0:
+                n = min(n, size)
+                size -= n
+            parts.append(self.consumed(self.rfile.read(n), n))
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        parts = []
+        while size is None or size < 0 or size > 0:
+            if not self.next_chunk():
+                break
+            n = self.remaining
+            if size is not None and size >= 0:
+                n = min(n, size)
+            data = self.consumed(self.rfile.readline(n), n, line=True)
+            parts.append(data)
+            if size is not None and size >= 0:
+                size -= len(data)
+            if data.endswith(b'\n'):
+                break
+        return b''.join(parts)
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while not self.done and self.read(65536):
+            pass
+
+class WSGIRequestHandler(BaseHTTPRequestHandler):
+    """Serves the requests on one connection through the worker's WSGI
+    application.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'papi'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = self.server.keepalive
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def log_request(self, code='-', size='-'):
+        if logger.isEnabledFor(logging.INFO):
+            BaseHTTPRequestHandler.log_request(self, code, size)
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.run_application()
+            self.wfile.flush()
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+        if self.server.stopping.is_set():
+            self.close_connection = True
+
+    def make_environ(self, body):
+        path, _, query = self.path.partition('?')
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'iso-8859-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': self.server.multiprocess,
+            'wsgi.run_once': False,
+        }
+        for name, value in self.headers.items():
+            key = name.replace('-', '_').upper()
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+        return environ
+
+    def make_body(self):
+        """Make the wsgi.input for the request; None (after sending an error
+        response) if the request's framing is invalid.
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return ChunkedRequestBody(self.rfile)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_error(400)
+            self.close_connection = True
+            return None
+        return RequestBody(self.rfile, length)
+
+    def run_application(self):
+        if self.server.saturated():
+            # let the thread go to a connection that may be waiting for one
+            self.close_connection = True
+        body = self.make_body()
+        if body is None:
+            return
+        response = Response(self)
+        try:
+            result = self.server.application(
+                self.make_environ(body), response.start_response)
+        except Exception:
+            logger.error("Uncaught exception in application", exc_info=True)
+            response.fail()
+            return
+        try:
+            response.send(result)
+        except (socket.timeout, ConnectionError):
+            raise
+        except Exception:
+            logger.error("Uncaught exception in application", exc_info=True)
+            response.fail()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        try:
+            body.drain()
+        except ValueError:
+            pass
+        if getattr(body, 'failed', False):
+            self.close_connection = True
+
+class Response(object):
+    """The response side of a single WSGI call: start_response(), and
+    framing of the body with Content-Length or chunked encoding.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.chunked = False
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self.headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError("start_response() called twice")
+        self.status = status
+        self.headers = list(headers)
+        return self.write
+
+    def has_body(self):
+        code = int(self.status.split(' ', 1)[0])
+        return self.handler.command != 'HEAD' and \
+            code >= 200 and code not in (204, 304)
+
+    def send_headers(self, content_length=None):
+        handler = self.handler
+        code, _, message = self.status.partition(' ')
+        handler.send_response(int(code), message)
+        names = set()
+        for name, value in self.headers:
+            names.add(name.lower())
+            handler.send_header(name, value)
+        if 'content-length' not in names and self.has_body():
+            if content_length is not None:
+                handler.send_header('Content-Length', str(content_length))
+            elif handler.request_version == 'HTTP/1.1':
+                handler.send_header('Transfer-Encoding', 'chunked')
+                self.chunked = True
+            else:
+                handler.close_connection = True
+        if handler.close_connection:
+            handler.send_header('Connection', 'close')
+        handler.end_headers()
+        self.headers_sent = True
+
+    def write(self, data):
+        if self.status is None:
+            raise AssertionError("write() before start_response()")
+        if not self.headers_sent:
+            self.send_headers()
+        if not data or not self.has_body():
+            return
+        if self.chunked:
+            self.handler.wfile.write(
+                b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            self.handler.wfile.write(data)
+
+    def send(self, result):
+        if isinstance(result, (list, tuple)):
+            data = b''.join(result)
+            if not self.headers_sent:
+                self.send_headers(content_length=len(data))
+            self.write(data)
+        else:
+            for data in result:
+                self.write(data)
+            if not self.headers_sent:
+                self.send_headers(content_length=0)
+        if self.chunked:
+            self.handler.wfile.write(b'0\r\n\r\n')
+
+    def fail(self):
+        if self.headers_sent:
+            # too late for an error response; all we can do is hang up
+            self.handler.close_connection = True
+            return
+        self.status = '500 Internal Server Error'
+        self.headers = [('Content-Type', 'text/plain')]
+        self.send_headers(content_length=0)
+
+class Worker(object):
+    """Serves connections from a listening socket on a number of threads,
+    each of which accepts connections and serves them one at a time (see the
+    module documentation).
+    """
+    accept_timeout = 0.5
+
+    def __init__(self, listener, application, threads=8, keepalive=5.0,
+            multiprocess=False):
+        self.listener = listener
+        self.application = application
+        self.threads = threads
+        self.keepalive = keepalive
+        self.multiprocess = multiprocess
+        self.server_name, self.server_port = listener.getsockname()[:2]
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        # the number of threads serving a connection
+        self.busy = 0
+
+    def saturated(self):
+        """Check whether every thread is serving a connection while other
+        connections are waiting to be accepted.
+        """
+        if self.busy < self.threads:
+            return False
+        try:
+            readable, _, _ = select.select([self.listener], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return bool(readable)
+
+    def serve(self):
+        """Serve until stop() is called, then wait for the connections being
+        served to finish.
+        """
+        self.listener.settimeout(self.accept_timeout)
+        threads = [
+            threading.Thread(target=self.accept_loop, daemon=True)
+            for i in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        while not self.stopping.wait(self.accept_timeout):
+            pass
+        for thread in threads:
+            thread.join()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def accept_loop(self):
+        while not self.stopping.is_set():
+            try:
+                connection, address = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
+                if self.stopping.is_set():
+                    break
+                logger.error("accept() failed", exc_info=True)
+                time.sleep(self.accept_timeout)
+                continue
+            self.serve_connection(connection, address)
+
+    def serve_connection(self, connection, address):
+        with self.lock:
+            self.busy += 1
+        try:
+            WSGIRequestHandler(connection, address, self)
+        except (socket.timeout, ConnectionError):
+            pass
+        except Exception:
+            logger.error("Error serving connection", exc_info=True)
+        finally:
+            try:
+                connection.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            connection.close()
+            with self.lock:
+                self.busy -= 1
+
+def make_listener(host, port, backlog=1024):
+    listener = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+def run_worker(listener, application, threads, keepalive, multiprocess):
+    """Entry point of a worker process (or of the server itself, when running
+    in a single process).
+    """
+    if isinstance(application, str):
+        application = load_application(application)
+    worker = Worker(listener, application, threads, keepalive, multiprocess)
+    signal.signal(signal.SIGTERM, worker.stop)
+    if not multiprocess:
+        # in a worker process, SIGINT is ignored; the master relays Ctrl-C
+        # as SIGTERM
+        signal.signal(signal.SIGINT, worker.stop)
+    worker.serve()
+
+class Master(object):
+    """Forks and supervises worker processes (see the module documentation).
+    """
+    # Workers that die sooner than this after starting are respawned with a
+    # delay, so that a broken application does not make the master spin.
+    min_worker_lifetime = 1.0
+
+    def __init__(self, listener, application, workers, threads=8,
+            keepalive=5.0, graceful_timeout=30.0):
+        self.listener = listener
+        self.application = application
+        self.workers = workers
+        self.threads = threads
+        self.keepalive = keepalive
+        self.graceful_timeout = graceful_timeout
+        self.pids = {}
+        self.retiring = set()
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def spawn(self):
+        # Block the master's signals across fork(), so that a new worker
+        # cannot receive them before it has replaced the master's handlers.
+        signals = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
+        signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+                self.run_worker()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+        self.pids[pid] = time.monotonic()
+
+    def run_worker(self):
+        status = 0
+        try:
+            run_worker(self.listener, self.application, self.threads,
+                self.keepalive, multiprocess=True)
+        except BaseException:
+            logger.error("Worker failed", exc_info=True)
+            status = 1
+        finally:
+            os._exit(status)
+
+    def request_reload(self, *args):
+        self.reload_requested = True
+
+    def request_stop(self, *args):
+        self.stop_requested = True
+
+    def signal_workers(self, pids, sig):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except OSError:
+                pass
+
+    def reap(self):
+        """Collect exited workers; returns the start times of current
+        (non-retiring) workers that exited.
+        """
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self.retiring.discard(pid)
+            started = self.pids.pop(pid, None)
+            if started is not None:
+                exited.append(started)
+        return exited
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        for i in range(self.workers):
+            self.spawn()
+        while not self.stop_requested:
+            time.sleep(0.1)
+            for started in self.reap():
+                if self.stop_requested:
+                    break
+                if time.monotonic() - started < self.min_worker_lifetime:
+                    time.sleep(self.min_worker_lifetime)
+                logger.warning("Worker exited; starting a new one")
+                self.spawn()
+            if self.reload_requested:
+                self.reload_requested = False
+                logger.info("Reloading")
+                old = set(self.pids)
+                self.pids = {}
+                for i in range(self.workers):
+                    self.spawn()
+                self.retiring.update(old)
+                self.signal_workers(old, signal.SIGTERM)
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("Shutting down")
+        self.retiring.update(self.pids)
+        self.pids = {}
+        self.signal_workers(self.retiring, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.retiring and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        self.signal_workers(self.retiring, signal.SIGKILL)
+        self.reap()
+
+def serve(application, host='127.0.0.1', port=8000, workers=None, threads=8,
+        keepalive=5.0, graceful_timeout=30.0):
+    """Serve a WSGI application, given as an application object or as a
+    "module:attribute" string (only the latter can be reloaded with SIGHUP).
+    "workers" defaults to the number of CPUs; 0 serves from this process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if not hasattr(os, 'fork'):
+        workers = 0
+    listener = make_listener(host, port)
+    host, port = listener.getsockname()[:2]
+    logger.info("Listening on %s:%s", host, port)
+    try:
+        if workers == 0:
+            run_worker(listener, application, threads, keepalive,
+                multiprocess=False)
+        else:
+            Master(listener, application, workers, threads, keepalive,
+                graceful_timeout).run()
+    finally:
+        listener.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m papi.server',
+        description='Serve a WSGI application.')
+    parser.add_argument('application',
+        help='the application to serve, as "module:attribute"')
+    parser.add_argument('--bind', default='127.0.0.1:8000',
+        help='address to listen on, as host:port (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--threads', type=int, default=8,
+        help='threads per worker process (default: %(default)s)')
+    parser.add_argument('--keepalive', type=float, default=5.0,
+        help='idle keep-alive timeout in seconds (default: %(default)s)')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+        help='seconds to wait for workers to finish on reload or shutdown '
+             '(default: %(default)s)')
+    parser.add_argument('--log-level', default='WARNING',
+        help='logging level (default: %(default)s)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=getattr(logging, args.log_level.upper()),
+        format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    host, _, port = args.bind.rpartition(':')
+    serve(args.application,
+        host=host.strip('[]') or '127.0.0.1',
+        port=int(port),
+        workers=args.workers,
+        threads=args.threads,
+        keepalive=args.keepalive,
+        graceful_timeout=args.graceful_timeout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""A collection resource backed by an SQLite table, using the standard
+library's sqlite3 module.
+
+SQLiteCollectionResource maps the rows of a table to the children of a
+collection, named by a key column. Listings are answered with a single
+parameterized query: filters (see papi.filters) become the WHERE clause,
+order= becomes ORDER BY (with the key column as the final tie breaker),
+offset and count become LIMIT / OFFSET, and a cursor (the name of the last
+item on the previous page) becomes a keyset condition. The query fetches the
+digest columns of all children on the page in one go, and is exposed through
+get_children_digests(), so listings never issue one query per child.
+
+SQL text only depends on the shape of a request, never on the values in it,
+which are always passed as parameters; this lets sqlite3's per-connection
+statement cache reuse prepared statements across requests. Connections are
+pooled per thread (see ConnectionPool).
+
+Bulk writes (see papi.bulk) are done in one transaction per batch.
+
+Filters and orderings on columns that the table does not have behave as if
+the column were NULL for every row, just like missing properties do for
+in-memory resources.
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+from papi.exceptions import ResourceException
+from papi.filters import And, Or, Not
+from papi.mime import match_mime, parse_mime_type
+
+text_json = parse_mime_type("text/json")
+application_json = parse_mime_type("application/json")
+
+# JSON values that can be stored in a column as they are
+column_types = (str, int, float, bool, type(None))
+
+def quote_identifier(name):
+    """Quote a table or column name for use in SQL.
+    """
+    return '"{0}"'.format(name.replace('"', '""'))
+
+class ConnectionPool(object):
+    """Hands out one sqlite3 connection per thread and database, creating
+    connections on first use and reusing them afterwards.
+
+    Args:
+        database: path to the database file.
+        cached_statements: size of each connection's prepared statement
+            cache.
+        **connect_kwargs: passed on to sqlite3.connect().
+    """
+    def __init__(self, database, cached_statements=256, **connect_kwargs):
+        self.database = database
+        self.connect_kwargs = dict(connect_kwargs)
+        self.connect_kwargs['cached_statements'] = cached_statements
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def connection(self):
+        """Get the calling thread's connection.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database, **self.connect_kwargs)
+            connection.row_factory = sqlite3.Row
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def close(self):
+        """Close the calling thread's connection, if it has one.
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            self.local.connection = None
+            with self.lock:
+                self.connections.remove(connection)
+            connection.close()
+
+# Filter translation
+
+def filter_to_sql(node, column):
+    """Translate a filter AST into an SQL expression and a list of parameters.
+    "column" maps a property name to a quoted column expression (or "NULL"
+    for unknown properties). The expression never evaluates to NULL, so that
+    negation works the same way as it does for compiled predicates.
+    """
+    if isinstance(node, And):
+        return _join_sql(' AND ', node.operands, column)
+    if isinstance(node, Or):
+        return _join_sql(' OR ', node.operands, column)
+    if isinstance(node, Not):
+        sql, params = filter_to_sql(node.operand, column)
+        return 'NOT {0}'.format(sql), params
+    return _comparison_to_sql(node, column(node.propname))
+
+def _join_sql(separator, operands, column):
+    parts = [filter_to_sql(operand, column) for operand in operands]
+    sql = separator.join(sql for sql, params in parts)
+    params = [p for sql, part_params in parts for p in part_params]
+    return '({0})'.format(sql), params
+
+def _comparison_to_sql(node, col):
+    operator = node.operator
+    value = node.value
+    if operator == 'equals':
+        if value is None:
+            return '({0} IS NULL)'.format(col), []
+        return 'coalesce({0} = ?, 0)'.format(col), [value]
+    if operator == 'not_equals':
+        return '({0} IS NOT ?)'.format(col), [value]
+    binary = {
+        'less': '<',
+        'less_or_equal': '<=',
+        'greater': '>',
+        'greater_or_equal': '>=',
+    }
+    if operator in binary:
+        return 'coalesce({0} {1} ?, 0)'.format(col, binary[operator]), [value]
+    if operator == 'prefix':
+        prefix = str(node.raw_value)
+        return (
+            "(typeof({0}) = 'text' AND substr({0}, 1, ?) = ?)".format(col),
+            [len(prefix), prefix])
+    if operator == 'in':
+        values = [v for v in value if v is not None]
+        parts = []
+        if values:
+            parts.append('coalesce({0} IN ({1}), 0)'.format(
+                col, ', '.join('?' * len(values))))
+        if len(values) < len(value):
+            parts.append('{0} IS NULL'.format(col))
+        return '({0})'.format(' OR '.join(parts) or '0'), values
+    if operator == 'between':
+        return 'coalesce({0} BETWEEN ? AND ?, 0)'.format(col), list(value)
+    return '0', []
+
+class RowResource(object):
+    """Child resource for a single row; its body is the row, as a dict.
+    """
+    def __init__(self, row):
+        self.row = row
+
+    def get_structured_body(self, **kwargs):
+        return self.row
+
+class SQLiteCollectionResource(object):
+    """A collection resource whose children are the rows of an SQLite table.
+
+    Args:
+        pool: a ConnectionPool, or the path to a database file.
+        table: name of the table.
+        key_column: the column that holds the children's names; usually the
+            table's primary key.
+        digest_columns: the columns to include in each child's digest (as
+            shown in listings); defaults to all columns.
+    """
+    default_count = 20
+
+    def __init__(self, pool, table, key_column='name', digest_columns=None):
+        if not isinstance(pool, ConnectionPool):
+            pool = ConnectionPool(pool)
+        self.pool = pool
+        self.table = table
+        self.key_column = key_column
+        self.digest_columns = digest_columns
+        self._columns = None
+
+    @property
+    def columns(self):
+        """The table's column names, read from the database on first use.
+        """
+        if self._columns is None:
+            rows = self.pool.connection().execute(
+                'PRAGMA table_info({0})'.format(quote_identifier(self.table)))
+            self._columns = tuple(row['name'] for row in rows)
+        return self._columns
+
+    def column(self, propname):
+        """Map a property name to a quoted column, or "NULL" if the table has
+        no such column.
+        """
+        if propname == '_name':
+            propname = self.key_column
+        if propname in self.columns:
+            return quote_identifier(propname)
+        return 'NULL'
+
+    def select_clause(self, columns):
+        return 'SELECT {0} FROM {1}'.format(
+            ', '.join(map(quote_identifier, columns)),
+            quote_identifier(self.table))
+
+    def query(self, sql, params=()):
+        return self.pool.connection().execute(sql, params).fetchall()
+
+    # Reading
+
+    def get_child(self, name):
+        rows = self.query(
+            '{0} WHERE {1} = ?'.format(
+                self.select_clause(self.columns),
+                quote_identifier(self.key_column)),
+            [name])
+        if not rows:
+            return None
+        return RowResource(dict(rows[0]))
+
+    def get_children(self,
+            offset=None,
+            count=None,
+            filters=None,
+            order=None,
+            cursor=None,
+            *args, **kwargs):
+        count = self.default_count if count is None else count
+        sql, params = self.listing_sql(offset, count, filters, order, cursor)
+        key = self.key_column
+        return [
+            (row[key], RowResource(dict(row)))
+            for row in self.query(sql, params)
+        ]
+
+    def get_children_digests(self,
+            offset=None,
+            count=None,
+            filters=None,
+            order=None,
+            cursor=None,
+            *args, **kwargs):
+        count = self.default_count if count is None else count
+        sql, params = self.listing_sql(offset, count, filters, order, cursor)
+        key = self.key_column
+        return [
+            (row[key], dict(row), False)
+            for row in self.query(sql, params)
+        ]
+
+    def listing_sql(self, offset, count, filters, order, cursor):
+        """Build the SQL for one page of children, returning (sql, params).
+        """
+        columns = list(self.digest_columns or self.columns)
+        if self.key_column not in columns:
+            columns.insert(0, self.key_column)
+        order = [
+            (descending, self.column(propname))
+            for descending, propname in (order or ())
+        ]
+        order = [(d, col) for d, col in order if col != 'NULL']
+        order.append((False, quote_identifier(self.key_column)))
+
+        conditions = []
+        params = []
+        for f in (filters or ()):
+            sql, filter_params = filter_to_sql(f, self.column)
+            conditions.append(sql)
+            params.extend(filter_params)
+        if cursor is not None:
+            sql, cursor_params = self.cursor_condition(order, cursor)
+            conditions.append(sql)
+            params.extend(cursor_params)
+
+        sql = self.select_clause(columns)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + ', '.join(
+            '{0} {1}'.format(col, 'DESC' if descending else 'ASC')
+            for descending, col in order)
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([count, offset or 0])
+        return sql, params
+
+    def cursor_condition(self, order, cursor):
+        """Build a keyset condition that selects the rows that come after the
+        row named "cursor" in the given order; (sql, params).
+
+        SQLite sorts NULLs first in ascending order and last in descending
+        order, which is taken into account when comparing against NULLs.
+        """
+        cursor_row = '(SELECT {0} FROM {1} WHERE {2} = ?)'
+        key = quote_identifier(self.key_column)
+        table = quote_identifier(self.table)
+        def cursor_value(col):
+            return cursor_row.format(col, table, key)
+
+        alternatives = []
+        params = []
+        for i, (descending, col) in enumerate(order):
+            parts = []
+            for _, earlier in order[:i]:
+                parts.append('{0} IS {1}'.format(earlier, cursor_value(earlier)))
+                params.append(cursor)
+            value = cursor_value(col)
+            if descending:
+                parts.append(
+                    '({1} IS NOT NULL AND ({0} < {1} OR {0} IS NULL))'
+                    .format(col, value))
+                params.extend([cursor, cursor])
+            else:
+                parts.append(
+                    '(CASE WHEN {1} IS NULL THEN {0} IS NOT NULL'
+                    ' ELSE coalesce({0} > {1}, 0) END)'
+                    .format(col, value))
+                params.extend([cursor, cursor])
+            alternatives.append('(' + ' AND '.join(parts) + ')')
+        # An unknown cursor yields an empty page rather than the first one.
+        sql = '(EXISTS (SELECT 1 FROM {0} WHERE {1} = ?) AND ({2}))'.format(
+            table, key, ' OR '.join(alternatives))
+        return sql, [cursor] + params
+
+    # Writing
+
+    def parse_body(self, input, content_type=None):
+        """Parse a request body into a row: a JSON object whose keys are all
+        columns of the table.
+        """
+        content_type = content_type or application_json
+        if not (match_mime(text_json, content_type) or
+                match_mime(application_json, content_type)):
+            raise ResourceException(ResourceException.reason_wrong_type)
+        charset = content_type.props.get('charset', 'utf8')
+        try:
+            row = json.loads(input.read().decode(charset))
+        except (ValueError, LookupError):
+            raise ResourceException(ResourceException.reason_malformed)
+        self.check_row(row)
+        return row
+
+    def check_row(self, row):
+        """Raise a ResourceException unless a row is a dict of columns of
+        the table to values that SQLite can store (no nested objects or
+        arrays).
+        """
+        if not isinstance(row, dict) or \
+                any(k not in self.columns for k in row) or \
+                any(not isinstance(v, column_types) for v in row.values()):
+            raise ResourceException(ResourceException.reason_malformed)
+
+    def is_key_conflict(self, error):
+        """Check whether an IntegrityError is a UNIQUE (or PRIMARY KEY)
+        violation on the key column alone, that is, a name that is taken.
+        """
+        prefix = 'UNIQUE constraint failed: '
+        message = str(error)
+        if not message.startswith(prefix):
+            return False
+        columns = [
+            column.strip().rpartition('.')[2]
+            for column in message[len(prefix):].split(',')
+        ]
+        return columns == [self.key_column]
+
+    def make_name(self, row):
+        """Generate a name for a newly created row.
+        """
+        return uuid.uuid4().hex
+
+    def write_rows(self, rows, replace):
+        """Write rows in a single transaction, returning one outcome per row:
+        a (name, row) pair, or a ResourceException. Rows may also be
+        exceptions, which are passed through as their outcome.
+        """
+        connection = self.pool.connection()
+        outcomes = []
+        with connection:
+            for row in rows:
+                if isinstance(row, Exception):
+                    outcomes.append(row)
+                    continue
+                columns = list(row.keys())
+                sql = '{0} INTO {1} ({2}) VALUES ({3})'.format(
+                    'INSERT OR REPLACE' if replace else 'INSERT',
+                    quote_identifier(self.table),
+                    ', '.join(map(quote_identifier, columns)),
+                    ', '.join('?' * len(columns)))
+                try:
+                    connection.execute(sql, [row[c] for c in columns])
+                except sqlite3.IntegrityError as e:
+                    # other constraints (NOT NULL, CHECK, FOREIGN KEY, ...)
+                    # reject the row itself
+                    outcomes.append(ResourceException(
+                        ResourceException.reason_exists
+                        if self.is_key_conflict(e)
+                        else ResourceException.reason_malformed))
+                except OverflowError:
+                    # integers beyond SQLite's 64 bits
+                    outcomes.append(
+                        ResourceException(ResourceException.reason_malformed))
+                else:
+                    outcomes.append((row[self.key_column], row))
+        return outcomes
+
+    def write_row(self, row, replace):
+        outcome, = self.write_rows([row], replace)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def new_row(self, row):
+        if row.get(self.key_column) is None:
+            row[self.key_column] = self.make_name(row)
+        return row
+
+    def named_row(self, row, name):
+        row[self.key_column] = name
+        return row
+
+    def checked(self, row, make_row, *args):
+        try:
+            self.check_row(row)
+        except ResourceException as e:
+            return e
+        return make_row(dict(row), *args)
+
+    def create(self, input, content_type=None):
+        row = self.new_row(self.parse_body(input, content_type))
+        return self.write_row(row, replace=False)
+
+    def create_many(self, documents):
+        rows = [self.checked(row, self.new_row) for row in documents]
+        return self.write_rows(rows, replace=False)
+
+    def store(self, input, name, content_type=None):
+        row = self.named_row(self.parse_body(input, content_type), name)
+        return self.write_row(row, replace=True)
+
+    def store_many(self, items):
+        rows = [
+            self.checked(row, self.named_row, name)
+            for name, row in items
+        ]
+        return self.write_rows(rows, replace=True)
+
+    def delete(self, name):
+        connection = self.pool.connection()
+        with connection:
+            cursor = connection.execute(
+                'DELETE FROM {0} WHERE {1} = ?'.format(
+                    quote_identifier(self.table),
+                    quote_identifier(self.key_column)),
+                [name])
+        if cursor.rowcount == 0:
+            raise ResourceException(ResourceException.reason_does_not_exist)
+        return True
@@ -0,0 +1,74 @@
+"""Per-request phase timing.
+
+When timing is enabled (see serve_resource()), each request gets a
+PhaseTimer, which accumulates the time spent in each phase of serving it,
+measured with time.perf_counter() (a monotonic clock):
+
+- parse: parsing the WSGI environ into a request
+- route: finding the target resource (get_child(), resolve_path())
+- body: getting the resource's own body (get_structured_body(),
+  get_typed_body(), get_typed_body_range())
+- children: listing children (get_children(), get_children_digests())
+- digests: getting the digests of listed children, one by one
+- hateoas: adding HATEOAS links
+- write: serializing the response (response writers, JSON encoding)
+- store: writing (create(), store(), delete())
+- total: the whole request, up to the point where the response body is
+  returned to the WSGI server (so streamed bodies are not included)
+
+Phases that occur several times in a request (such as route, for deep
+paths) are summed. The timings are available as a Server-Timing header and
+to a callback.
+
+When timing is disabled, the request carries no timer, and each phase costs
+a single dictionary lookup.
+"""
+
+import time
+
+class PhaseTimer(object):
+    """Accumulates the durations, in seconds, of named phases.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+
+    def add(self, phase, duration):
+        self.durations[phase] = self.durations.get(phase, 0.0) + duration
+
+    def call(self, phase, f, *args, **kwargs):
+        """Call f(*args, **kwargs), adding the time it takes to "phase".
+        """
+        started = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    def mark(self, phase):
+        """Add the time since the timer was started to "phase".
+        """
+        self.add(phase, time.perf_counter() - self.started)
+
+    def timings(self):
+        """The phases and their durations, as a list of (phase, seconds)
+        pairs, in the order in which the phases were first seen.
+        """
+        return list(self.durations.items())
+
+    def server_timing(self):
+        """Format the timings as the value of a Server-Timing header, with
+        durations in milliseconds.
+        """
+        return ', '.join(
+            '{0};dur={1:.3f}'.format(phase, duration * 1e3)
+            for phase, duration in self.durations.items())
+
+def timed(request, phase, f, *args, **kwargs):
+    """Call f(*args, **kwargs), timing it as "phase" if the request has a
+    timer.
+    """
+    timer = request.get('timer')
+    if timer is None:
+        return f(*args, **kwargs)
+    return timer.call(phase, f, *args, **kwargs)
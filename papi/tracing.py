@@ -0,0 +1,288 @@
+"""Tracing of the calls papi makes to resources.
+
+Tracer is an API middleware that wraps the root resource, for each request,
+in a TracingProxy. The proxy times every call to a resource protocol method
+(get_child(), get_children(), get_structured_body(), store(), ...), and
+wraps the resources these calls return in turn, so that the whole tree is
+traced. The calls of a request make up a call tree (a call that a resource
+makes to another proxied resource is nested under it), which is analyzed
+for common performance problems:
+
+- n_plus_one_digests: get_structured_body(digest=True) called once per
+  child of a listing; implement get_children_digests() to fetch the digests
+  in bulk
+- repeated_get_child: get_child() called more than once for the same name
+  on the same resource
+- slow_call: a single call that took longer than a threshold
+
+The trace goes to a callback, and optionally into a response header:
+
+    def log_trace(request, trace):
+        for finding in trace.findings:
+            logger.warning("%s: %r", "/".join(request['path']), finding)
+
+    application = serve_resource(root, api_middleware=Tracer(log_trace))
+
+Proxies are transparent to papi: attributes that the resource lacks are
+missing from the proxy as well, and the proxy reports the resource's class
+as its own (so that, for instance, papi.metrics route templates do not
+change). Tracing has a cost, and is meant for debugging and profiling.
+"""
+
+import threading
+import time
+from papi.capabilities import protocol_methods
+
+class Call(object):
+    """A traced call: which method of which resource (identified by its
+    path in the tree and its class), with what arguments, how long it took
+    (in seconds), and the traced calls it made in turn.
+    """
+    def __init__(self, path, resource_class, method, args, kwargs):
+        self.path = path
+        self.resource_class = resource_class
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.duration = None
+        self.calls = []
+
+    def describe(self):
+        arguments = [repr(a) for a in self.args] + [
+            '{0}={1!r}'.format(k, v) for k, v in sorted(self.kwargs.items())]
+        return '/{0} {1}.{2}({3})'.format(
+            '/'.join(self.path), self.resource_class, self.method,
+            ', '.join(arguments))
+
+    def walk(self):
+        """This call and all calls nested in it, depth first.
+        """
+        yield self
+        for call in self.calls:
+            for nested in call.walk():
+                yield nested
+
+class Trace(object):
+    """The traced calls of one request.
+    """
+    def __init__(self):
+        self.calls = []
+        self.findings = []
+        self.duration = None
+        self.lock = threading.Lock()
+        # calls in progress, per thread (digests may be computed on an
+        # executor)
+        self.local = threading.local()
+
+    def begin(self, call):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        if stack:
+            stack[-1].calls.append(call)
+        else:
+            with self.lock:
+                self.calls.append(call)
+        stack.append(call)
+
+    def end(self, call, duration):
+        call.duration = duration
+        self.local.stack.pop()
+
+    def walk(self):
+        for call in list(self.calls):
+            for nested in call.walk():
+                yield nested
+
+    def format(self):
+        """Format the call tree as text, one call per line, indented by
+        nesting level.
+        """
+        lines = []
+        def add(call, depth):
+            lines.append('{0}{1} {2:.3f}ms'.format(
+                '  ' * depth, call.describe(), call.duration * 1e3))
+            for nested in call.calls:
+                add(nested, depth + 1)
+        for call in self.calls:
+            add(call, 0)
+        return '\n'.join(lines)
+
+class TracingProxy(object):
+    """Wraps a resource, recording its protocol method calls in a Trace.
+    """
+    def __init__(self, resource, trace, path=()):
+        object.__setattr__(self, '_resource', resource)
+        object.__setattr__(self, '_trace', trace)
+        object.__setattr__(self, '_path', tuple(path))
+
+    @property
+    def __class__(self):
+        return self._resource.__class__
+
+    def __getattr__(self, name):
+        attribute = getattr(self._resource, name)
+        if name not in protocol_methods or not callable(attribute):
+            return attribute
+        def traced(*args, **kwargs):
+            return self._call(name, attribute, args, kwargs)
+        return traced
+
+    def __setattr__(self, name, value):
+        setattr(self._resource, name, value)
+
+    def __repr__(self):
+        return 'TracingProxy({0!r})'.format(self._resource)
+
+    def _wrap(self, resource, path):
+        if resource is None or isinstance(resource, (dict, list, tuple)):
+            return resource
+        return TracingProxy(resource, self._trace, path)
+
+    def _call(self, name, method, args, kwargs):
+        call = Call(
+            self._path, self._resource.__class__.__name__, name, args, kwargs)
+        self._trace.begin(call)
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            self._trace.end(call, time.perf_counter() - started)
+        if name == 'get_child':
+            return self._wrap(result, self._path + (args[0],))
+        if name == 'get_children' and result is not None:
+            return [
+                (child_name, self._wrap(child, self._path + (child_name,)))
+                for child_name, child in result
+            ]
+        if name == 'resolve_path' and result is not None:
+            target, parent, remaining = result
+            consumed = len(args[0]) - len(remaining or ())
+            target_path = self._path + tuple(args[0][:consumed])
+            return (
+                self._wrap(target, target_path),
+                self._wrap(parent, target_path[:-1]),
+                remaining)
+        return result
+
+def find_n_plus_one_digests(trace, threshold):
+    """Listings that fetched the digests of at least "threshold" children
+    one get_structured_body(digest=True) call at a time.
+    """
+    listings = {}
+    for call in trace.walk():
+        if call.method == 'get_structured_body' and \
+                call.kwargs.get('digest') and call.path:
+            listings.setdefault(call.path[:-1], []).append(call)
+    return [
+        {
+            'pattern': 'n_plus_one_digests',
+            'path': '/' + '/'.join(path),
+            'resource_class': calls[0].resource_class,
+            'count': len(calls),
+            'duration': sum(call.duration for call in calls),
+        }
+        for path, calls in sorted(listings.items())
+        if len(calls) >= threshold
+    ]
+
+def find_repeated_get_child(trace):
+    """get_child() calls for the same name on the same resource.
+    """
+    lookups = {}
+    for call in trace.walk():
+        if call.method == 'get_child' and call.args:
+            key = (call.path, call.args[0])
+            lookups.setdefault(key, []).append(call)
+    return [
+        {
+            'pattern': 'repeated_get_child',
+            'path': '/' + '/'.join(path + (name,)),
+            'resource_class': calls[0].resource_class,
+            'count': len(calls),
+            'duration': sum(call.duration for call in calls),
+        }
+        for (path, name), calls in sorted(lookups.items())
+        if len(calls) > 1
+    ]
+
+def find_slow_calls(trace, threshold):
+    """Calls that took at least "threshold" seconds.
+    """
+    return [
+        {
+            'pattern': 'slow_call',
+            'path': '/' + '/'.join(call.path),
+            'resource_class': call.resource_class,
+            'call': call.describe(),
+            'duration': call.duration,
+        }
+        for call in trace.walk()
+        if call.duration >= threshold
+    ]
+
+def summary_header(trace):
+    """A one-line summary of a trace, for a debug response header.
+    """
+    calls = list(trace.walk())
+    parts = [
+        'calls={0}'.format(len(calls)),
+        'dur={0:.3f}'.format(sum(call.duration for call in trace.calls) * 1e3),
+    ]
+    for finding in trace.findings:
+        parts.append('{0}={1}:{2}'.format(
+            finding['pattern'], finding['path'], finding.get('count', 1)))
+    return '; '.join(parts)
+
+class Tracer(object):
+    """API middleware that traces the resource calls of each request (see
+    the module documentation).
+
+    Args:
+        callback: a function that gets called with the request and its
+            Trace, after the request has been handled (or has failed).
+        header: if given, the name of a response header that gets a
+            one-line summary of the trace (e.g. 'X-Papi-Trace').
+        n_plus_one_threshold: the number of per-child digest calls in one
+            listing from which they are reported as n_plus_one_digests.
+        slow_call_threshold: the duration, in seconds, from which a call is
+            reported as a slow_call; None disables the check.
+        api_middleware: an inner API middleware to run the handler through.
+    """
+    def __init__(self,
+            callback=None,
+            header=None,
+            n_plus_one_threshold=3,
+            slow_call_threshold=0.1,
+            api_middleware=None):
+        self.callback = callback
+        self.header = header
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.api_middleware = api_middleware
+
+    def analyze(self, trace):
+        findings = find_n_plus_one_digests(trace, self.n_plus_one_threshold)
+        findings += find_repeated_get_child(trace)
+        if self.slow_call_threshold is not None:
+            findings += find_slow_calls(trace, self.slow_call_threshold)
+        return findings
+
+    def __call__(self, handle, resource, request):
+        trace = Trace()
+        proxy = TracingProxy(resource, trace)
+        started = time.perf_counter()
+        try:
+            if self.api_middleware is None:
+                status, headers, body = handle(proxy, request)
+            else:
+                status, headers, body = \
+                    self.api_middleware(handle, proxy, request)
+        finally:
+            trace.duration = time.perf_counter() - started
+            trace.findings = self.analyze(trace)
+            if self.callback is not None:
+                self.callback(request, trace)
+        if self.header is not None:
+            headers = list(headers) + [(self.header, summary_header(trace))]
+        return status, headers, body
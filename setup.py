@@ -66,7 +66,7 @@ setup(
 
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
-    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'venv', 'example']),
+    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'benchmarks', 'venv', 'example']),
 
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
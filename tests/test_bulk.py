@@ -0,0 +1,161 @@
+from papi.bulk import *
+from papi.collection import IndexedCollectionResource
+from papi.exceptions import ResourceException
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import io
+import json
+
+def parse_status_lines(response):
+    body = response['body']
+    return [json.loads(line) for line in body.decode('utf8').splitlines()]
+
+# read_lines() tests
+
+def test_read_lines():
+    input = io.BytesIO(b'one\ntwo\n\nthree')
+    expected = [b'one', b'two', b'', b'three']
+    actual = list(read_lines(input, chunk_size=2))
+    assert_equal(expected, actual)
+
+def test_read_lines_content_length():
+    input = io.BytesIO(b'one\ntwo\nthree\n')
+    expected = [b'one', b'tw']
+    actual = list(read_lines(input, content_length=6, chunk_size=4))
+    assert_equal(expected, actual)
+
+# parse_records() tests
+
+def test_parse_records():
+    records = list(parse_records([b'{"a": 1}', b'', b'nope', b'2']))
+    assert_equal((0, {'a': 1}), records[0])
+    assert_equal(1, records[1][0])
+    assert isinstance(records[1][1], MalformedException)
+    assert_equal((2, 2), records[2])
+
+# bulk_write() tests
+
+class RecordingResource(object):
+    """Records create / store calls, failing for documents equal to "bad".
+    """
+    def __init__(self):
+        self.calls = []
+
+    def create(self, input, content_type=None):
+        document = json.loads(input.read().decode('utf8'))
+        self.calls.append(('create', document))
+        if document == 'bad':
+            raise ResourceException(ResourceException.reason_exists)
+        return 'n{0}'.format(len(self.calls)), document
+
+    def store(self, input, name, content_type=None):
+        document = json.loads(input.read().decode('utf8'))
+        self.calls.append(('store', name, document))
+        return name, document
+
+def status_lines(lines):
+    return [json.loads(line.decode('utf8')) for line in lines]
+
+def test_bulk_create_fallback():
+    resource = RecordingResource()
+    records = enumerate(['a', 'bad', MalformedException(), 'b'])
+    expected = [
+        {'index': 0, 'status': 201, '_name': 'n1'},
+        {'index': 1, 'status': 409, 'error': 'Conflict'},
+        {'index': 2, 'status': 400, 'error': 'Malformed Input'},
+        {'index': 3, 'status': 201, '_name': 'n3'},
+    ]
+    actual = status_lines(bulk_write(resource, records, create=True))
+    assert_equal(expected, actual)
+
+def test_bulk_store_fallback():
+    resource = RecordingResource()
+    records = enumerate([
+        {'_name': 'a', 'color': 'red'},
+        {'_name': 'b', '_value': 'hello'},
+        {'color': 'nameless'},
+    ])
+    expected = [
+        {'index': 0, 'status': 200, '_name': 'a'},
+        {'index': 1, 'status': 200, '_name': 'b'},
+        {'index': 2, 'status': 400, 'error': 'Malformed Input'},
+    ]
+    actual = status_lines(bulk_write(resource, records, create=False))
+    assert_equal(expected, actual)
+    assert_equal([
+        ('store', 'a', {'color': 'red'}),
+        ('store', 'b', 'hello'),
+    ], resource.calls)
+
+def test_bulk_store_many_batches():
+    class MyResource(object):
+        def __init__(self):
+            self.batches = []
+
+        def store_many(self, items):
+            self.batches.append(items)
+            return items
+
+    resource = MyResource()
+    records = enumerate({'_name': str(i), '_value': i} for i in range(5))
+    list(bulk_write(resource, records, create=False, batch_size=2))
+    assert_equal([
+        [('0', 0), ('1', 1)],
+        [('2', 2), ('3', 3)],
+        [('4', 4)],
+    ], resource.batches)
+
+def test_bulk_write_failing_batches():
+    class MyResource(object):
+        def __init__(self):
+            self.batches = 0
+
+        def store_many(self, items):
+            self.batches += 1
+            if self.batches == 1:
+                raise ValueError('backend down')
+            if self.batches == 2:
+                return items[:1]
+            return items
+
+    records = enumerate({'_name': str(i), '_value': i} for i in range(5))
+    lines = status_lines(
+        bulk_write(MyResource(), records, create=False, batch_size=2))
+    assert_equal([0, 1, 2, 3, 4], [l['index'] for l in lines])
+    assert_equal([500, 500, 500, 500, 200], [l['status'] for l in lines])
+
+# end-to-end tests
+
+def test_serve_bulk_put():
+    collection = IndexedCollectionResource()
+    application = serve_resource(collection, bulk_batch_size=2)
+    body = '\n'.join(
+        json.dumps({'_name': 'doc{0}'.format(i), 'i': i}) for i in range(5))
+    response = mock_request(application, 'PUT', '/',
+        headers=[('Content-Type', 'application/x-ndjson')],
+        request_body=body)
+    assert_equal('200 OK', response['status'])
+    assert_equal([200] * 5, [l['status'] for l in parse_status_lines(response)])
+    assert_equal({'i': 3}, collection.get_child('doc3').get_structured_body())
+
+def test_serve_bulk_post():
+    collection = IndexedCollectionResource()
+    application = serve_resource(collection)
+    response = mock_request(application, 'POST', '/',
+        headers=[('Content-Type', 'application/x-ndjson')],
+        request_body='{"i": 1}\n{"i": 2\n{"i": 3}\n')
+    lines = parse_status_lines(response)
+    assert_equal([201, 400, 201], [l['status'] for l in lines])
+    assert_equal({'i': 3},
+        collection.get_child(lines[2]['_name']).get_structured_body())
+
+def test_serve_bulk_conditional():
+    collection = IndexedCollectionResource()
+    application = serve_resource(collection)
+    for method, header in [('PUT', 'If-Match'), ('POST', 'If-None-Match')]:
+        response = mock_request(application, method, '/',
+            headers=[('Content-Type', 'application/x-ndjson'), (header, '*')],
+            request_body='{"_name": "a"}\n')
+        assert_equal('412 Precondition Failed', response['status'])
+    assert_equal(None, collection.get_child('a'))
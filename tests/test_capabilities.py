@@ -0,0 +1,111 @@
+from papi.capabilities import *
+from papi.exceptions import InvalidResourceException
+from papi.serve import serve_resource
+from papi.tracing import Tracer
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request, parse_json_body
+import gc
+import papi.capabilities
+import weakref
+
+class ItemResource(object):
+    def get_structured_body(self, digest=False, **kwargs):
+        return {'digest': digest}
+
+class BrokenItemResource(object):
+    def get_structured_body(self, **kwargs):
+        return self.missing
+
+class RootResource(object):
+    get_version = None
+
+    def __init__(self):
+        self.children = {'item': ItemResource(), 'broken': BrokenItemResource()}
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+    def get_children(self, offset=None, count=None, *args, **kwargs):
+        return sorted(self.children.items())
+
+def test_capabilities():
+    caps = capabilities(RootResource())
+    assert caps.get_child
+    assert caps.get_children
+    assert not caps.store
+    # non-callable attributes do not count
+    assert not caps.get_version
+    assert_equal(frozenset(['get_child', 'get_children']), caps.methods)
+    # computed once per class
+    assert caps is capabilities(RootResource())
+    assert_equal(frozenset(), capabilities({'a': 1}).methods)
+
+def test_weak_cache():
+    class Temporary(object):
+        def get_child(self, name):
+            return None
+    caps = capabilities(Temporary())
+    assert caps.get_child
+    assert Temporary in papi.capabilities._cache
+    # the cache does not keep the class alive
+    reference = weakref.ref(Temporary)
+    del Temporary
+    gc.collect()
+    assert reference() is None
+
+def test_dynamic_classes():
+    class Dynamic(object):
+        def __init__(self, methods):
+            self.methods = methods
+        def __getattr__(self, name):
+            if name in self.methods:
+                return lambda *args, **kwargs: None
+            raise AttributeError(name)
+    assert capabilities(Dynamic(['store'])).store
+    assert not capabilities(Dynamic(['delete'])).store
+
+def test_attribute_errors_are_not_swallowed():
+    application = serve_resource(RootResource())
+    response = mock_request(application, 'GET', '/item')
+    assert_equal('200 OK', response['status'])
+    response = mock_request(application, 'GET', '/broken')
+    assert_equal('500 Internal Server Error', response['status'])
+    response = mock_request(application, 'GET', '/')
+    assert_equal('500 Internal Server Error', response['status'])
+
+def test_tracing_proxies():
+    application = serve_resource(RootResource(), api_middleware=Tracer())
+    response = parse_json_body(mock_request(application, 'GET', '/item'))
+    assert_equal('200 OK', response['status'])
+    assert_equal(False, response['body']['digest'])
+
+def test_validate():
+    validate_tree(RootResource())
+    class NotCallable(object):
+        store = 'yes'
+    class WrongSignature(object):
+        def get_child(self):
+            return None
+    class RangesOnly(object):
+        def get_typed_body_range(self, mime_pattern, byte_range):
+            return None
+    class Nested(object):
+        def get_children(self, **kwargs):
+            return [('value', 1), ('bad', WrongSignature())]
+    for resource, message in [
+            (NotCallable(), 'NotCallable.store is not callable'),
+            (WrongSignature(),
+                'WrongSignature.get_child() must accept the arguments (name)'),
+            (RangesOnly(), 'RangesOnly implements get_typed_body_range() '
+                'but not get_typed_body()'),
+            (Nested(),
+                'WrongSignature.get_child() must accept the arguments (name)'),
+            ]:
+        try:
+            serve_resource(resource, validate=True)
+        except InvalidResourceException as e:
+            assert_equal(message, str(e))
+        else:
+            assert False, message
+    # too deep to be found
+    validate_tree(Nested(), max_depth=0)
@@ -0,0 +1,152 @@
+from papi.capture import *
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import os
+import tempfile
+import time
+
+class ItemResource(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_structured_body(self, **kwargs):
+        return self.data
+
+class RootResource(object):
+    def __init__(self, version=1):
+        self.children = {
+            'apple': ItemResource({'color': 'red', 'version': version}),
+            'pear': ItemResource({'color': 'green'}),
+        }
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+    def store(self, input, name, content_type=None):
+        self.children[name] = ItemResource({'text': input.read().decode()})
+        return name, {}
+
+def capture_traffic(filename, **kwargs):
+    application = capture_middleware(
+        serve_resource(RootResource()), filename, **kwargs)
+    json_headers = [('Accept', 'application/json')]
+    responses = [
+        mock_request(application, 'GET', '/apple', 'hateoas=off',
+            headers=json_headers + [('Authorization', 'secret')]),
+        mock_request(application, 'GET', '/nope'),
+        mock_request(application, 'PUT', '/pear', headers=json_headers + [
+            ('Content-Type', 'text/plain')], request_body='ripe'),
+        mock_request(application, 'GET', '/pear', headers=json_headers),
+    ]
+    return responses
+
+def test_capture():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'traffic.jsonl.gz')
+        responses = capture_traffic(filename)
+        assert_equal('200 OK', responses[0]['status'])
+        records = list(read_log(filename))
+    assert_equal(
+        [('GET', '/apple', 200), ('GET', '/nope', 404), ('PUT', '/pear', 200),
+            ('GET', '/pear', 200)],
+        [(r['m'], r['p'], r['s']) for r in records])
+    first = records[0]
+    assert_equal('hateoas=off', first['q'])
+    # the Authorization header is redacted
+    assert_equal(
+        [['Accept', 'application/json'], ['Content-Type', 'text/plain']],
+        first['h'])
+    assert_equal(len(responses[0]['body']), first['n'])
+    assert first['d'] > 0
+    assert 'b' not in first
+    assert_equal('ripe', records[2]['b'])
+    assert records[0]['t'] <= records[3]['t']
+
+def test_method_override():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'traffic.jsonl')
+        application = capture_middleware(
+            serve_resource(RootResource()), filename)
+        response = mock_request(application, 'POST', '/pear',
+            headers=[('X-Method-Override', 'PUT')], request_body='ripe')
+        assert_equal('200 OK', response['status'])
+        record, = read_log(filename)
+    # the original method is logged with the override, which replays it
+    assert_equal('POST', record['m'])
+    assert ['X-Method-Override', 'PUT'] in record['h'], record['h']
+    root = RootResource()
+    assert_equal(200, replay_one(serve_resource(root), record)[0])
+    assert_equal({'text': 'ripe'}, root.children['pear'].data)
+
+def test_non_ascii_path():
+    path_info = '/caf\u00e9'.encode('utf8').decode('latin-1')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'traffic.jsonl')
+        application = capture_middleware(
+            serve_resource(RootResource()), filename)
+        mock_request(application, 'GET', path_info)
+        record, = read_log(filename)
+    assert_equal('/caf%C3%A9', record['p'])
+    assert_equal(path_info, record_spec(record).environ()['PATH_INFO'])
+
+def test_redaction_and_limits():
+    def drop_puts(record):
+        return None if record['m'] == 'PUT' else redact_headers(record)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'traffic.jsonl')
+        capture_traffic(filename, redact=drop_puts)
+        assert_equal(['GET', 'GET', 'GET'],
+            [r['m'] for r in read_log(filename)])
+        filename = os.path.join(directory, 'bodies.jsonl')
+        capture_traffic(filename, max_body_bytes=2)
+        records = list(read_log(filename))
+        assert_equal(None, records[2]['b'])
+        filename = os.path.join(directory, 'none.jsonl')
+        capture_traffic(filename, rate=0.0)
+        assert_equal([], list(read_log(filename)))
+
+def test_binary_bodies():
+    record = {}
+    encode_body(record, b'\xff\x00')
+    assert_equal(b'\xff\x00', decode_body(record))
+    record = {}
+    encode_body(record, b'text')
+    assert_equal({'b': 'text'}, record)
+
+def test_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'traffic.jsonl')
+        capture_traffic(filename)
+        report = replay(serve_resource(RootResource()), filename)
+        assert_equal(4, report['requests'])
+        assert_equal(0, report['status_mismatches'])
+        assert_equal(0, report['body_mismatches'])
+        assert_equal(0, report['errors'])
+        assert_equal(
+            set(['GET /apple', 'GET /nope', 'PUT /pear', 'GET /pear']),
+            set(report['routes']))
+        assert report['latency']['replayed']['p50'] > 0
+        assert 'GET /apple' in format_report(report)
+        # a changed application
+        report = replay(serve_resource(RootResource(version=2)), filename)
+        assert_equal(1, report['body_mismatches'])
+        assert_equal('GET /apple?hateoas=off',
+            report['mismatches'][0]['request'])
+        report = replay(serve_resource(RootResource(version=2)), filename,
+            compare_bodies=False)
+        assert_equal(0, report['body_mismatches'])
+
+def test_replay_pacing():
+    records = [
+        {'t': 0.0, 'm': 'GET', 'p': '/apple', 'q': '', 'h': [], 's': 200,
+            'd': 0.001},
+        {'t': 0.2, 'm': 'GET', 'p': '/apple', 'q': '', 'h': [], 's': 200,
+            'd': 0.001},
+    ]
+    started = time.perf_counter()
+    report = replay(serve_resource(RootResource()), records, speed=2.0,
+        compare_bodies=False)
+    elapsed = time.perf_counter() - started
+    assert_equal(0, report['status_mismatches'])
+    assert 0.1 <= elapsed < 0.5
@@ -0,0 +1,114 @@
+from papi.coalesce import *
+from papi.exceptions import NotFoundException
+from papi.mime import parse_http_accept
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import threading
+import time
+
+def make_request(path=('things',), method='GET', query=None, headers=None):
+    return {
+        'path': path,
+        'method': method,
+        'query': query or {},
+        'accept': parse_http_accept('text/json'),
+        'headers': headers or {},
+    }
+
+class BlockingHandler(object):
+    """A handler that blocks until released, counting its calls.
+    """
+    def __init__(self, result=None, exception=None):
+        self.result = result or ((200, 'OK'), [('Content-type', 'text/json')], b'[]')
+        self.exception = exception
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, resource, request):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+def run_concurrently(middleware, handler, requests):
+    """Run the first request, wait until it is inside the handler, run the
+    others, and release the handler; returns outcomes in request order.
+    """
+    outcomes = [None] * len(requests)
+    def run(i):
+        try:
+            outcomes[i] = middleware(handler, None, requests[i])
+        except Exception as e:
+            outcomes[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    threads[0].start()
+    handler.entered.wait()
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    handler.release.set()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def test_coalesce():
+    middleware = SingleFlight()
+    handler = BlockingHandler()
+    outcomes = run_concurrently(middleware, handler, [make_request()] * 5)
+    assert_equal(1, handler.calls)
+    assert_equal([handler.result] * 5, outcomes)
+    assert_equal({'leaders': 1, 'coalesced': 4}, dict(middleware.metrics))
+
+def test_coalesce_exception():
+    middleware = SingleFlight()
+    handler = BlockingHandler(exception=NotFoundException())
+    outcomes = run_concurrently(middleware, handler, [make_request()] * 3)
+    assert_equal(1, handler.calls)
+    assert all(isinstance(o, NotFoundException) for o in outcomes), outcomes
+    # followers raise copies of the leader's exception, chained to it
+    assert_equal(3, len(set(map(id, outcomes))))
+    assert_equal(2, sum(o.__cause__ is handler.exception for o in outcomes))
+
+def test_coalesce_timeout():
+    middleware = SingleFlight(timeout=0.01)
+    handler = BlockingHandler()
+    outcomes = run_concurrently(middleware, handler, [make_request()] * 2)
+    assert_equal(2, handler.calls)
+    assert_equal({'leaders': 1, 'timeouts': 1}, dict(middleware.metrics))
+
+def test_coalesce_different_requests():
+    middleware = SingleFlight(timeout=1)
+    handler = BlockingHandler()
+    outcomes = run_concurrently(middleware, handler, [
+        make_request(),
+        make_request(query={'page': '2'}),
+        make_request(path=('other',)),
+        make_request(method='POST'),
+        make_request(headers={'Authorization': 'Basic bWU6cHc='}),
+        make_request(headers={'Cookie': 'session=1'}),
+    ])
+    assert_equal(6, handler.calls)
+    assert_equal({'leaders': 5}, dict(middleware.metrics))
+
+def test_request_key_query_order():
+    a = make_request(query={'page': '2', 'count': '10'})
+    b = make_request(query={'count': '10', 'page': '2'})
+    assert_equal(request_key(a), request_key(b))
+
+def test_serve_resource():
+    class MyResource(object):
+        def get_structured_body(self, *args, **kwargs):
+            return {'bird': 'canary'}
+
+    middleware = SingleFlight()
+    application = serve_resource(MyResource(), api_middleware=middleware)
+    response = mock_request(application, 'GET', '/',
+        query='hateoas=off',
+        headers=[('Accept', 'text/json')])
+    assert_equal('200 OK', response['status'])
+    assert_equal(b'{"bird": "canary"}', response['body'])
+    assert_equal({'leaders': 1}, dict(middleware.metrics))
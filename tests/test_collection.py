@@ -0,0 +1,217 @@
+from papi.collection import *
+from papi.filters import parse_filter, conjuncts
+from papi.exceptions import ResourceException
+from papi.mime import parse_mime_type
+from tests.test_utils import assert_equal
+import io
+import random
+
+fruit = {
+    'apple': {'color': 'red', 'price': 3},
+    'banana': {'color': 'yellow', 'price': 1},
+    'cherry': {'color': 'red', 'price': 5},
+    'date': {'color': 'brown', 'price': 5},
+    'elderberry': {'color': 'black'},
+}
+
+def make_collection(**kwargs):
+    return IndexedCollectionResource(
+        fruit,
+        indexes=('color',),
+        sorted_indexes=('price',),
+        **kwargs)
+
+def names(children):
+    return [name for name, child in children]
+
+def where(src):
+    return conjuncts(parse_filter(src))
+
+def reference(documents, filters=None, order=None, offset=0, count=20):
+    """Brute-force version of a listing, to check indexed listings against.
+    """
+    collection = IndexedCollectionResource(documents)
+    predicate = compile_filters(filters, collection.get_prop)
+    matches = [n for n in documents if predicate(n)]
+    key = collection._sort_key(order or ((False, '_name'),))
+    return sorted(matches, key=key)[offset:offset + count]
+
+# get_children() tests
+
+def test_get_children_default_order():
+    expected = ['apple', 'banana', 'cherry', 'date', 'elderberry']
+    actual = names(make_collection().get_children())
+    assert_equal(expected, actual)
+
+def test_get_children_order_sorted_index():
+    expected = ['elderberry', 'banana', 'apple', 'cherry', 'date']
+    actual = names(make_collection().get_children(order=((False, 'price'),)))
+    assert_equal(expected, actual)
+
+def test_get_children_order_descending():
+    expected = ['cherry', 'date', 'apple', 'banana', 'elderberry']
+    actual = names(make_collection().get_children(order=((True, 'price'),)))
+    assert_equal(expected, actual)
+
+def test_get_children_order_multiple_keys():
+    expected = ['cherry', 'date', 'apple']
+    actual = names(make_collection().get_children(
+        order=((True, 'price'), (True, 'color')),
+        count=3))
+    assert_equal(expected, actual)
+
+def test_get_children_order_unindexed():
+    expected = ['elderberry', 'date', 'apple', 'cherry', 'banana']
+    actual = names(make_collection().get_children(order=((False, 'color'),)))
+    assert_equal(expected, actual)
+
+def test_get_children_indexed_filter():
+    expected = ['cherry', 'apple']
+    actual = names(make_collection().get_children(
+        filters=where('color:red'),
+        order=((True, 'price'),)))
+    assert_equal(expected, actual)
+
+def test_get_children_mixed_filters():
+    expected = ['cherry']
+    actual = names(make_collection().get_children(
+        filters=where('color in [red,brown],price>=5,_name!=date')))
+    assert_equal(expected, actual)
+
+def test_get_children_name_filter():
+    expected = ['banana']
+    actual = names(make_collection().get_children(filters=where('_name:banana')))
+    assert_equal(expected, actual)
+
+def test_get_children_paging():
+    expected = ['apple', 'cherry']
+    actual = names(make_collection().get_children(
+        order=((False, 'price'),), offset=2, count=2))
+    assert_equal(expected, actual)
+
+def test_get_children_matches_reference():
+    rng = random.Random(42)
+    documents = dict(
+        ('doc{0}'.format(i), {
+            'a': rng.choice(['x', 'y', 'z', None]),
+            'b': rng.randint(0, 10),
+        })
+        for i in range(200))
+    collection = IndexedCollectionResource(
+        documents, indexes=('a', 'b'), sorted_indexes=('a', 'b'))
+    for src in [None, 'a:x', 'a:x,b:3', 'b in [1,2,3]', 'b>4|a:y']:
+        filters = None if src is None else where(src)
+        for order in [None, ((True, 'b'),), ((False, 'a'), (True, 'b'))]:
+            for offset, count in [(0, 20), (15, 10), (190, 20)]:
+                expected = reference(documents, filters, order, offset, count)
+                actual = names(collection.get_children(
+                    offset=offset, count=count, filters=filters, order=order))
+                assert_equal(expected, actual, (src, order, offset))
+
+# index maintenance tests
+
+def test_put_document_reindexes():
+    collection = make_collection()
+    collection.put_document('banana', {'color': 'green', 'price': 10})
+    assert_equal([], names(collection.get_children(filters=where('color:yellow'))))
+    assert_equal(['banana'], names(collection.get_children(
+        order=((True, 'price'),), count=1)))
+
+def test_delete_document_unindexes():
+    collection = make_collection()
+    collection.delete_document('cherry')
+    assert_equal(['apple'], names(collection.get_children(filters=where('color:red'))))
+    assert_equal(
+        ['date', 'apple', 'banana', 'elderberry'],
+        names(collection.get_children(order=((True, 'price'),))))
+
+# write protocol tests
+
+def test_store():
+    collection = make_collection()
+    content_type = parse_mime_type('application/json')
+    name, body, version = collection.store(
+        io.BytesIO(b'{"color": "red", "price": 2}'), 'fig', content_type)
+    assert_equal(('fig', {'color': 'red', 'price': 2}), (name, body))
+    assert_equal(collection.get_version('fig'), version)
+    assert_equal(['fig', 'apple', 'cherry'], names(collection.get_children(
+        filters=where('color:red'), order=((False, 'price'),))))
+
+def test_create():
+    collection = make_collection()
+    content_type = parse_mime_type('text/plain')
+    name, body = collection.create(io.BytesIO(b'hello'), content_type)
+    assert_equal('hello', collection.get_child(name).get_structured_body())
+
+def test_delete_nonexistent():
+    try:
+        make_collection().delete('nope')
+    except ResourceException as e:
+        assert_equal(ResourceException.reason_does_not_exist, e.reason)
+        return
+    raise AssertionError("expected ResourceException")
+
+# version tests
+
+def assert_version_mismatch(f, *args, **kwargs):
+    try:
+        f(*args, **kwargs)
+    except ResourceException as e:
+        assert_equal(ResourceException.reason_version_mismatch, e.reason)
+        return
+    raise AssertionError("expected ResourceException")
+
+def test_store_expected_version():
+    collection = make_collection()
+    content_type = parse_mime_type('application/json')
+    version = collection.get_version('apple')
+    collection.store(
+        io.BytesIO(b'{"color": "green"}'), 'apple', content_type,
+        expected_version=version)
+    assert version != collection.get_version('apple')
+    assert_version_mismatch(
+        collection.store,
+        io.BytesIO(b'{"color": "blue"}'), 'apple', content_type,
+        expected_version=version)
+    assert_equal({'color': 'green'},
+        collection.get_child('apple').get_structured_body())
+
+def test_store_expected_version_special():
+    collection = make_collection()
+    content_type = parse_mime_type('application/json')
+    collection.store(io.BytesIO(b'1'), 'apple', content_type,
+        expected_version='*')
+    assert_version_mismatch(
+        collection.store, io.BytesIO(b'1'), 'fig', content_type,
+        expected_version='*')
+    collection.store(io.BytesIO(b'1'), 'fig', content_type,
+        expected_version=None)
+    assert_version_mismatch(
+        collection.store, io.BytesIO(b'1'), 'fig', content_type,
+        expected_version=None)
+
+def test_delete_expected_version():
+    collection = make_collection()
+    assert_version_mismatch(collection.delete, 'apple', expected_version='0')
+    collection.delete('apple', expected_version=collection.get_version('apple'))
+    assert_equal(None, collection.get_version('apple'))
+
+# bulk write tests
+
+def test_store_many():
+    collection = make_collection()
+    collection.bulk_rebuild_ratio = 1
+    collection.store_many([('fig', {'color': 'red', 'price': 2})])
+    collection.bulk_rebuild_ratio = 0
+    collection.store_many([('apple', {'color': 'green', 'price': 9})])
+    assert_equal(['fig', 'cherry'], names(collection.get_children(
+        filters=where('color:red'), order=((False, 'price'),))))
+    assert_equal('apple', names(collection.get_children(
+        order=((True, 'price'),)))[0])
+
+def test_create_many():
+    collection = make_collection()
+    items = collection.create_many(['a', 'b'])
+    assert_equal(['a', 'b'], [
+        collection.get_child(name).get_structured_body()
+        for name, data in items])
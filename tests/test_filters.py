@@ -0,0 +1,130 @@
+from papi.filters import *
+from papi.exceptions import MalformedException
+from tests.test_utils import assert_equal
+
+def assert_malformed(src):
+    try:
+        parse_filter(src)
+    except MalformedException:
+        return
+    raise AssertionError("expected MalformedException for {0!r}".format(src))
+
+def matches(src, target):
+    return compile_filter(parse_filter(src))(target)
+
+# parse_filter() tests
+
+def test_parse_filter_equals():
+    node = parse_filter('name:apple')
+    assert_equal(('name', 'apple', 'equals'),
+        (node.propname, node.value, node.operator))
+
+def test_parse_filter_typed_literals():
+    for src, expected in [
+            ('a:12', 12),
+            ('a:-1.5', -1.5),
+            ('a:true', True),
+            ('a:null', None),
+            ('a:"12"', '12'),
+            ("a:'it\\'s'", "it's"),
+            ('a:2016-01-01', '2016-01-01'),
+            ]:
+        assert_equal(expected, parse_filter(src).value, src)
+
+def test_parse_filter_operators():
+    for src, expected in [
+            ('a=1', 'equals'),
+            ('a==1', 'equals'),
+            ('a!=1', 'not_equals'),
+            ('a<1', 'less'),
+            ('a<=1', 'less_or_equal'),
+            ('a>1', 'greater'),
+            ('a>=1', 'greater_or_equal'),
+            ('a^=x', 'prefix'),
+            ]:
+        assert_equal(expected, parse_filter(src).operator, src)
+
+def test_parse_filter_in():
+    node = parse_filter('color in [red, green]')
+    assert_equal(('in', ('red', 'green')), (node.operator, node.value))
+
+def test_parse_filter_between():
+    node = parse_filter('size in 1..10')
+    assert_equal(('between', (1, 10)), (node.operator, node.value))
+
+def test_parse_filter_boolean():
+    node = parse_filter('a:1,(b:2|not c:3)')
+    assert isinstance(node, And)
+    assert_equal(2, len(node.operands))
+    assert isinstance(node.operands[1], Or)
+    assert isinstance(node.operands[1].operands[1], Not)
+
+def test_parse_filter_precedence():
+    node = parse_filter('a:1 or b:2 and c:3')
+    assert isinstance(node, Or)
+    assert isinstance(node.operands[1], And)
+
+def test_parse_filter_legacy():
+    node = parse_filter('title:Hello (world)!,tag:a|b')
+    assert isinstance(node, And)
+    assert_equal(
+        [('title', 'Hello (world)!', 'equals'), ('tag', 'a|b', 'equals')],
+        [(f.propname, f.value, f.operator) for f in node.operands])
+    node = parse_filter('when:12:30')
+    assert_equal(('when', '12:30'), (node.propname, node.value))
+
+def test_parse_filter_cached():
+    assert parse_filter('a:1,b:2') is parse_filter('a:1,b:2')
+
+def test_parse_filter_malformed():
+    for src in ['', 'a', 'a:', 'a:1,', '(a:1', 'a in [1,2', 'a in 1..', 'a ! 1']:
+        assert_malformed(src)
+
+# conjuncts() tests
+
+def test_conjuncts():
+    assert_equal(2, len(conjuncts(parse_filter('a:1,b:2'))))
+    assert_equal(1, len(conjuncts(parse_filter('a:1|b:2'))))
+    assert_equal((), conjuncts(None))
+
+# compile_filter() tests
+
+def test_compile_filter_comparisons():
+    target = {'name': 'banana', 'size': 3, 'color': 'yellow'}
+    for src, expected in [
+            ('name:banana', True),
+            ('name:apple', False),
+            ('size>2', True),
+            ('size<3', False),
+            ('size<=3', True),
+            ('size in 1..3', True),
+            ('size in 4..6', False),
+            ('name^=ban', True),
+            ('name^=app', False),
+            ('color in [red,yellow]', True),
+            ('color!=yellow', False),
+            ('missing>3', False),
+            ]:
+        assert_equal(expected, matches(src, target), src)
+
+def test_compile_filter_boolean():
+    target = {'a': 1, 'b': 2}
+    assert_equal(True, matches('a:1,b:2', target))
+    assert_equal(False, matches('a:1,b:3', target))
+    assert_equal(True, matches('a:5|b:2', target))
+    assert_equal(True, matches('!a:5', target))
+
+def test_compile_filter_string_property():
+    assert_equal(True, matches('age:18', {'age': '18'}))
+
+def test_compile_filter_value():
+    assert_equal(True, matches('_value^="I am"', 'I am an apple'))
+
+def test_compile_filters_custom_getter():
+    predicate = compile_filters(
+        conjuncts(parse_filter('x>1,x<3')),
+        lambda propname, target: target)
+    assert_equal([2], list(filter(predicate, [1, 2, 3])))
+
+def test_compile_filters_empty():
+    assert_equal(True, compile_filters(None)({}))
@@ -587,6 +587,11 @@ def test_prop_happy():
     actual = prop('foo', {'bar': 2, 'foo': 1})
     assert_equal(expected, actual)
 
+def test_prop_none():
+    expected = None
+    actual = prop('foo', None)
+    assert_equal(expected, actual)
+
 # path() tests
 
 def test_path_happy():
@@ -599,6 +604,16 @@ def test_path_notfound():
     actual = path(['baz', 'bar'], {'foo': {'bar': 1}})
     assert_equal(expected, actual)
 
+def test_path_none():
+    expected = None
+    actual = path(('foo', 'bar'), None)
+    assert_equal(expected, actual)
+
+def test_path_nested():
+    expected = 1
+    actual = path(['foo', ('bar',)], {'foo': {'bar': 1}})
+    assert_equal(expected, actual)
+
 # assoc_path() tests
 
 def test_assoc_path_happy():
@@ -752,3 +767,228 @@ def test_path_lens_over():
     expected = {"foo": {"bar": "BAZ"}}
     actual = Lens.over(lens, lambda x: x.upper(), data)
     assert_equal(expected, actual)
+
+def test_path_lens_set_none():
+    lens = path_lens("foo", "bar")
+    expected = {"foo": {"bar": "quux"}}
+    actual = Lens.set(lens, "quux", None)
+    assert_equal(expected, actual)
+
+def test_path_lens_set_immutable():
+    lens = path_lens("foo", "bar")
+    data = {"foo": {"bar": "baz"}, "pizza": "olives"}
+    expected = {"foo": {"bar": "baz"}, "pizza": "olives"}
+    Lens.set(lens, "quux", data)
+    actual = data
+    assert_equal(expected, actual)
+
+def test_path_lens_law():
+    lens = path_lens("foo", prop_lens("bar"), "baz")
+    for data in [None, {}, {"foo": None}, {"foo": {"bar": {"baz": 1}}}]:
+        assert_equal("quux", Lens.get(lens, Lens.set(lens, "quux", data)))
+
+def test_path_lens_cached():
+    assert path_lens("foo", "bar") is path_lens("foo", "bar")
+
+def test_path_lens_flat():
+    expected = ("foo", "bar", "baz")
+    actual = path_lens("foo", prop_lens("bar"), ["baz"]).keys
+    assert_equal(expected, actual)
+
+# PMap tests
+
+class CollidingKey(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+def test_pmap_from_dict():
+    expected = {'foo': 1, 'bar': 2}
+    actual = pmap({'foo': 1, 'bar': 2}).to_dict()
+    assert_equal(expected, actual)
+
+def test_pmap_get():
+    m = pmap({'foo': 1})
+    assert_equal(1, m.get('foo'))
+    assert_equal(None, m.get('bar'))
+    assert_equal(1, m['foo'])
+
+def test_pmap_assoc():
+    expected = {'foo': 1, 'bar': 2}
+    actual = assoc('bar', 2, pmap({'foo': 1}))
+    assert isinstance(actual, PMap)
+    assert_equal(expected, actual.to_dict())
+
+def test_pmap_assoc_immutable():
+    m = pmap({'foo': 1})
+    assoc('foo', 2, m)
+    assoc('bar', 2, m)
+    assert_equal({'foo': 1}, m.to_dict())
+
+def test_pmap_assocs():
+    expected = {'foo': 'bar', 'baz': 'quux', 'pizza': 'olives'}
+    actual = assocs([('foo', 'bar'), ('pizza', 'olives')], pmap({'baz': 'quux'}))
+    assert isinstance(actual, PMap)
+    assert_equal(expected, actual.to_dict())
+
+def test_pmap_dissoc():
+    expected = {'foo': 'bar'}
+    actual = dissoc('baz', pmap({'foo': 'bar', 'baz': 'quux'}))
+    assert isinstance(actual, PMap)
+    assert_equal(expected, actual.to_dict())
+
+def test_pmap_dissoc_nonexistent():
+    m = pmap({'foo': 'bar'})
+    assert dissoc('baz', m) is m
+
+def test_pmap_many_keys():
+    expected = dict((i, i * 2) for i in range(1000) if i % 3)
+    m = pmap()
+    for i in range(1000):
+        m = assoc(i, i * 2, m)
+    for i in range(0, 1000, 3):
+        m = dissoc(i, m)
+    assert_equal(len(expected), len(m))
+    assert_equal(expected, m.to_dict())
+
+def test_pmap_collisions():
+    a, b, c = CollidingKey('a'), CollidingKey('b'), CollidingKey('c')
+    m = pmap([(a, 1), (b, 2), ('foo', 3)])
+    assert_equal(2, m[b])
+    assert_equal(None, m.get(c))
+    m = dissoc(a, m)
+    assert_equal({b: 2, 'foo': 3}, m.to_dict())
+
+def test_pmap_equals_dict():
+    assert pmap({'foo': 1}) == {'foo': 1}
+
+def test_pmap_path_lens_set():
+    lens = path_lens("foo", "bar")
+    actual = Lens.set(lens, "quux", pmap())
+    assert isinstance(actual, PMap)
+    assert_equal("quux", path(("foo", "bar"), actual))
+
+# LazyMap tests
+
+def make_lazy_map(calls):
+    def compute():
+        calls.append('bar')
+        return 2
+    return LazyMap({'foo': 1}, {'bar': compute})
+
+def test_lazy_map_get():
+    calls = []
+    m = make_lazy_map(calls)
+    assert_equal([], calls)
+    assert 'bar' in m
+    assert_equal(2, prop('bar', m))
+    assert_equal(2, m['bar'])
+    assert_equal(None, m.get('baz'))
+    assert_equal(['bar'], calls)
+
+def test_lazy_map_assoc_shares_values():
+    calls = []
+    m = make_lazy_map(calls)
+    actual = assoc('baz', 3, m)
+    assert isinstance(actual, LazyMap)
+    assert_equal(None, m.get('baz'))
+    assert_equal(2, actual['bar'])
+    assert_equal(2, m['bar'])
+    assert_equal(['bar'], calls)
+    assert_equal({'foo': 1, 'bar': 2, 'baz': 3}, actual.to_dict())
+
+def test_lazy_map_overrides():
+    calls = []
+    actual = assocs([('bar', 5)], make_lazy_map(calls))
+    assert_equal(5, actual['bar'])
+    assert_equal([], calls)
+
+def test_lazy_map_equals_dict():
+    assert make_lazy_map([]) == {'foo': 1, 'bar': 2}
+    assert_equal(['bar', 'foo'], sorted(make_lazy_map([])))
+
+def test_lazy_map_dissoc():
+    actual = dissoc('foo', make_lazy_map([]))
+    assert isinstance(actual, LazyMap)
+    assert_equal({'bar': 2}, actual.to_dict())
+
+# transducer tests
+
+def test_transduce_mapping():
+    expected = 12
+    actual = transduce(mapping(lambda x: x * 2), lambda a, b: a + b, (1, 2, 3), 0)
+    assert_equal(expected, actual)
+
+def test_into_filtering():
+    expected = (1, 3, 5)
+    actual = into(filtering(lambda x: x % 2), range(7))
+    assert_equal(expected, actual)
+
+def test_into_none():
+    expected = ()
+    actual = into(mapping(identity), None)
+    assert_equal(expected, actual)
+
+def test_into_chained():
+    expected = (6, 10)
+    actual = into(
+        chain(
+            filtering(lambda x: x % 2),
+            mapping(lambda x: x * 2),
+            dropping(1),
+            taking(2)),
+        range(100))
+    assert_equal(expected, actual)
+
+def test_taking_stops_early():
+    seen = []
+    def source():
+        for i in range(100):
+            seen.append(i)
+            yield i
+    expected = (0, 1, 2)
+    actual = into(taking(3), source())
+    assert_equal(expected, actual)
+    assert_equal([0, 1, 2], seen)
+
+def test_taking_zero():
+    expected = ()
+    actual = into(taking(0), (1, 2, 3))
+    assert_equal(expected, actual)
+
+def test_taking_none():
+    expected = (1, 2, 3)
+    actual = into(taking(None), (1, 2, 3))
+    assert_equal(expected, actual)
+
+def test_dropping_none():
+    expected = (1, 2, 3)
+    actual = into(dropping(None), (1, 2, 3))
+    assert_equal(expected, actual)
+
+def test_ordering():
+    expected = (('b', 1), ('d', 1), ('a', 2), ('c', 3))
+    actual = into(
+        ordering(lambda x: x[1]),
+        (('c', 3), ('b', 1), ('a', 2), ('d', 1)))
+    assert_equal(expected, actual)
+
+def test_ordering_reverse_stable():
+    expected = (('c', 3), ('a', 2), ('b', 1), ('d', 1))
+    actual = into(
+        ordering(lambda x: x[1], reverse=True),
+        (('c', 3), ('b', 1), ('a', 2), ('d', 1)))
+    assert_equal(expected, actual)
+
+def test_ordering_limit():
+    items = [(i * 7919) % 5000 for i in range(5000)]
+    expected = tuple(sorted(items)[10:15])
+    actual = into(
+        chain(ordering(limit=15), dropping(10), taking(5)),
+        items)
+    assert_equal(expected, actual)
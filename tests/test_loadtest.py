@@ -0,0 +1,132 @@
+from papi.loadtest import *
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+import threading
+
+class ItemResource(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_structured_body(self, **kwargs):
+        return self.data
+
+class RootResource(object):
+    def __init__(self):
+        self.children = {'apple': ItemResource({'color': 'red'})}
+        self.lock = threading.Lock()
+        self.stored = []
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+    def store(self, input, name, content_type=None):
+        with self.lock:
+            self.stored.append((name, input.read()))
+        return name, {}
+
+def make_application():
+    root = RootResource()
+    return serve_resource(root), root
+
+mix = [
+    {'path': '/apple', 'weight': 3, 'headers': {'Accept': 'application/json'}},
+    {'path': '/nope', 'weight': 1},
+]
+
+def test_percentile():
+    values = list(range(1, 1001))
+    assert_equal(500, percentile(values, 0.5))
+    assert_equal(990, percentile(values, 0.99))
+    assert_equal(999, percentile(values, 0.999))
+    assert_equal(1, percentile([1], 0.999))
+    assert_equal(None, percentile([], 0.5))
+
+def test_request_spec_environ():
+    spec = RequestSpec('put', '/a%20b', 'x=1',
+        headers={'Content-Type': 'text/plain', 'X-Thing': 'yes'},
+        body='hello')
+    environ = spec.environ()
+    assert_equal('PUT /a%20b', spec.name)
+    assert_equal('/a b', environ['PATH_INFO'])
+    assert_equal('text/plain', environ['CONTENT_TYPE'])
+    assert_equal('5', environ['CONTENT_LENGTH'])
+    assert_equal('yes', environ['HTTP_X_THING'])
+    assert_equal(b'hello', environ['wsgi.input'].read())
+    assert_equal('/a%20b?x=1', spec.url())
+
+def test_threads():
+    application, root = make_application()
+    report = run_load(application, mix, concurrency=4, requests=400)
+    assert_equal(400, report['requests'])
+    routes = report['routes']
+    assert_equal(set(['GET /apple', 'GET /nope']), set(routes))
+    assert_equal(
+        400, routes['GET /apple']['requests'] + routes['GET /nope']['requests'])
+    # weighted 3:1
+    assert 240 < routes['GET /apple']['requests'] < 360
+    assert_equal(0, routes['GET /apple']['errors'])
+    assert_equal(routes['GET /nope']['requests'], report['errors'])
+    assert_equal({'404': report['errors'], '200': 400 - report['errors']},
+        report['statuses'])
+    latency = report['latency']
+    assert latency['p50'] <= latency['p95'] <= latency['p99'] <= \
+        latency['p999'] <= latency['max']
+    assert report['throughput'] > 0
+    assert 'GET /apple' in format_report(report)
+
+def test_repeatable():
+    application, root = make_application()
+    first = run_load(application, mix, concurrency=2, requests=100, seed=3)
+    second = run_load(application, mix, concurrency=2, requests=100, seed=3)
+    assert_equal(
+        first['routes']['GET /apple']['requests'],
+        second['routes']['GET /apple']['requests'])
+
+def test_bodies_and_exceptions():
+    application, root = make_application()
+    def failing(environ, start_response):
+        raise ValueError('broken')
+    report = run_load(failing, [{'path': '/'}], concurrency=1, requests=5)
+    assert_equal({'exception': 5}, report['statuses'])
+    assert_equal(1.0, report['error_rate'])
+    report = run_load(application, [{
+        'method': 'PUT', 'path': '/apple', 'body': 'An apple.',
+        'headers': {'Content-Type': 'text/plain'}}],
+        concurrency=2, requests=10)
+    assert_equal(0, report['errors'])
+    assert_equal([('apple', b'An apple.')] * 10, root.stored)
+
+def test_duration():
+    application, root = make_application()
+    report = run_load(application, mix, concurrency=2, duration=0.2)
+    assert report['requests'] > 0
+    assert 0.2 <= report['elapsed'] < 1.0
+
+def test_http():
+    application, root = make_application()
+    report = run_load(application, mix, concurrency=2, requests=50,
+        http=True)
+    assert_equal(50, report['requests'])
+    assert_equal(set(['200', '404']), set(report['statuses']))
+
+def test_http_closes_listener():
+    import papi.server
+    listeners = []
+    def make_listener(*args, **kwargs):
+        listeners.append(real_make_listener(*args, **kwargs))
+        return listeners[-1]
+    real_make_listener = papi.server.make_listener
+    papi.server.make_listener = make_listener
+    try:
+        application, root = make_application()
+        run_load(application, mix, concurrency=2, requests=10, http=True)
+    finally:
+        papi.server.make_listener = real_make_listener
+    assert_equal(-1, listeners[0].fileno())
+
+def test_processes():
+    application, root = make_application()
+    report = run_load(application, mix, concurrency=2, requests=50,
+        processes=True)
+    assert_equal(50, report['requests'])
+    assert_equal(0, report['routes']['GET /apple']['errors'])
@@ -0,0 +1,131 @@
+from papi.memory import *
+from papi.serve import serve_resource
+from example.app import root, my_api_middleware
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import contextlib
+import tracemalloc
+
+@contextlib.contextmanager
+def tracing():
+    """Run tracemalloc for the duration of a test only, since it slows down
+    everything else.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+def assert_allocation_budget(path, query='', budgets=None, warmup=3):
+    """Serve a GET request on the example app, and check its memory usage
+    (see papi.memory) against "budgets", a dict that maps phases (or
+    'total', for the whole request) to limits for any of "allocated",
+    "peak" and "blocks". The request is repeated "warmup" times first, so
+    that caches are filled and one-off allocations are out of the way.
+    """
+    usages = []
+    application = serve_resource(root,
+        api_middleware=my_api_middleware,
+        memory_callback=lambda request, usage: usages.append(dict(usage)))
+    with tracing():
+        for i in range(warmup + 1):
+            response = mock_request(application, 'GET', path, query,
+                headers=[('Accept', 'application/json')])
+    assert_equal('200 OK', response['status'])
+    usage = usages[-1]
+    failures = [
+        '{0} {1}: {2} > {3}'.format(phase, key, usage[phase][key], limit)
+        for phase, limits in sorted((budgets or {}).items())
+        for key, limit in sorted(limits.items())
+        if usage[phase][key] > limit
+    ]
+    if failures:
+        raise AssertionError(
+            'allocation budget exceeded for {0}?{1}: {2}'.format(
+                path, query, '; '.join(failures)))
+    return usage
+
+# MemoryTimer tests
+
+def test_nested_phases():
+    with tracing():
+        timer = MemoryTimer()
+        def inner():
+            transient = bytearray(50000)
+            return len(transient)
+        def outer():
+            kept = bytearray(100000)
+            timer.call('inner', inner)
+            return kept
+        kept = timer.call('outer', outer)
+        timer.mark('total')
+    usage = dict(timer.memory_usage())
+    assert_equal(set(['outer', 'inner', 'total']), set(usage))
+    assert 50000 <= usage['inner']['peak'] < 60000
+    assert usage['inner']['allocated'] < 10000
+    assert 150000 <= usage['outer']['peak'] < 160000
+    assert 100000 <= usage['outer']['allocated'] < 110000
+    assert usage['total']['peak'] >= usage['outer']['peak']
+    assert_equal(100000, len(kept))
+
+def test_measure():
+    application = serve_resource(root, api_middleware=my_api_middleware)
+    environ = {
+        'PATH_INFO': '/things',
+        'QUERY_STRING': '',
+        'REQUEST_METHOD': 'GET',
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': None,
+    }
+    for i in range(3):
+        measure(application, dict(environ))
+    status, usage = measure(application, dict(environ))
+    assert_equal('200 OK', status)
+    assert usage['peak'] > 0
+    # nothing is left behind
+    assert usage['allocated'] < 1024
+    assert not tracemalloc.is_tracing()
+
+# Allocation budgets for representative requests on the example app. The
+# limits leave about twice the headroom of what was measured when they were
+# set; if a change to a hot path trips one, check whether the extra memory
+# is worth it before raising the limit.
+
+def test_budget_document():
+    assert_allocation_budget('/things/apple', budgets={
+        'total': {'peak': 20000, 'blocks': 160},
+        'hateoas': {'peak': 6000},
+        'write': {'peak': 6000},
+    })
+
+def test_budget_listing():
+    assert_allocation_budget('/things', budgets={
+        'total': {'peak': 40000, 'blocks': 200},
+        'hateoas': {'peak': 12000},
+        'children': {'peak': 8000},
+        'write': {'peak': 16000},
+    })
+
+def test_budget_ordered_listing():
+    assert_allocation_budget('/things', 'order=-_value&count=2', budgets={
+        'total': {'peak': 32000, 'blocks': 200},
+        'children': {'peak': 10000},
+    })
+
+def test_budget_filtered_listing():
+    assert_allocation_budget('/things', 'where=_name^=a', budgets={
+        'total': {'peak': 28000, 'blocks': 200},
+        'children': {'peak': 8000},
+    })
+
+def test_budget_exceeded():
+    try:
+        assert_allocation_budget('/things', budgets={'total': {'peak': 1}})
+    except AssertionError as e:
+        assert 'total peak' in str(e)
+    else:
+        raise AssertionError('budget not enforced')
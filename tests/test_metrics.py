@@ -0,0 +1,174 @@
+from papi.metrics import *
+from papi.serve import serve_resource
+from papi.coalesce import SingleFlight
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request, parse_json_body, \
+    PathTreeResource, tree
+import threading
+
+class ItemResource(object):
+    def get_structured_body(self, *args, **kwargs):
+        return {'color': 'red'}
+
+class FailingResource(object):
+    def get_structured_body(self, *args, **kwargs):
+        raise ValueError('broken')
+
+class RootResource(object):
+    def __init__(self, metrics):
+        self.children = {
+            'apple': ItemResource(),
+            'banana': ItemResource(),
+            'broken': FailingResource(),
+            'metrics': MetricsResource(metrics),
+        }
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+def get(application, path, accept='application/json'):
+    return mock_request(application, 'GET', path,
+        headers=[('Accept', accept)])
+
+def samples(registry, name):
+    return [
+        (labels, value)
+        for family in registry.collect()
+        for sample_name, labels, value in family['samples']
+        if sample_name == name
+    ]
+
+def request_counts(registry):
+    return dict(
+        ((labels['route'], labels['method'], labels['status']), value)
+        for labels, value in samples(registry, 'papi_requests_total'))
+
+# MetricsRegistry tests
+
+def test_histogram_buckets():
+    registry = MetricsRegistry()
+    registry.observe_request('/', 'GET', 200, 0.003, 150)
+    registry.observe_request('/', 'GET', 404, 20.0, 50)
+    buckets = dict(
+        (labels['le'], value)
+        for labels, value in samples(
+            registry, 'papi_request_duration_seconds_bucket'))
+    assert_equal(0, buckets['0.0025'])
+    assert_equal(1, buckets['0.005'])
+    assert_equal(1, buckets['10.0'])
+    assert_equal(2, buckets['+Inf'])
+    assert_equal(
+        [({'route': '/', 'method': 'GET'}, 200)],
+        samples(registry, 'papi_response_size_bytes_sum'))
+
+def test_method_labels():
+    registry = MetricsRegistry()
+    for method in ['get', 'GET', 'Delete', 'BREW', 'x' * 100]:
+        registry.observe_request('/', method, 200, 0.001)
+    assert_equal(
+        {('/', 'GET', '2xx'): 2, ('/', 'DELETE', '2xx'): 1,
+            ('/', 'OTHER', '2xx'): 2},
+        request_counts(registry))
+
+def test_per_thread_aggregation():
+    registry = MetricsRegistry()
+    def observe():
+        for i in range(1000):
+            registry.observe_request('/', 'GET', 200, 0.001)
+    threads = [threading.Thread(target=observe) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_equal(4, len(registry.thread_stats))
+    assert_equal({('/', 'GET', '2xx'): 4000}, request_counts(registry))
+
+def test_prometheus_text():
+    registry = MetricsRegistry()
+    registry.observe_request('/{A "quoted"}', 'GET', 200, 0.5)
+    text = prometheus_text(registry.collect()).decode('utf8')
+    assert '# TYPE papi_requests_total counter\n' in text
+    assert 'papi_requests_total{route="/{A \\"quoted\\"}",method="GET",' \
+        'status="2xx"} 1\n' in text
+    assert 'papi_request_duration_seconds_bucket{route="/{A \\"quoted\\"}",' \
+        'method="GET",le="+Inf"} 1\n' in text
+
+def test_add_counters():
+    registry = MetricsRegistry()
+    registry.add_counters('cache_total', {'hits': 3, 'misses': 1}, 'event')
+    assert_equal(
+        [({'event': 'hits'}, 3), ({'event': 'misses'}, 1)],
+        samples(registry, 'cache_total'))
+
+# serve_resource() tests
+
+def test_route_templates():
+    metrics = MetricsRegistry()
+    application = serve_resource(RootResource(metrics), metrics=metrics)
+    get(application, '/apple')
+    get(application, '/banana')
+    get(application, '/cherry')
+    get(application, '/apple/seed')
+    assert_equal(
+        {
+            ('/{ItemResource}', 'GET', '2xx'): 2,
+            ('/{?}', 'GET', '4xx'): 1,
+            ('/{ItemResource}/{?}', 'GET', '4xx'): 1,
+        },
+        request_counts(metrics))
+    sizes = samples(metrics, 'papi_response_size_bytes_count')
+    assert ({'route': '/{ItemResource}', 'method': 'GET'}, 2) in sizes
+
+def test_route_templates_resolve_path():
+    metrics = MetricsRegistry()
+    application = serve_resource(
+        PathTreeResource(tree, [], depth=3), metrics=metrics)
+    response = get(application, '/a/b/c/d')
+    assert_equal('200 OK', response['status'])
+    assert_equal(
+        {('/{*}/{*}/{PathTreeResource}/{PathTreeResource}', 'GET', '2xx'): 1},
+        request_counts(metrics))
+
+def test_uncaught_exception():
+    metrics = MetricsRegistry()
+    application = serve_resource(RootResource(metrics), metrics=metrics)
+    response = get(application, '/broken')
+    assert_equal('500 Internal Server Error', response['status'])
+    assert_equal(
+        {('/{FailingResource}', 'GET', '5xx'): 1}, request_counts(metrics))
+
+def test_phases():
+    metrics = MetricsRegistry()
+    application = serve_resource(RootResource(metrics), metrics=metrics)
+    get(application, '/apple')
+    phases = set(
+        labels['phase']
+        for labels, value in samples(
+            metrics, 'papi_request_phase_seconds_total'))
+    assert_equal(set(['parse', 'route', 'body', 'hateoas', 'write']), phases)
+    assert 'Server-Timing' not in dict(get(application, '/apple')['headers'])
+
+def test_metrics_resource():
+    metrics = MetricsRegistry()
+    single_flight = SingleFlight()
+    metrics.add_counters(
+        'papi_coalescing_total', single_flight.metrics, 'event')
+    application = serve_resource(RootResource(metrics), metrics=metrics,
+        api_middleware=single_flight)
+    get(application, '/apple')
+    response = get(application, '/metrics',
+        'application/openmetrics-text; version=1.0.0, '
+        'text/plain; version=0.0.4; q=0.5, */*; q=0.1')
+    assert_equal('200 OK', response['status'])
+    assert_equal(
+        'text/plain;version=0.0.4;charset=utf-8',
+        dict(response['headers'])['Content-type'])
+    text = response['body'].decode('utf8')
+    assert 'papi_requests_total{route="/{ItemResource}",method="GET",' \
+        'status="2xx"} 1\n' in text
+    # the scrape itself is the second leader
+    assert 'papi_coalescing_total{event="leaders"} 2\n' in text
+    assert '# TYPE papi_n_plus_one_digest_calls_total counter\n' in text
+    response = parse_json_body(get(application, '/metrics'))
+    names = [family['name'] for family in response['body']['metrics']]
+    assert 'papi_request_duration_seconds' in names
@@ -0,0 +1,198 @@
+from papi.negative_cache import *
+from papi.metrics import MetricsRegistry
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+from papi.collection import IndexedCollectionResource
+import io
+
+class ItemResource(object):
+    def get_structured_body(self, **kwargs):
+        return {}
+
+class CollectionResource(object):
+    def __init__(self, children=None):
+        self.children = dict(children or {})
+        self.lookups = []
+
+    def get_child(self, name):
+        self.lookups.append(name)
+        return self.children.get(name)
+
+    def create(self, input, content_type=None):
+        name = input.read().decode()
+        self.children[name] = ItemResource()
+        return name, {}
+
+    def store(self, input, name, content_type=None):
+        self.children[name] = CollectionResource()
+        return name, {}
+
+    def delete(self, name):
+        del self.children[name]
+
+def make_tree():
+    things = CollectionResource({'apple': CollectionResource()})
+    return CollectionResource({'things': things}), things
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru():
+    cache = NegativeCache(max_entries=2)
+    cache.add(('a',))
+    cache.add(('b',))
+    assert cache.lookup(['a'])
+    cache.add(('c',))
+    # 'b' was the least recently used
+    assert not cache.lookup(('b',))
+    assert cache.lookup(('a',))
+    assert cache.lookup(('c',))
+    assert_equal(2, len(cache))
+    assert_equal(
+        {'stores': 3, 'evictions': 1, 'hits': 3, 'misses': 1},
+        dict(cache.metrics))
+
+def test_ttl():
+    clock = Clock()
+    cache = NegativeCache(ttl=10, clock=clock)
+    cache.add(('a',))
+    clock.now = 9.0
+    assert cache.lookup(('a',))
+    clock.now = 10.0
+    assert not cache.lookup(('a',))
+    assert_equal(1, cache.metrics['expirations'])
+    assert_equal(0, len(cache))
+
+def test_multiprocess_ttl():
+    clock = Clock()
+    cache = NegativeCache(multiprocess_ttl=5, clock=clock)
+    cache.add(('a',))
+    cache.add(('b',), multiprocess=True)
+    clock.now = 5.0
+    assert cache.lookup(('a',))
+    assert not cache.lookup(('b',))
+    environ = {
+        'PATH_INFO': '/things/nope',
+        'QUERY_STRING': '',
+        'REQUEST_METHOD': 'GET',
+        'wsgi.input': None,
+        'wsgi.multiprocess': True,
+    }
+    root, things = make_tree()
+    serve_resource(root, negative_cache=cache)(
+        environ, lambda status, headers: None)
+    assert_equal(10.0, cache.entries[('things', 'nope')])
+
+def test_invalidate():
+    cache = NegativeCache()
+    for path in [('a',), ('b', 'x'), ('b', 'y'), ('b', 'x', 'z'), ('c', 'b')]:
+        cache.add(path)
+    assert_equal(2, cache.invalidate(('b', 'x')))
+    assert_equal(
+        [('a',), ('b', 'y'), ('c', 'b')], sorted(cache.entries))
+    assert_equal(1, cache.invalidate(('b',)))
+    assert_equal(2, cache.invalidate())
+    assert_equal(0, len(cache))
+    assert_equal({}, cache.below)
+
+def test_generation():
+    cache = NegativeCache()
+    generation = cache.generation
+    cache.invalidate(('a',))
+    # the path may have been created in the meantime
+    cache.add(('a', 'b'), generation)
+    assert not cache.lookup(('a', 'b'))
+    cache.add(('a', 'b'), cache.generation)
+    assert cache.lookup(('a', 'b'))
+
+def test_not_found_storm():
+    root, things = make_tree()
+    application = serve_resource(root, negative_cache=100)
+    for i in range(5):
+        response = mock_request(application, 'GET', '/things/nope')
+        assert_equal('404 Not Found', response['status'])
+        assert_equal(b'Not Found', response['body'])
+        response = mock_request(application, 'GET', '/things/nope/deeper')
+        assert_equal('404 Not Found', response['status'])
+    # only the first request asked for the missing child
+    assert_equal(['nope'], things.lookups)
+    response = mock_request(application, 'GET', '/things/apple')
+    assert_equal('200 OK', response['status'])
+
+def test_writes_invalidate():
+    root, things = make_tree()
+    application = serve_resource(root, negative_cache=100)
+    response = mock_request(application, 'GET', '/things/pear')
+    assert_equal('404 Not Found', response['status'])
+    response = mock_request(application, 'POST', '/things',
+        request_body='pear')
+    assert_equal('200 OK', response['status'])
+    response = mock_request(application, 'GET', '/things/pear')
+    assert_equal('200 OK', response['status'])
+    # below a stored child
+    mock_request(application, 'GET', '/things/apple/seed')
+    mock_request(application, 'PUT', '/things/apple', request_body='')
+    things.children['apple'].children['seed'] = ItemResource()
+    response = mock_request(application, 'GET', '/things/apple/seed')
+    assert_equal('200 OK', response['status'])
+
+def test_bulk_writes_invalidate_when_written():
+    items = IndexedCollectionResource()
+    application = serve_resource(
+        CollectionResource({'items': items}), negative_cache=100)
+    body = b'{"_name": "x", "v": 1}\n'
+    environ = {
+        'PATH_INFO': '/items',
+        'QUERY_STRING': '',
+        'REQUEST_METHOD': 'PUT',
+        'CONTENT_TYPE': 'application/x-ndjson',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    # the records are written as the response body is iterated
+    bulk_body = application(environ, lambda status, headers: None)
+    response = mock_request(application, 'GET', '/items/x')
+    assert_equal('404 Not Found', response['status'])
+    assert_equal(b'{"index": 0, "status": 200, "_name": "x"}\n',
+        b''.join(bulk_body))
+    response = mock_request(application, 'GET', '/items/x')
+    assert_equal('200 OK', response['status'])
+
+def test_metrics():
+    root, things = make_tree()
+    cache = NegativeCache()
+    registry = MetricsRegistry()
+    application = serve_resource(root, negative_cache=cache, metrics=registry)
+    for i in range(3):
+        mock_request(application, 'GET', '/nope')
+    events = dict(
+        (labels['event'], value)
+        for family in registry.collect()
+        for name, labels, value in family['samples']
+        if name == 'papi_negative_cache_events_total')
+    assert_equal(2, events['hits'])
+    assert_equal(1, events['stores'])
+
+def test_not_found_is_returned():
+    root, things = make_tree()
+    outcomes = []
+    def api_middleware(handle, resource, request):
+        try:
+            response = handle(resource, request)
+        except Exception as e:
+            outcomes.append(e)
+            raise
+        outcomes.append(response[0])
+        return response
+    application = serve_resource(root, api_middleware=api_middleware)
+    response = mock_request(application, 'GET', '/things/nope')
+    assert_equal('404 Not Found', response['status'])
+    # the root has no parent to delete it from
+    response = mock_request(application, 'DELETE', '/')
+    assert_equal('404 Not Found', response['status'])
+    assert_equal([(404, 'Not Found')] * 2, outcomes)
@@ -0,0 +1,62 @@
+from papi.ordering import *
+from tests.test_utils import assert_equal
+import random
+
+items = [
+    {'name': 'apple', 'color': 'red', 'price': 3},
+    {'name': 'banana', 'color': 'yellow', 'price': 1},
+    {'name': 'cherry', 'color': 'red', 'price': 5},
+    {'name': 'date', 'color': 'brown', 'price': 5},
+    {'name': 'elderberry', 'color': 'black'},
+]
+
+def names(page):
+    return [item['name'] for item in page]
+
+# sort_key() tests
+
+def test_sort_key_mixed_types():
+    expected = [None, False, 1, 2.5, 'a', (1,)]
+    actual = sorted([(1,), 'a', 2.5, None, 1, False], key=sort_key)
+    assert_equal(expected, actual)
+
+# order_key() tests
+
+def test_order_key_mixed_directions():
+    expected = ['date', 'cherry', 'apple', 'banana', 'elderberry']
+    actual = names(sorted(items, key=order_key(((True, 'price'), (False, 'color')))))
+    assert_equal(expected, actual)
+
+def test_order_key_custom_getter():
+    expected = [3, 2, 1]
+    actual = sorted([1, 3, 2], key=order_key(((True, '_value'),), lambda p, x: x))
+    assert_equal(expected, actual)
+
+# order_page() tests
+
+def test_order_page_no_order():
+    expected = ['banana', 'cherry']
+    actual = names(order_page(items, None, offset=1, count=2))
+    assert_equal(expected, actual)
+
+def test_order_page_none_values():
+    assert_equal('elderberry', names(order_page(items, ((False, 'price'),)))[0])
+    assert_equal('elderberry', names(order_page(items, ((True, 'price'),)))[-1])
+
+def test_order_page_stable():
+    expected = ['cherry', 'date']
+    actual = names(order_page(items, ((True, 'price'),), count=2))
+    assert_equal(expected, actual)
+
+def test_order_page_heap_matches_sort():
+    rng = random.Random(7)
+    many = [{'a': rng.randint(0, 20), 'b': rng.choice('xyz'), 'i': i}
+            for i in range(1000)]
+    order = ((True, 'a'), (False, 'b'))
+    for offset, count in [(0, 10), (30, 20), (900, 200), (0, None)]:
+        stop = None if count is None else offset + count
+        expected = sorted(many, key=order_key(order))[offset:stop]
+        actual = order_page(many, order, offset, count)
+        assert_equal(expected, actual)
+        actual = order_page(iter(many), order, offset, count)
+        assert_equal(expected, actual)
@@ -0,0 +1,145 @@
+from papi.profiling import *
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import os
+import tempfile
+import threading
+
+class ItemResource(object):
+    def get_structured_body(self, *args, **kwargs):
+        return {'color': 'red'}
+
+class BlockingResource(object):
+    def __init__(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def get_structured_body(self, *args, **kwargs):
+        self.entered.set()
+        self.release.wait(5)
+        return {}
+
+class RootResource(object):
+    def __init__(self):
+        self.children = {
+            'apple': ItemResource(),
+            'pear': ItemResource(),
+            'blocking': BlockingResource(),
+        }
+
+    def get_child(self, name):
+        return self.children.get(name)
+
+def get(application, path):
+    return mock_request(application, 'GET', path,
+        headers=[('Accept', 'application/json')])
+
+def test_profile_name():
+    assert_equal('GET_ItemResource', profile_name('GET', '/{ItemResource}'))
+    assert_equal('GET', profile_name('GET', '/'))
+    assert_equal('PUT_any_Doc_missing',
+        profile_name('PUT', '/{*}/{Doc}/{?}'))
+
+def test_path_prefix():
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = Profiler(directory, path_prefixes=['/apple'])
+        application = serve_resource(RootResource(), api_middleware=profiler)
+        assert_equal('200 OK', get(application, '/apple')['status'])
+        get(application, '/apple')
+        get(application, '/pear')
+        assert_equal(2, profiler.metrics['profiled'])
+        assert_equal(
+            ['GET_ItemResource.{0}.pstats'.format(os.getpid())],
+            os.listdir(directory))
+        stats = load_stats(directory, 'GET_ItemResource')
+        functions = [
+            function_name for filename, line, function_name in stats.stats]
+        assert 'get_structured_body' in functions
+        assert_equal(None, load_stats(directory, 'GET_missing'))
+
+def test_rate():
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = Profiler(directory, rate=1.0)
+        application = serve_resource(RootResource(), api_middleware=profiler)
+        get(application, '/apple')
+        get(application, '/nope')
+        assert_equal(
+            ['GET_ItemResource', 'GET_missing'],
+            sorted(f.split('.')[0] for f in os.listdir(directory)))
+        profiler = Profiler(directory, rate=0.0)
+        application = serve_resource(RootResource(), api_middleware=profiler)
+        get(application, '/apple')
+        assert_equal(0, profiler.metrics['profiled'])
+
+def test_one_profile_at_a_time():
+    with tempfile.TemporaryDirectory() as directory:
+        root = RootResource()
+        profiler = Profiler(directory, rate=1.0)
+        application = serve_resource(root, api_middleware=profiler)
+        blocking = root.children['blocking']
+        thread = threading.Thread(target=get, args=(application, '/blocking'))
+        thread.start()
+        try:
+            assert blocking.entered.wait(5)
+            assert_equal('200 OK', get(application, '/apple')['status'])
+        finally:
+            blocking.release.set()
+            thread.join()
+        assert_equal(1, profiler.metrics['profiled'])
+        assert_equal(1, profiler.metrics['busy'])
+
+def test_bounded_disk_usage():
+    with tempfile.TemporaryDirectory() as directory:
+        class Root(object):
+            def get_child(self, name):
+                # a distinct class, and thus route, per name
+                return type(str(name), (ItemResource,), {})()
+        profiler = Profiler(directory, rate=1.0, max_files=3)
+        application = serve_resource(Root(), api_middleware=profiler)
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            get(application, '/' + name)
+        files = sorted(f.split('.')[0] for f in os.listdir(directory))
+        assert_equal(3, len(files))
+        assert 'GET_e' in files
+        assert_equal(2, profiler.metrics['evicted'])
+        profiler = Profiler(directory, rate=1.0, max_bytes=1)
+        application = serve_resource(Root(), api_middleware=profiler)
+        get(application, '/f')
+        assert_equal(['GET_f'], [f.split('.')[0] for f in os.listdir(directory)])
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_save_interval():
+    with tempfile.TemporaryDirectory() as directory:
+        clock = Clock()
+        profiler = Profiler(directory, rate=1.0, save_interval=10,
+            clock=clock)
+        application = serve_resource(RootResource(), api_middleware=profiler)
+        for i in range(3):
+            get(application, '/apple')
+        # written for the first request only
+        assert_equal(1, profiler.metrics['saved'])
+        clock.now = 10.0
+        get(application, '/apple')
+        assert_equal(2, profiler.metrics['saved'])
+        get(application, '/apple')
+        profiler.flush()
+        assert_equal(3, profiler.metrics['saved'])
+        stats = load_stats(directory, 'GET_ItemResource')
+        assert_equal(5, sum(
+            calls for (filename, line, function_name), (calls, *rest)
+            in stats.stats.items() if function_name == 'get_structured_body'))
+
+def test_save_errors():
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = Profiler(os.path.join(directory, 'profiles'), rate=1.0)
+        os.rmdir(profiler.directory)
+        application = serve_resource(RootResource(), api_middleware=profiler)
+        assert_equal('200 OK', get(application, '/apple')['status'])
+        assert_equal(1, profiler.metrics['save_errors'])
@@ -1,6 +1,7 @@
 from papi.request import *
 from tests.test_utils import assert_equal
 from papi.mime import MimeType
+from papi.method_override_middleware import method_override_middleware
 
 # parse_path() tests
 
@@ -69,9 +70,47 @@ def test_parse_request_happy():
         },
         'method': 'GET',
         'input': None,
+        'content_length': None,
     }
     actual = parse_request(env)
     assert_equal(
         sorted(expected.items()),
         sorted(actual.items())
     )
+
+def test_parse_request_lazy():
+    env = {
+        'PATH_INFO': '/foo',
+        'REQUEST_METHOD': 'GET',
+        'QUERY_STRING': 'quux=bar',
+    }
+    request = parse_request(env)
+    env['QUERY_STRING'] = 'quux=baz'
+    # fields are parsed on first access, and only once
+    assert_equal({'quux': 'baz'}, request['query'])
+    env['QUERY_STRING'] = ''
+    assert_equal({'quux': 'baz'}, request['query'])
+
+def test_get_request_shared():
+    env = {
+        'PATH_INFO': '/foo',
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '_method=PUT',
+    }
+    seen = []
+    def app(environ, start_response):
+        seen.append(environ)
+        return []
+    method_override_middleware(parse_request_middleware(app))(env, None)
+    request = seen[0]['request']
+    assert request is get_request(env)
+    assert_equal('PUT', request['method'])
+    assert_equal('POST', env['REQUEST_METHOD'])
+    env = {
+        'PATH_INFO': '/foo',
+        'REQUEST_METHOD': 'POST',
+        'QUERY_STRING': '',
+        'HTTP_X_METHOD_OVERRIDE': 'DELETE',
+    }
+    method_override_middleware(parse_request_middleware(app))(env, None)
+    assert_equal('DELETE', seen[1]['request']['method'])
@@ -0,0 +1,168 @@
+from papi.server import *
+from tests.test_utils import assert_equal
+import http.client
+import io
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+def echo_application(environ, start_response):
+    path = environ['PATH_INFO']
+    if path == '/fail':
+        raise Exception("boom")
+    if path == '/stream':
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return (part for part in [b'one ', b'two ', b'three'])
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['REQUEST_METHOD'].encode('ascii'), b' ', path.encode('utf8'),
+        b' ', body]
+
+class RunningWorker(object):
+    def __enter__(self):
+        self.worker = Worker(make_listener('127.0.0.1', 0), echo_application,
+            threads=2, keepalive=2)
+        self.thread = threading.Thread(target=self.worker.serve)
+        self.thread.start()
+        return self.worker
+
+    def __exit__(self, *args):
+        self.worker.stop()
+        self.thread.join()
+        self.worker.listener.close()
+
+def connect(worker):
+    return http.client.HTTPConnection('127.0.0.1', worker.server_port, timeout=5)
+
+def test_keepalive():
+    with RunningWorker() as worker:
+        connection = connect(worker)
+        connection.request('GET', '/a')
+        response = connection.getresponse()
+        assert_equal(b'GET /a ', response.read())
+        sock = connection.sock
+        connection.request('POST', '/b', body=b'hello')
+        response = connection.getresponse()
+        assert_equal(b'POST /b hello', response.read())
+        assert connection.sock is sock
+        connection.close()
+
+def test_unread_body():
+    with RunningWorker() as worker:
+        connection = connect(worker)
+        connection.request('GET', '/stream', body=b'ignored')
+        response = connection.getresponse()
+        assert_equal('chunked', response.getheader('Transfer-Encoding'))
+        assert_equal(b'one two three', response.read())
+        connection.request('GET', '/again')
+        assert_equal(b'GET /again ', connection.getresponse().read())
+        connection.close()
+
+def test_application_error():
+    with RunningWorker() as worker:
+        connection = connect(worker)
+        connection.request('GET', '/fail')
+        response = connection.getresponse()
+        response.read()
+        assert_equal(500, response.status)
+        connection.close()
+
+def test_prefork_reload():
+    if not hasattr(os, 'fork'):
+        return
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'papi.server', 'example.app:application',
+            '--bind', '127.0.0.1:0', '--workers', '2', '--log-level', 'INFO'],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE)
+    try:
+        line = process.stderr.readline().decode('utf8')
+        port = int(re.search(r'Listening on [^:]+:(\d+)', line).group(1))
+        def get():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/things/apple',
+                headers={'Accept': 'text/plain'})
+            body = connection.getresponse().read()
+            connection.close()
+            return body
+        assert_equal(b'I am an apple. Eat me.', get())
+        process.send_signal(signal.SIGHUP)
+        assert_equal(b'I am an apple. Eat me.', get())
+        process.send_signal(signal.SIGTERM)
+        assert_equal(0, process.wait(timeout=10))
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stderr.close()
+
+def send_raw(worker, data):
+    connection = socket.create_connection(('127.0.0.1', worker.server_port),
+        timeout=5)
+    connection.sendall(data)
+    connection.shutdown(socket.SHUT_WR)
+    received = []
+    while True:
+        part = connection.recv(65536)
+        if not part:
+            break
+        received.append(part)
+    connection.close()
+    return b''.join(received)
+
+def test_chunked_request_body():
+    with RunningWorker() as worker:
+        connection = connect(worker)
+        connection.request('PUT', '/bulk',
+            body=iter([b'{"_name": "a"}\n', b'{"_name"', b': "b"}\n']),
+            encode_chunked=True)
+        response = connection.getresponse()
+        assert_equal(b'PUT /bulk {"_name": "a"}\n{"_name": "b"}\n',
+            response.read())
+        # the connection is still usable
+        connection.request('GET', '/again')
+        assert_equal(b'GET /again ', connection.getresponse().read())
+        connection.close()
+        response = send_raw(worker,
+            b'POST /x HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'zz\r\nnope\r\n0\r\n\r\n')
+        assert response.startswith(b'HTTP/1.1 500'), response
+
+def test_chunked_request_body_lines():
+    body = ChunkedRequestBody(io.BytesIO(
+        b'4;ext=1\r\none\n\r\n7\r\ntwo\nthr\r\n2\r\nee\r\n0\r\nX-T: 1\r\n\r\nnext'))
+    assert_equal([b'one\n', b'two\n', b'three'], list(body))
+    assert body.done
+    body = ChunkedRequestBody(io.BytesIO(b'5\r\nab'))
+    try:
+        body.read()
+    except ValueError:
+        assert body.failed
+    else:
+        raise AssertionError("expected ValueError")
+
+def test_saturated_worker_closes_connections():
+    with RunningWorker() as worker:
+        idle = connect(worker)
+        idle.request('GET', '/a')
+        idle.getresponse().read()
+        # the second connection takes the last thread
+        connection = connect(worker)
+        connection.request('GET', '/b')
+        response = connection.getresponse()
+        assert_equal(None, response.getheader('Connection'))
+        response.read()
+        # with a third one waiting, the second is not kept alive
+        waiting = connect(worker)
+        waiting.connect()
+        connection.request('GET', '/c')
+        response = connection.getresponse()
+        assert_equal('close', response.getheader('Connection'))
+        response.read()
+        waiting.request('GET', '/d')
+        assert_equal(b'GET /d ', waiting.getresponse().read())
+        for c in (connection, waiting, idle):
+            c.close()
@@ -1,9 +1,11 @@
-from papi.serve import serve_resource
+from papi.serve import serve_resource, n_plus_one_digests
 import papi.fp as fp
 from papi.mime import match_mime, parse_mime_type
 from papi.exceptions import ResourceException
 from tests.test_utils import assert_equal, assert_equal_dicts
+import io
 import json
+import time
 
 def mock_request(
         application,
@@ -18,6 +20,11 @@ def mock_request(
     env['REQUEST_METHOD'] = method
     env['CONTENT_TYPE'] = "text/plain"
     env['wsgi.input'] = None
+    if request_body:
+        if type(request_body) is str:
+            request_body = request_body.encode('utf8')
+        env['wsgi.input'] = io.BytesIO(request_body)
+        env['CONTENT_LENGTH'] = str(len(request_body))
     for name, value in headers:
         massaged_name = "_".join(fp.cons("HTTP", name.split("-"))).upper()
         env[massaged_name] = value
@@ -28,7 +35,7 @@ def mock_request(
         response['status'] = status_str
         response['headers'] = headers
 
-    response['body'] = application(env, start_response)
+    response['body'] = b''.join(application(env, start_response))
     return response
 
 def test_root_get():
@@ -123,3 +130,293 @@ def test_child_get():
     }
     actual = mock_request(application, "GET", "/hello")
     assert_equal(expected, actual)
+
+def test_list_children_digests():
+    class MyRootResource(object):
+        def get_children(self, *args, **kwargs):
+            raise AssertionError("get_children_digests should be preferred")
+
+        def get_children_digests(self, offset=None, count=None, *args, **kwargs):
+            return [("apple", {"color": "red"}, False), ("nuts", 1, True)]
+
+    application = serve_resource(MyRootResource())
+    expected = [{"color": "red"}, 1]
+    actual = parse_json_body(
+        mock_request(application, "GET", "/",
+            query="hateoas=off",
+            headers=[("Accept", "text/json")]))['body']['_items']
+    assert_equal(expected, actual)
+
+def test_count_n_plus_one_digests():
+    class MyChildResource(object):
+        def get_structured_body(self, digest=False, *args, **kwargs):
+            return {"digest": digest}
+
+    class MyRootResource(object):
+        def get_children(self, *args, **kwargs):
+            return [("a", MyChildResource()), ("b", MyChildResource()), ("c", 3)]
+
+    application = serve_resource(MyRootResource())
+    key = "{0}.{1}".format(__name__, MyRootResource.__name__)
+    n_plus_one_digests.pop(key, None)
+    response = parse_json_body(
+        mock_request(application, "GET", "/",
+            query="hateoas=off",
+            headers=[("Accept", "text/json")]))
+    expected = [{"digest": True}, {"digest": True}, 3]
+    assert_equal(expected, response['body']['_items'])
+    assert_equal(2, n_plus_one_digests[key])
+
+class PathTreeResource(object):
+    """A tree of nested dicts that resolves up to "depth" path segments at a
+    time through resolve_path(), and logs calls to get_child().
+    """
+    def __init__(self, data, log, depth=None):
+        self.data = data
+        self.log = log
+        self.depth = depth
+
+    def get_structured_body(self, *args, **kwargs):
+        return self.data if not isinstance(self.data, dict) else {}
+
+    def get_child(self, name):
+        self.log.append(('get_child', name))
+        if not isinstance(self.data, dict) or name not in self.data:
+            return None
+        return PathTreeResource(self.data[name], self.log, self.depth)
+
+    def resolve_path(self, segments):
+        self.log.append(('resolve_path', segments))
+        if self.depth is None:
+            return None
+        parent = None
+        target = self
+        for segment in segments[:self.depth]:
+            if not isinstance(target.data, dict) or segment not in target.data:
+                return None, target, ()
+            parent = target
+            target = PathTreeResource(target.data[segment], self.log, self.depth)
+        return target, parent, segments[self.depth:]
+
+    def store(self, input, name, content_type=None):
+        self.log.append(('store', name))
+        return name, {}
+
+tree = {'a': {'b': {'c': {'d': 'leaf'}}}}
+
+def test_resolve_path():
+    log = []
+    application = serve_resource(PathTreeResource(tree, log, depth=10))
+    response = parse_json_body(
+        mock_request(application, "GET", "/a/b/c/d",
+            query="hateoas=off",
+            headers=[("Accept", "text/json")]))
+    assert_equal('200 OK', response['status'])
+    assert_equal('leaf', response['body'])
+    assert_equal([('resolve_path', ('a', 'b', 'c', 'd'))], log)
+
+def test_resolve_path_partial():
+    log = []
+    application = serve_resource(PathTreeResource(tree, log, depth=3))
+    response = mock_request(application, "GET", "/a/b/c/d",
+        query="hateoas=off",
+        headers=[("Accept", "text/json")])
+    assert_equal('200 OK', response['status'])
+    expected = [
+        ('resolve_path', ('a', 'b', 'c', 'd')),
+        ('resolve_path', ('d',)),
+    ]
+    assert_equal(expected, log)
+
+def test_resolve_path_fallback():
+    log = []
+    application = serve_resource(PathTreeResource(tree, log))
+    response = mock_request(application, "GET", "/a/b",
+        headers=[("Accept", "text/json")])
+    assert_equal('200 OK', response['status'])
+    expected = [
+        ('resolve_path', ('a', 'b')),
+        ('get_child', 'a'),
+        ('resolve_path', ('b',)),
+        ('get_child', 'b'),
+    ]
+    assert_equal(expected, log)
+
+def test_resolve_path_not_found():
+    log = []
+    application = serve_resource(PathTreeResource(tree, log, depth=10))
+    response = mock_request(application, "GET", "/a/x/c",
+        headers=[("Accept", "text/json")])
+    assert_equal('404 Not Found', response['status'])
+
+def test_resolve_path_put():
+    log = []
+    application = serve_resource(PathTreeResource(tree, log, depth=10))
+    response = mock_request(application, "PUT", "/a/b/c",
+        headers=[("Accept", "text/json")])
+    assert_equal('200 OK', response['status'])
+    assert_equal(('store', 'c'), log[-1])
+
+class SlowResource(object):
+    def __init__(self, value, delay=0, fail=False):
+        self.value = value
+        self.delay = delay
+        self.fail = fail
+
+    def get_structured_body(self, *args, **kwargs):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ResourceException(ResourceException.reason_does_not_exist)
+        return self.value
+
+class SlowCollectionResource(object):
+    def __init__(self, children):
+        self.children = children
+
+    def get_children(self, *args, **kwargs):
+        return self.children
+
+def test_concurrent_digests():
+    children = [
+        ('c{0}'.format(i), SlowResource(i, delay=0.1 * (i % 2)))
+        for i in range(1, 9)
+    ]
+    application = serve_resource(
+        SlowCollectionResource(children),
+        digest_executor=8)
+    started = time.monotonic()
+    response = parse_json_body(
+        mock_request(application, "GET", "/",
+            query="hateoas=off",
+            headers=[("Accept", "text/json")]))
+    elapsed = time.monotonic() - started
+    assert_equal(list(range(1, 9)), response['body']['_items'])
+    assert elapsed < 0.3, elapsed
+
+def test_concurrent_digests_exception():
+    children = [
+        ('a', SlowResource(1, delay=0.05)),
+        ('b', SlowResource(2, fail=True)),
+        ('c', SlowResource(3)),
+    ]
+    application = serve_resource(
+        SlowCollectionResource(children),
+        digest_executor=2)
+    response = mock_request(application, "GET", "/",
+        headers=[("Accept", "text/json")])
+    assert_equal('404 Not Found', response['status'])
+
+def test_concurrent_digests_deadline():
+    children = [('c{0}'.format(i), SlowResource(i, delay=0.2)) for i in range(4)]
+    application = serve_resource(
+        SlowCollectionResource(children),
+        digest_executor=1,
+        request_timeout=0.05)
+    started = time.monotonic()
+    response = mock_request(application, "GET", "/",
+        headers=[("Accept", "text/json")])
+    elapsed = time.monotonic() - started
+    assert_equal('504 Gateway Timeout', response['status'])
+    assert elapsed < 0.2, elapsed
+
+class VersionedResource(object):
+    """A collection of a single document, "doc", whose version is bumped on
+    every store.
+    """
+    def __init__(self):
+        self.version = 1
+        self.stored = []
+
+    def get_child(self, name):
+        return {'doc': {'version': self.version}}.get(name)
+
+    def get_version(self, name):
+        return str(self.version) if name == 'doc' else None
+
+    def store(self, input, name, content_type=None, **kwargs):
+        self.stored.append(kwargs)
+        expected = kwargs.get('expected_version', '*')
+        if expected not in ('*', str(self.version)):
+            raise ResourceException(ResourceException.reason_version_mismatch)
+        self.version += 1
+        return name, {}, str(self.version)
+
+def test_get_etag():
+    application = serve_resource(VersionedResource())
+    response = mock_request(application, "GET", "/doc",
+        headers=[("Accept", "text/json")])
+    assert ('ETag', '"1"') in response['headers'], response['headers']
+
+def test_get_etag_read_before_body():
+    class RacingDocument(object):
+        def __init__(self, parent):
+            self.parent = parent
+        def get_structured_body(self, **kwargs):
+            # another client stores the document while it is being read
+            self.parent.version += 1
+            return {'version': self.parent.version}
+    class RacingResource(VersionedResource):
+        def get_child(self, name):
+            return RacingDocument(self)
+    application = serve_resource(RacingResource())
+    response = mock_request(application, "GET", "/doc",
+        headers=[("Accept", "text/json")])
+    assert ('ETag', '"1"') in response['headers'], response['headers']
+
+def test_put_etag_from_store():
+    class UnreportedResource(VersionedResource):
+        def store(self, input, name, content_type=None, **kwargs):
+            return VersionedResource.store(
+                self, input, name, content_type, **kwargs)[:2]
+    application = serve_resource(UnreportedResource())
+    response = mock_request(application, "PUT", "/doc")
+    assert_equal('200 OK', response['status'])
+    assert_equal([], [h for h in response['headers'] if h[0] == 'ETag'])
+
+def test_put_if_match():
+    resource = VersionedResource()
+    application = serve_resource(resource)
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-Match", '"1"')])
+    assert_equal('200 OK', response['status'])
+    assert ('ETag', '"2"') in response['headers'], response['headers']
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-Match", '"1"')])
+    assert_equal('412 Precondition Failed', response['status'])
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-Match", '"1", "2"')])
+    assert_equal('200 OK', response['status'])
+    expected = [
+        {'expected_version': '1'},
+        {'expected_version': '1'},
+        {'expected_version': '2'},
+    ]
+    assert_equal(expected, resource.stored)
+
+def test_put_if_none_match():
+    resource = VersionedResource()
+    application = serve_resource(resource)
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-None-Match", '*')])
+    assert_equal([{'expected_version': None}], resource.stored)
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-None-Match", '"1"')])
+    assert_equal('412 Precondition Failed', response['status'])
+    # lists of entity tags cannot be checked atomically, whatever they are
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-None-Match", '"7"')])
+    assert_equal('412 Precondition Failed', response['status'])
+    assert_equal([{'expected_version': None}], resource.stored)
+
+def test_put_if_match_unversioned():
+    class MyResource(object):
+        def get_child(self, name):
+            return {}
+
+        def store(self, input, name, content_type=None):
+            raise AssertionError("store should not be called")
+
+    application = serve_resource(MyResource())
+    response = mock_request(application, "PUT", "/doc",
+        headers=[("If-Match", '"1"')])
+    assert_equal('412 Precondition Failed', response['status'])
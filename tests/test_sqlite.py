@@ -0,0 +1,269 @@
+from papi.sqlite import *
+from papi.collection import IndexedCollectionResource
+from papi.filters import parse_filter, conjuncts
+from papi.exceptions import ResourceException
+from papi.mime import parse_mime_type
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request, parse_json_body
+import io
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+fruit = {
+    'apple': {'color': 'red', 'price': 3},
+    'banana': {'color': 'yellow', 'price': 1},
+    'cherry': {'color': 'red', 'price': 5},
+    'date': {'color': 'brown', 'price': 5},
+    'elderberry': {'color': 'black', 'price': None},
+}
+
+def make_database(documents):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'test.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            'CREATE TABLE fruit (name TEXT PRIMARY KEY, color TEXT, price INTEGER)')
+        connection.executemany(
+            'INSERT INTO fruit (name, color, price) VALUES (?, ?, ?)',
+            [(name, d['color'], d['price']) for name, d in documents.items()])
+    connection.close()
+    return directory, path
+
+class Database(object):
+    def __init__(self, documents=fruit):
+        self.documents = documents
+
+    def __enter__(self):
+        self.directory, path = make_database(self.documents)
+        self.pool = ConnectionPool(path)
+        return SQLiteCollectionResource(self.pool, 'fruit')
+
+    def __exit__(self, *args):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+def names(children):
+    return [name for name, child in children]
+
+def where(src):
+    return conjuncts(parse_filter(src))
+
+# get_children() tests
+
+def test_get_children():
+    with Database() as collection:
+        expected = ['apple', 'banana', 'cherry', 'date', 'elderberry']
+        actual = names(collection.get_children())
+        assert_equal(expected, actual)
+
+def test_get_children_digest():
+    with Database() as collection:
+        expected = {'name': 'banana', 'color': 'yellow', 'price': 1}
+        children = dict(collection.get_children())
+        actual = children['banana'].get_structured_body(digest=True)
+        assert_equal(expected, actual)
+
+def test_get_children_digest_columns():
+    with Database() as collection:
+        collection.digest_columns = ('color',)
+        expected = {'name': 'banana', 'color': 'yellow'}
+        children = dict(collection.get_children())
+        actual = children['banana'].get_structured_body(digest=True)
+        assert_equal(expected, actual)
+
+def test_get_children_where_order_page():
+    with Database() as collection:
+        expected = ['cherry', 'apple']
+        actual = names(collection.get_children(
+            filters=where('color in [red,brown],name!=date'),
+            order=((True, 'price'),),
+            count=2))
+        assert_equal(expected, actual)
+
+def test_get_children_unknown_column():
+    with Database() as collection:
+        assert_equal([], names(collection.get_children(filters=where('shape:round'))))
+        assert_equal(5, len(collection.get_children(filters=where('!shape:round'))))
+
+def test_get_children_matches_indexed_collection():
+    rng = random.Random(1)
+    documents = dict(
+        ('doc{0:03d}'.format(i), {
+            'color': rng.choice(['red', 'green', None]),
+            'price': rng.choice([None, 1, 2, 3, 4]),
+        })
+        for i in range(100))
+    reference = IndexedCollectionResource(documents)
+    with Database(documents) as collection:
+        for src in [None, 'color:red', 'price>2|!color:green', 'color^=gr',
+                    'price in [1,null]', 'price in 2..3', '!price:null']:
+            filters = None if src is None else where(src)
+            for order in [None, ((True, 'price'),), ((False, 'color'), (True, 'price'))]:
+                for offset, count in [(0, 20), (10, 7), (95, 20)]:
+                    expected = names(reference.get_children(
+                        offset=offset, count=count, filters=filters, order=order))
+                    actual = names(collection.get_children(
+                        offset=offset, count=count, filters=filters, order=order))
+                    assert_equal(expected, actual, (src, order, offset))
+
+def test_get_children_cursor():
+    rng = random.Random(2)
+    documents = dict(
+        ('doc{0:03d}'.format(i), {
+            'color': rng.choice(['red', 'green', None]),
+            'price': rng.choice([None, 1, 2, 3]),
+        })
+        for i in range(60))
+    with Database(documents) as collection:
+        for order in [None, ((True, 'price'),), ((False, 'color'), (True, 'price'))]:
+            expected = names(collection.get_children(count=100, order=order))
+            actual = []
+            cursor = None
+            while True:
+                page = names(collection.get_children(
+                    count=7, order=order, cursor=cursor))
+                if not page:
+                    break
+                actual.extend(page)
+                cursor = page[-1]
+            assert_equal(expected, actual, order)
+
+def test_serve_cursor():
+    with Database() as collection:
+        application = serve_resource(collection)
+        response = mock_request(
+            application, 'GET', '/',
+            query='cursor=banana&count=2',
+            headers=[('Accept', 'application/json')])
+        body = parse_json_body(response)['body']
+        expected = ['cherry', 'date']
+        actual = [child['name'] for child in body['_items']]
+        assert_equal(expected, actual)
+
+def test_get_children_unknown_cursor():
+    with Database() as collection:
+        assert_equal([], collection.get_children(cursor='nope'))
+
+def test_get_child():
+    with Database() as collection:
+        expected = {'name': 'apple', 'color': 'red', 'price': 3}
+        actual = collection.get_child('apple').get_structured_body()
+        assert_equal(expected, actual)
+        assert_equal(None, collection.get_child('nope'))
+
+def test_connection_per_thread():
+    with Database() as collection:
+        connections = []
+        def worker():
+            connections.append(collection.pool.connection())
+            collection.pool.close()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        assert collection.pool.connection() is collection.pool.connection()
+        assert connections[0] is not collection.pool.connection()
+
+# write tests
+
+json_type = parse_mime_type('application/json')
+
+def test_store():
+    with Database() as collection:
+        collection.store(io.BytesIO(b'{"color": "green", "price": 2}'), 'fig', json_type)
+        collection.store(io.BytesIO(b'{"color": "green"}'), 'apple', json_type)
+        expected = ['apple', 'fig']
+        actual = names(collection.get_children(filters=where('color:green')))
+        assert_equal(expected, actual)
+
+def test_store_unknown_column():
+    with Database() as collection:
+        try:
+            collection.store(io.BytesIO(b'{"shape": "round"}'), 'fig', json_type)
+        except ResourceException as e:
+            assert_equal(ResourceException.reason_malformed, e.reason)
+            return
+        raise AssertionError("expected ResourceException")
+
+def test_store_nested_value():
+    with Database() as collection:
+        application = serve_resource(collection)
+        response = mock_request(application, 'PUT', '/apple',
+            headers=[('Content-Type', 'application/json')],
+            request_body='{"color": {"a": 1}}')
+        assert_equal('400 Malformed Input', response['status'])
+        outcomes = collection.store_many([
+            ('fig', {'color': 'green'}),
+            ('apple', {'color': ['red']}),
+        ])
+        assert_equal(ResourceException.reason_malformed, outcomes[1].reason)
+        assert collection.get_child('fig') is not None
+
+def test_constraint_failures():
+    with Database() as collection:
+        connection = collection.pool.connection()
+        with connection:
+            connection.execute('CREATE TABLE basket '
+                '(name TEXT PRIMARY KEY, fruit TEXT NOT NULL)')
+        baskets = SQLiteCollectionResource(collection.pool, 'basket')
+        outcomes = baskets.create_many(
+            [{'name': 'a', 'fruit': 'fig'}, {'name': 'b'},
+                {'name': 'a', 'fruit': 'pear'}])
+        assert_equal('a', outcomes[0][0])
+        assert_equal(ResourceException.reason_malformed, outcomes[1].reason)
+        assert_equal(ResourceException.reason_exists, outcomes[2].reason)
+
+def test_create_conflict():
+    with Database() as collection:
+        name, row = collection.create(io.BytesIO(b'{"color": "green"}'), json_type)
+        assert collection.get_child(name) is not None
+        try:
+            collection.create(io.BytesIO(b'{"name": "apple"}'), json_type)
+        except ResourceException as e:
+            assert_equal(ResourceException.reason_exists, e.reason)
+            return
+        raise AssertionError("expected ResourceException")
+
+def test_delete():
+    with Database() as collection:
+        collection.delete('apple')
+        assert_equal(None, collection.get_child('apple'))
+        try:
+            collection.delete('apple')
+        except ResourceException as e:
+            assert_equal(ResourceException.reason_does_not_exist, e.reason)
+            return
+        raise AssertionError("expected ResourceException")
+
+def test_get_children_digests():
+    with Database() as collection:
+        expected = [
+            ('cherry', {'name': 'cherry', 'color': 'red', 'price': 5}, False),
+            ('date', {'name': 'date', 'color': 'brown', 'price': 5}, False),
+        ]
+        actual = collection.get_children_digests(cursor='banana', count=2)
+        assert_equal(expected, actual)
+
+def test_store_many():
+    with Database() as collection:
+        outcomes = collection.store_many([
+            ('fig', {'color': 'green', 'price': 2}),
+            ('apple', {'shape': 'round'}),
+            ('apple', {'color': 'green'}),
+        ])
+        assert_equal(('fig', {'name': 'fig', 'color': 'green', 'price': 2}), outcomes[0])
+        assert_equal(ResourceException.reason_malformed, outcomes[1].reason)
+        expected = ['apple', 'fig']
+        actual = names(collection.get_children(filters=where('color:green')))
+        assert_equal(expected, actual)
+
+def test_create_many():
+    with Database() as collection:
+        outcomes = collection.create_many([{'color': 'green'}, {'name': 'apple'}])
+        assert collection.get_child(outcomes[0][0]) is not None
+        assert_equal(ResourceException.reason_exists, outcomes[1].reason)
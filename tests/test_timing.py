@@ -0,0 +1,74 @@
+from papi.timing import *
+from papi.serve import serve_resource
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request
+import re
+
+class ChildResource(object):
+    def get_structured_body(self, *args, **kwargs):
+        return {'color': 'red'}
+
+class RootResource(object):
+    def get_child(self, name):
+        return ChildResource() if name == 'apple' else None
+
+    def get_children(self, *args, **kwargs):
+        return [('apple', ChildResource())]
+
+# PhaseTimer tests
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    timer.add('route', 0.001)
+    timer.add('body', 0.002)
+    timer.add('route', 0.0005)
+    assert_equal([('route', 0.0015), ('body', 0.002)], timer.timings())
+    assert_equal('route;dur=1.500, body;dur=2.000', timer.server_timing())
+
+def test_timed():
+    timer = PhaseTimer()
+    assert_equal(3, timed({'timer': timer}, 'body', lambda x: x + 1, 2))
+    assert_equal(['body'], [phase for phase, duration in timer.timings()])
+    assert_equal(3, timed({'timer': None}, 'body', lambda x: x + 1, 2))
+
+# serve_resource() tests
+
+def test_server_timing_header():
+    application = serve_resource(RootResource(), server_timing=True)
+    response = mock_request(application, 'GET', '/',
+        headers=[('Accept', 'text/json')])
+    headers = dict(response['headers'])
+    phases = re.findall(r'(\w+);dur=', headers['Server-Timing'])
+    assert_equal(
+        ['parse', 'hateoas', 'children', 'digests', 'write', 'total'],
+        phases)
+
+def test_timing_callback():
+    calls = []
+    def callback(request, timings):
+        calls.append((request['path'], dict(timings)))
+    application = serve_resource(RootResource(), timing_callback=callback)
+    response = mock_request(application, 'GET', '/apple',
+        headers=[('Accept', 'text/json')])
+    assert 'Server-Timing' not in dict(response['headers'])
+    assert_equal(1, len(calls))
+    path, timings = calls[0]
+    assert_equal(('apple',), path)
+    assert_equal(
+        set(['parse', 'route', 'body', 'hateoas', 'write', 'total']),
+        set(timings))
+    assert timings['total'] >= timings['route'] + timings['body']
+
+def test_timing_not_found():
+    calls = []
+    application = serve_resource(RootResource(),
+        timing_callback=lambda request, timings: calls.append(dict(timings)))
+    response = mock_request(application, 'GET', '/nope')
+    assert_equal('404 Not Found', response['status'])
+    assert_equal(set(['parse', 'route', 'total']), set(calls[0]))
+
+def test_timing_disabled():
+    application = serve_resource(RootResource())
+    response = mock_request(application, 'GET', '/',
+        headers=[('Accept', 'text/json')])
+    assert 'Server-Timing' not in dict(response['headers'])
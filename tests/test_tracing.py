@@ -0,0 +1,166 @@
+from papi.tracing import *
+from papi.serve import serve_resource
+from papi.metrics import MetricsRegistry
+from tests.test_utils import assert_equal
+from tests.test_simulation import mock_request, parse_json_body, \
+    PathTreeResource, tree
+import time
+
+class ItemResource(object):
+    def __init__(self, value):
+        self.value = value
+
+    def get_structured_body(self, digest=False, **kwargs):
+        return {'value': self.value}
+
+class SlowResource(object):
+    def get_structured_body(self, **kwargs):
+        time.sleep(0.02)
+        return {}
+
+class ListResource(object):
+    def __init__(self, size):
+        self.items = [
+            ('item{0}'.format(i), ItemResource(i)) for i in range(size)]
+        self.items.append(('slow', SlowResource()))
+
+    def get_child(self, name):
+        return dict(self.items).get(name)
+
+    def get_children(self, offset=None, count=None, *args, **kwargs):
+        return self.items[:count or 5]
+
+class RootResource(object):
+    def __init__(self):
+        self.things = ListResource(5)
+
+    def get_child(self, name):
+        if name == 'things':
+            return self.things
+        if name == 'again':
+            # looks up a child of a proxied resource, from inside a call
+            things = self.traced_self.get_child('things')
+            things.get_child('item1')
+            return things.get_child('item1')
+
+def traced_application(**kwargs):
+    traces = []
+    root = RootResource()
+    tracer = Tracer(
+        callback=lambda request, trace: traces.append(trace), **kwargs)
+    return serve_resource(root, api_middleware=tracer), root, traces
+
+def get(application, path, query='hateoas=off'):
+    return mock_request(application, 'GET', path, query,
+        headers=[('Accept', 'application/json')])
+
+def patterns(trace):
+    return [
+        (finding['pattern'], finding['path'])
+        for finding in trace.findings
+    ]
+
+def test_proxy_is_transparent():
+    trace = Trace()
+    proxy = TracingProxy(ItemResource(1), trace)
+    assert isinstance(proxy, ItemResource)
+    assert_equal('ItemResource', proxy.__class__.__name__)
+    assert not hasattr(proxy, 'get_children')
+    assert_equal(1, proxy.value)
+    assert_equal({'value': 1}, proxy.get_structured_body())
+    assert_equal(['get_structured_body'],
+        [call.method for call in trace.walk()])
+
+def test_call_tree():
+    application, root, traces = traced_application()
+    response = get(application, '/things/item2')
+    assert_equal('200 OK', response['status'])
+    trace = traces[0]
+    assert_equal(
+        [
+            ((), 'RootResource', 'get_child'),
+            (('things',), 'ListResource', 'get_child'),
+            (('things', 'item2'), 'ItemResource', 'get_structured_body'),
+        ],
+        [
+            (call.path, call.resource_class, call.method)
+            for call in trace.walk()
+            if call.method != 'get_response_writers'
+        ])
+    assert_equal([], trace.findings)
+    assert "/things ListResource.get_child('item2')" in trace.format()
+
+def test_nested_calls():
+    root = RootResource()
+    nested = Trace()
+    root.traced_self = TracingProxy(root, nested)
+    root.traced_self.get_child('again')
+    outer = nested.calls[-1]
+    assert_equal('again', outer.args[0])
+    assert_equal(
+        ['get_child', 'get_child', 'get_child'],
+        [call.method for call in outer.calls])
+    findings = find_repeated_get_child(nested)
+    assert_equal(
+        [('repeated_get_child', '/things/item1', 2)],
+        [(f['pattern'], f['path'], f['count']) for f in findings])
+
+def test_n_plus_one_and_slow_calls():
+    application, root, traces = traced_application(
+        header='X-Papi-Trace', slow_call_threshold=0.01)
+    response = parse_json_body(get(application, '/things', 'count=6'))
+    assert_equal(6, len(response['body']['_items']))
+    trace = traces[0]
+    assert_equal(
+        [
+            ('n_plus_one_digests', '/things'),
+            ('slow_call', '/things/slow'),
+        ],
+        patterns(trace))
+    assert_equal(6, trace.findings[0]['count'])
+    header = dict(response['headers'])['X-Papi-Trace']
+    assert 'n_plus_one_digests=/things:6' in header
+    assert 'slow_call=/things/slow:1' in header
+
+def test_thresholds():
+    application, root, traces = traced_application(
+        n_plus_one_threshold=10, slow_call_threshold=None)
+    get(application, '/things', 'count=6')
+    assert_equal([], traces[0].findings)
+
+def test_not_found_is_traced():
+    application, root, traces = traced_application()
+    response = get(application, '/nope')
+    assert_equal('404 Not Found', response['status'])
+    assert_equal(['get_child'], [call.method for call in traces[0].walk()])
+
+def test_resolve_path():
+    traces = []
+    application = serve_resource(
+        PathTreeResource(tree, [], depth=3),
+        api_middleware=Tracer(lambda request, trace: traces.append(trace)))
+    response = get(application, '/a/b/c/d')
+    assert_equal('200 OK', response['status'])
+    assert_equal(
+        [
+            ((), 'resolve_path'),
+            (('a', 'b', 'c'), 'resolve_path'),
+            (('a', 'b', 'c', 'd'), 'get_structured_body'),
+        ],
+        [
+            (call.path, call.method) for call in traces[0].walk()
+            if call.method != 'get_response_writers'
+        ])
+
+def test_metrics_see_resource_classes():
+    metrics = MetricsRegistry()
+    application = serve_resource(RootResource(),
+        api_middleware=Tracer(), metrics=metrics)
+    get(application, '/things/item1')
+    routes = [
+        labels['route']
+        for family in metrics.collect()
+        for name, labels, value in family['samples']
+        if name == 'papi_requests_total'
+    ]
+    assert_equal(['/{ListResource}/{ItemResource}'], routes)